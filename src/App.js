@@ -8,7 +8,14 @@ import Lobby from './webpages/Lobby';
 import GamePage from './webpages/Game';
 
 
-const socket = io('http://localhost:5000')
+// websocket only: with several server workers on one port, long-polling requests could reach different workers
+const socket = io('http://localhost:5000', { transports: ['websocket'] })
+// the server may send the events of one tick together, as a batch of [event, data]
+socket.on('batch', (messages) => {
+  for (const [event, data] of messages) {
+    socket.listeners(event).forEach((listener) => listener(data));
+  }
+});
 const generateUUID = () => {
   let playerUUID = sessionStorage.getItem('playerId');
   if (!playerUUID) {
@@ -0,0 +1,97 @@
+"""
+Hints for the dice to keep: the expected score of every open scoring for each of the
+32 holds of the current dice, if the player keeps the held dice and then plays the
+rest of the turn for that scoring.
+
+The values come from the keep-to-dice transition probabilities of app.Reroll,
+computed once at import: with one or two rolls left, the expected score of each
+scoring after every keep multiset. A hint is then 32 lookups, and the hints of a
+(dice multiset, rolls left, open scorings) are kept in a bounded LRU cache.
+"""
+
+from functools import lru_cache
+
+from app.Scoring import CATEGORIES, N_CATEGORIES, N_DICE_MULTISETS, SCORE_TABLE, get_dice_id
+from app.Reroll import HOLD_KEEP, N_HOLDS, REROLL_OUTCOMES
+
+
+MAX_ROLLS = 3
+# number of (dice multiset, rolls left, open scorings) hints kept in memory
+ADVICE_CACHE_SIZE = 65536
+# HOLD_ROLLED[hold] - the dice rolled again with a hold, as indexes in the sorted dice, see app.Reroll.get_reroll_index
+HOLD_ROLLED = tuple(tuple(i for i in range(5) if not hold >> i & 1) for hold in range(N_HOLDS))
+
+
+def _get_keep_values(dice_values):
+    """
+    Expected value of each scoring after re-rolling the dice not kept
+    Parameters:
+        dice_values: value of each scoring for every dice id, after the roll
+    return:
+        a tuple with the N_CATEGORIES expected values for every keep id
+    """
+    keep_values = []
+    for outcomes in REROLL_OUTCOMES:
+        values = [0.0] * N_CATEGORIES
+        for dice_id, probability in outcomes:
+            for c, value in enumerate(dice_values[dice_id]):
+                values[c] += probability * value
+        keep_values.append(tuple(values))
+    return tuple(keep_values)
+
+
+def _get_best_values(keep_values):
+    """
+    Value of each scoring for every dice id, keeping the best hold for each scoring
+    """
+    return tuple(
+        tuple(max(keep_values[keep_id][c] for keep_id in set(HOLD_KEEP[dice_id])) for c in range(N_CATEGORIES))
+        for dice_id in range(N_DICE_MULTISETS)
+    )
+
+
+def _build_keep_values():
+    # KEEP_VALUES[rolls_left - 1][keep_id][c]: with the last roll, the score of the dice; with two, the best of the last roll
+    last_roll = _get_keep_values(SCORE_TABLE)
+    return last_roll, _get_keep_values(_get_best_values(last_roll))
+
+
+KEEP_VALUES = _build_keep_values()
+
+
+@lru_cache(maxsize=ADVICE_CACHE_SIZE)
+def get_hold_values(dice_id, rolls_left, open_mask):
+    """
+    The expected score of each open scoring for the 32 holds on a dice multiset
+    Parameters:
+        rolls_left: 1 or 2
+        open_mask: bitmask of the scorings not filled yet, bit i for CATEGORIES[i]
+    return:
+        a tuple of N_HOLDS dicts {key: expected score}, indexed by the hold on the sorted dice
+    """
+    keep_values = KEEP_VALUES[rolls_left - 1]
+    open_keys = [c for c in range(N_CATEGORIES) if open_mask >> c & 1]
+    return tuple(
+        {CATEGORIES[c]: round(keep_values[keep_id][c], 2) for c in open_keys}
+        for keep_id in HOLD_KEEP[dice_id]
+    )
+
+
+def get_advice(dice, i_roll, filled):
+    """
+    Hints for the next roll of the active player
+    Parameters:
+        dice: the 5 dice of the game
+        i_roll: number of rolls made in this turn, 1 or 2
+        filled: bitmask of the filled scorings of the player
+    return:
+        [{'index': [int, ], 'scores': {key: expected score}}, ] for the 32 holds,
+        index is the list of dice to roll, as sent with the roll event
+    """
+    if i_roll < 1 or i_roll >= MAX_ROLLS:
+        raise ValueError('Hints are only given after the first or the second roll.')
+    hold_values = get_hold_values(get_dice_id(dice), MAX_ROLLS - i_roll, ~filled & ((1 << N_CATEGORIES) - 1))
+    order = sorted(range(5), key=dice.__getitem__)
+    return [
+        {'index': [order[i] for i in HOLD_ROLLED[hold]], 'scores': hold_values[hold]} for hold in range(N_HOLDS)
+    ]
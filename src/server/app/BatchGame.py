@@ -0,0 +1,241 @@
+"""
+Vectorized engine that plays many games at once with NumPy, following the rules of Game.
+
+Usage (from src/server):
+    python -m app.BatchGame [n_games] [greedy|table]
+"""
+
+import sys
+import time
+from itertools import product
+
+import numpy as np
+
+from app.Scoring import (
+    SCORE_TABLE, DICE_ID, DICE_COUNTS, N_CATEGORIES, N_DICE_MULTISETS, N_UPPER, UPPER_BONUS, UPPER_BONUS_THRESHOLD
+)
+from app.Reroll import N_HOLDS, get_reroll_index
+from app.Bot import BOT_TABLE_PATH, BotTable, N_STAGES, FILL_STAGE, N_UPPER_TOTALS
+
+
+N_ROUNDS = 13
+MAX_SCORE = 375
+
+# scores of all 13 scorings for every dice id, and the dice id of every dice code
+# the dice code of 5 dice is the base-6 number of (die - 1)
+SCORE_ARRAY = np.array(SCORE_TABLE, dtype=np.int16)
+DICE_ID_ARRAY = np.zeros(6 ** 5, dtype=np.int16)
+for _dice, _dice_id in DICE_ID.items():
+    DICE_ID_ARRAY[sum((d - 1) * 6 ** (4 - i) for i, d in enumerate(_dice))] = _dice_id
+DICE_CODE_WEIGHTS = np.array([6 ** 4, 6 ** 3, 6 ** 2, 6, 1], dtype=np.int32)
+
+
+class BatchGame:
+    """
+    N games held as arrays. All games move in lockstep: the same round and
+    active player, only the number of rolls differs from game to game.
+    """
+    def __init__(self, n_games, n_player=2, seed=None):
+        self.n_games = n_games
+        self.n_player = n_player
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(n_games)
+
+        # the score -1 means 'not filled yet', same as Game
+        self.scores = np.full((n_games, n_player, N_CATEGORIES), -1, dtype=np.int16)
+        self.filled = np.zeros((n_games, n_player), dtype=np.int32)
+        self.upper_sec_total = np.zeros((n_games, n_player), dtype=np.int16)
+        self.bonus = np.zeros((n_games, n_player), dtype=np.int16)
+        self.total = np.zeros((n_games, n_player), dtype=np.int16)
+
+        self.dice = np.full((n_games, 5), -1, dtype=np.int8)
+        self.dice_code = np.zeros(n_games, dtype=np.int32)
+        self.dice_id = np.zeros(n_games, dtype=np.int16)
+
+        self.round = np.ones(n_games, dtype=np.int8)
+        self.active_player = np.zeros(n_games, dtype=np.int8)
+        self.i_roll = np.zeros(n_games, dtype=np.int8)
+
+    def roll(self, reroll):
+        """
+        Roll the dice of all games at once
+        reroll - boolean array (N, 5), the dice to roll in each game
+                 a game only counts a roll if at least one die is rolled
+        """
+        new_dice = self.rng.integers(1, 7, size=self.dice.shape, dtype=np.int8)
+        np.copyto(self.dice, new_dice, where=reroll)
+        self.i_roll += reroll.any(axis=1)
+        self.dice_code = (self.dice - 1).astype(np.int32) @ DICE_CODE_WEIGHTS
+        self.dice_id = DICE_ID_ARRAY[self.dice_code]
+
+    def get_score_rows(self):
+        """
+        Return the scores of all 13 scorings for the current dice of each game, shape (N, 13)
+        """
+        return SCORE_ARRAY[self.dice_id]
+
+    def get_active_player(self):
+        """
+        Return the index of the active player, the same in all games
+        """
+        return int(self.active_player[0])
+
+    def get_open(self):
+        """
+        Return a boolean array (N, 13), true for scorings the active player has not filled
+        """
+        return self.scores[:, self.get_active_player()] == -1
+
+    def fill(self, keys):
+        """
+        Fill one scoring for the active player of each game
+        keys - integer array (N,), the category index of each game
+        return:
+            boolean array of whether each game continues, same as Game.fill
+        """
+        player = self.get_active_player()
+        sheet = self.scores[:, player]
+        if (sheet[self.games, keys] != -1).any():
+            raise ValueError("This scoring has already been occupied. Client must choose available scoring.")
+        score = SCORE_ARRAY[self.dice_id, keys]
+        sheet[self.games, keys] = score
+        self.filled[:, player] |= 1 << keys.astype(np.int32)
+        self.update_total(player, score, keys < N_UPPER)
+        return self.hand_over()
+
+    def update_total(self, player, score, is_upper):
+        """
+        Update the bonus and total score of the player after filling score, as Game.update_total
+        """
+        upper_sec_total = self.upper_sec_total[:, player]
+        bonus = self.bonus[:, player]
+        self.total[:, player] += score - bonus
+        upper_sec_total += np.where(is_upper, score, 0).astype(np.int16)
+        bonus[:] = np.where(upper_sec_total >= UPPER_BONUS_THRESHOLD, UPPER_BONUS, 0)
+        self.total[:, player] += bonus
+
+    def hand_over(self):
+        """
+        Hand over all games to the next player, as Game.hand_over
+        """
+        self.i_roll[:] = 0
+        last_player = self.active_player == self.n_player - 1
+        not_over = ~last_player | (self.round < N_ROUNDS)
+        self.round += last_player & not_over
+        self.active_player = np.where(last_player, 0, self.active_player + 1).astype(np.int8)
+        return not_over
+
+    def play(self, policy):
+        """
+        Play all games to the end with a vectorized policy
+        policy - an object with
+            choose_reroll(batch) -> boolean array (N, 5), no die rolled means fill now
+            choose_key(batch) -> integer array (N,) of open category indices
+        return:
+            the final total scores, shape (N, n_player)
+        """
+        game_not_over = np.ones(self.n_games, dtype=bool)
+        while game_not_over.all():
+            self.roll(np.ones(self.dice.shape, dtype=bool))
+            for _ in range(2):
+                reroll = policy.choose_reroll(self)
+                if not reroll.any():
+                    break
+                self.roll(reroll)
+            game_not_over = self.fill(policy.choose_key(self))
+        return self.total
+
+    def get_winner(self):
+        """
+        Return the winner of every game: 0 - tie, 1 - Player 1 wins, 2 - Player 2 wins
+        """
+        return np.where(self.total[:, 0] > self.total[:, 1], 1, np.where(self.total[:, 1] > self.total[:, 0], 2, 0))
+
+
+class GreedyPolicy:
+    """
+    Keep the most common face (the higher one on a tie) and fill the open scoring with the highest score
+    """
+    def __init__(self):
+        # the face to keep for every dice id
+        self.keep_face = np.array(
+            [max(range(6), key=lambda face: (counts[face], face)) + 1 for counts in DICE_COUNTS], dtype=np.int8
+        )
+
+    def choose_reroll(self, batch):
+        return batch.dice != self.keep_face[batch.dice_id][:, None]
+
+    def choose_key(self, batch):
+        scores = np.where(batch.get_open(), batch.get_score_rows(), -1)
+        return scores.argmax(axis=1)
+
+
+class TablePolicy:
+    """
+    The optimal solitaire strategy from the bot table, looked up for all games at once
+    in arrays over the memory map of app.Bot.BotTable
+    """
+    def __init__(self, path=BOT_TABLE_PATH):
+        self.table = BotTable(path)
+        self.index = np.frombuffer(self.table.index, dtype=np.int32)
+        self.policy = np.frombuffer(self.table.policy, dtype=np.uint8).reshape(
+            self.table.n_rows, N_STAGES, N_DICE_MULTISETS
+        )
+
+        # hold_reroll[dice_code, hold] - bitmask of the dice positions to roll for a hold on the sorted dice
+        self.hold_reroll = np.zeros((6 ** 5, N_HOLDS), dtype=np.uint8)
+        for dice in product(range(1, 7), repeat=5):
+            code = sum((d - 1) * 6 ** (4 - i) for i, d in enumerate(dice))
+            for hold in range(N_HOLDS):
+                self.hold_reroll[code, hold] = sum(1 << i for i in get_reroll_index(dice, hold))
+
+    def _lookup(self, batch, stage):
+        active = batch.active_player
+        mask = batch.filled[batch.games, active]
+        upper = np.minimum(batch.upper_sec_total[batch.games, active], UPPER_BONUS_THRESHOLD)
+        rows = self.index[mask * N_UPPER_TOTALS + upper]
+        return self.policy[rows, stage, batch.dice_id]
+
+    def choose_reroll(self, batch):
+        hold = self._lookup(batch, batch.i_roll - 1)
+        reroll = self.hold_reroll[batch.dice_code, hold]
+        return ((reroll[:, None] >> np.arange(5, dtype=np.uint8)) & 1).astype(bool)
+
+    def choose_key(self, batch):
+        return self._lookup(batch, FILL_STAGE).astype(np.int64)
+
+
+def simulate(n_games, policy, batch_size=1000000, seed=None):
+    """
+    Play n_games games in batches and collect the distribution of the final scores
+    return:
+        a dict with
+            'histogram' - number of player results for each total score from 0 to MAX_SCORE
+            'mean', 'std' - of the final score of one player
+            'wins' - number of ties, wins of player 1 and wins of player 2
+    """
+    rng = np.random.default_rng(seed)
+    histogram = np.zeros(MAX_SCORE + 1, dtype=np.int64)
+    wins = np.zeros(3, dtype=np.int64)
+    played = 0
+    while played < n_games:
+        n = min(batch_size, n_games - played)
+        batch = BatchGame(n, seed=rng.integers(1 << 63))
+        totals = batch.play(policy)
+        histogram += np.bincount(totals.reshape(-1), minlength=MAX_SCORE + 1)
+        wins += np.bincount(batch.get_winner(), minlength=3)
+        played += n
+    scores = np.arange(MAX_SCORE + 1)
+    mean = (histogram * scores).sum() / histogram.sum()
+    std = np.sqrt((histogram * (scores - mean) ** 2).sum() / histogram.sum())
+    return {'histogram': histogram, 'mean': mean, 'std': std, 'wins': wins}
+
+
+if __name__ == '__main__':
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    policy = TablePolicy() if len(sys.argv) > 2 and sys.argv[2] == 'table' else GreedyPolicy()
+    start_time = time.time()
+    result = simulate(n_games, policy)
+    print('%d games in %.2fs' % (n_games, time.time() - start_time))
+    print('Score: mean %.2f, std %.2f' % (result['mean'], result['std']))
+    print('Tie / player 1 wins / player 2 wins: %d / %d / %d' % tuple(result['wins']))
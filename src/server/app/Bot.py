@@ -0,0 +1,110 @@
+import mmap
+import os
+import struct
+
+from app.Scoring import CATEGORIES, N_CATEGORIES, N_DICE_MULTISETS, UPPER_BONUS_THRESHOLD, get_dice_id
+from app.Reroll import HOLD_ALL, get_reroll_index
+
+
+BOT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'bot_table.bin')
+
+# layout of the bot table file, all little-endian:
+#   header   - magic, format version, n_states, n_dice, n_rows, padded to HEADER_SIZE bytes
+#   index    - int32[n_states], row of the policy for each state, -1 if the state is unreachable
+#   ev       - float32[n_states], expected score of the rest of the game from each state
+#   policy   - uint8[n_rows][N_STAGES][n_dice]
+#              stage 0 / 1: the hold after the first / second roll, HOLD_ALL means fill now
+#              stage 2: the category index to fill
+# a state is (filled-category bitmask, upper section subtotal capped at 63): mask * N_UPPER_TOTALS + upper
+TABLE_MAGIC = b'YTZB'
+TABLE_VERSION = 1
+HEADER_FORMAT = '<4sIIII'
+HEADER_SIZE = 32
+N_MASKS = 1 << N_CATEGORIES
+FULL_MASK = N_MASKS - 1
+N_UPPER_TOTALS = UPPER_BONUS_THRESHOLD + 1
+N_STATES = N_MASKS * N_UPPER_TOTALS
+N_STAGES = 3
+FILL_STAGE = 2
+
+# the levels of the bot, from the fastest to the strongest, see app.BotPool
+BOT_LEVELS = ('greedy', 'montecarlo', 'optimal')
+
+
+def get_state(game, player_idx):
+    """
+    Return the (filled-category bitmask, capped upper section subtotal) of one player
+    """
+    return game.filled[player_idx], min(game.upper_sec_total[player_idx], UPPER_BONUS_THRESHOLD)
+
+
+class BotTable:
+    """
+    The precomputed optimal solitaire strategy, memory-mapped read-only
+    so all server processes share the same pages
+    """
+    def __init__(self, path=BOT_TABLE_PATH):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_states, n_dice, n_rows = struct.unpack_from(HEADER_FORMAT, self.mmap)
+        if magic != TABLE_MAGIC or version != TABLE_VERSION:
+            raise ValueError('Unsupported bot table file: ' + path)
+        if n_states != N_STATES or n_dice != N_DICE_MULTISETS:
+            raise ValueError('The bot table does not match the rules of this game.')
+
+        view = memoryview(self.mmap)
+        offset = HEADER_SIZE
+        self.index = view[offset:offset + 4 * n_states].cast('i')
+        offset += 4 * n_states
+        self.ev = view[offset:offset + 4 * n_states].cast('f')
+        offset += 4 * n_states
+        self.policy = view[offset:offset + n_rows * N_STAGES * n_dice]
+        self.n_rows = n_rows
+
+    def get_expected_score(self, mask, upper):
+        """
+        Return the expected score of the rest of the game under the optimal strategy
+        """
+        return self.ev[mask * N_UPPER_TOTALS + upper]
+
+    def _lookup(self, mask, upper, stage, dice_id):
+        row = self.index[mask * N_UPPER_TOTALS + upper]
+        if row < 0:
+            raise ValueError('The state is unreachable in this game.')
+        return self.policy[(row * N_STAGES + stage) * N_DICE_MULTISETS + dice_id]
+
+    def choose_reroll(self, mask, upper, i_roll, dice):
+        """
+        Choose the dice to roll again after the first or the second roll
+        return:
+            the list of dice index to roll, empty if the bot should fill a scoring now
+        """
+        if i_roll < 1 or i_roll >= N_STAGES:
+            raise ValueError('The bot can only re-roll after the first or the second roll.')
+        hold = self._lookup(mask, upper, i_roll - 1, get_dice_id(dice))
+        if hold == HOLD_ALL:
+            return []
+        return get_reroll_index(dice, hold)
+
+    def choose_key(self, mask, upper, dice):
+        """
+        Choose the scoring to fill with the dice
+        """
+        return CATEGORIES[self._lookup(mask, upper, FILL_STAGE, get_dice_id(dice))]
+
+    def close(self):
+        self.index.release()
+        self.ev.release()
+        self.policy.release()
+        self.mmap.close()
+
+
+def load_bot_table(path=BOT_TABLE_PATH):
+    """
+    Memory-map the bot table if it has been built
+    return:
+        a BotTable object, or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    return BotTable(path)
@@ -0,0 +1,332 @@
+"""
+The decisions of the bot, computed in a pool of worker processes so that a slow
+strategy never holds up the handlers of the other players.
+
+The bot plays at one of three levels:
+    greedy     - the hold with the best expected score this turn, then the best score,
+                 both measured against the par score of each scoring
+    montecarlo - the greedy move, unless rollouts of the greedy play show that one of
+                 the next best few moves is better, with as many rollouts as fit in the
+                 time budget of the move
+    optimal    - the precomputed optimal strategy of app.Bot, a full lookahead
+A decision is a move: ('roll', [dice index]) or ('fill', key).
+
+At most MAX_PENDING_PER_WORKER decisions wait for each worker. When the pool is full,
+or a decision is later than its budget, the bot makes the greedy move instead, which
+takes microseconds on the calling thread. Without workers, the bot makes the greedy
+move, or the optimal move looked up in the bot table, and never searches on the
+calling thread.
+
+The workers are spawned, not forked: the server already runs threads when it starts the
+pool, and fork is not available on every platform. A spawned worker imports the main
+module of the server again, which therefore must not load the state of the server when
+it is imported.
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from app.Scoring import (
+    CATEGORIES, N_CATEGORIES, N_UPPER, SCORE_TABLE, UPPER_BONUS, UPPER_BONUS_THRESHOLD, get_dice_id
+)
+from app.Reroll import HOLD_ALL, HOLD_KEEP, KEEP_MULTISETS, KEEP_NOTHING, REROLL_OUTCOMES, get_reroll_index
+from app.Advisor import KEEP_VALUES, MAX_ROLLS
+from app.Bot import BOT_LEVELS, FULL_MASK, load_bot_table
+
+
+# decisions waiting for each worker before the bot falls back to the greedy move
+MAX_PENDING_PER_WORKER = 8
+# moves compared by the rollouts of the Monte Carlo bot
+MONTE_CARLO_CANDIDATES = 6
+# the workers search at a lower priority than the server, which answers the players first
+WORKER_NICENESS = 10
+# interval of a worker checking that the server is still running, in seconds
+PARENT_CHECK_INTERVAL = 1
+# z of the 95% confidence margin a move needs to replace the greedy move
+Z_95 = 1.96
+# turns played by a rollout of the Monte Carlo bot, the rest of the game is counted at par
+ROLLOUT_TURNS = 2
+
+# the bot table of a worker process, loaded once by init_worker
+worker_table = None
+
+
+def _get_par_scores():
+    """
+    The score the greedy bot expects from each scoring: three of the face in the upper section,
+    which makes the bonus, and the mean score of a whole turn played for the scoring in the lower one
+    """
+    par = [3.0 * (c + 1) for c in range(N_UPPER)] + [0.0] * (N_CATEGORIES - N_UPPER)
+    for dice_id, probability in REROLL_OUTCOMES[KEEP_NOTHING]:
+        for c in range(N_UPPER, N_CATEGORIES):
+            par[c] += probability * max(KEEP_VALUES[1][keep_id][c] for keep_id in set(HOLD_KEEP[dice_id]))
+    return tuple(par)
+
+
+PAR_SCORES = _get_par_scores()
+
+
+def init_worker(parent_pid):
+    global worker_table
+    worker_table = load_bot_table()
+    if hasattr(os, 'nice'):
+        os.nice(WORKER_NICENESS)
+    # Ctrl-C stops the server, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=watch_parent, args=(parent_pid,), daemon=True).start()
+
+
+def watch_parent(parent_pid):
+    """
+    End the worker with the server, also when the server is killed without shutting the pool down
+    """
+    while os.getppid() == parent_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    os._exit(0)
+
+
+def get_greedy_hold(dice_id, rolls_left, mask):
+    """
+    The hold with the best expected score of one open scoring this turn, above its par score,
+    HOLD_ALL to fill now
+    """
+    keep_values = KEEP_VALUES[rolls_left - 1]
+    open_keys = [c for c in range(N_CATEGORIES) if not mask >> c & 1]
+    scores = SCORE_TABLE[dice_id]
+    best_hold, best_value = HOLD_ALL, max(scores[c] - PAR_SCORES[c] for c in open_keys)
+    for hold, keep_id in enumerate(HOLD_KEEP[dice_id]):
+        values = keep_values[keep_id]
+        value = max(values[c] - PAR_SCORES[c] for c in open_keys)
+        if value > best_value:
+            best_hold, best_value = hold, value
+    return best_hold
+
+
+def get_greedy_key(dice_id, mask):
+    """
+    The index of the open scoring with the best score above its par score
+    """
+    scores = SCORE_TABLE[dice_id]
+    return max((c for c in range(N_CATEGORIES) if not mask >> c & 1), key=lambda c: scores[c] - PAR_SCORES[c])
+
+
+def choose_greedy(mask, upper, i_roll, dice):
+    dice_id = get_dice_id(dice)
+    if i_roll < MAX_ROLLS:
+        idx = get_reroll_index(dice, get_greedy_hold(dice_id, MAX_ROLLS - i_roll, mask))
+        if idx:
+            return 'roll', idx
+    return 'fill', CATEGORIES[get_greedy_key(dice_id, mask)]
+
+
+def roll_dice(rng, kept):
+    return sorted(kept + tuple(int(rng.random() * 6) + 1 for _ in range(5 - len(kept))))
+
+
+def fill_value(mask, upper, dice_id, c):
+    """
+    Fill the scoring c
+    return: the new mask, the new upper section subtotal and the points scored, with the bonus
+    """
+    score = SCORE_TABLE[dice_id][c]
+    if c < N_UPPER:
+        new_upper = upper + score
+        if upper < UPPER_BONUS_THRESHOLD <= new_upper:
+            score += UPPER_BONUS
+        return mask | 1 << c, new_upper, score
+    return mask | 1 << c, upper, score
+
+
+def get_par_value(mask, upper):
+    """
+    The points the greedy bot expects from the open scorings: their par scores, and the bonus
+    if the upper section reaches it at par
+    """
+    value = 0.0
+    par_upper = upper
+    for c in range(N_CATEGORIES):
+        if not mask >> c & 1:
+            value += PAR_SCORES[c]
+            if c < N_UPPER:
+                par_upper += PAR_SCORES[c]
+    if upper < UPPER_BONUS_THRESHOLD <= par_upper:
+        value += UPPER_BONUS
+    return value
+
+
+def rollout(rng, mask, upper, rolls_left, dice, n_turns=ROLLOUT_TURNS):
+    """
+    Play the greedy strategy from the dice for n_turns turns, then count the rest of the game at par
+    return: the points scored, with the bonus, and the par value of the scorings left
+    """
+    points = 0
+    while mask != FULL_MASK:
+        dice_id = get_dice_id(dice)
+        while rolls_left:
+            hold = get_greedy_hold(dice_id, rolls_left, mask)
+            if hold == HOLD_ALL:
+                break
+            dice = roll_dice(rng, KEEP_MULTISETS[HOLD_KEEP[dice_id][hold]])
+            dice_id = get_dice_id(dice)
+            rolls_left -= 1
+        mask, upper, score = fill_value(mask, upper, dice_id, get_greedy_key(dice_id, mask))
+        points += score
+        n_turns -= 1
+        if not n_turns:
+            return points + get_par_value(mask, upper)
+        if mask != FULL_MASK:
+            dice = roll_dice(rng, ())
+            rolls_left = MAX_ROLLS - 1
+    return points
+
+
+def choose_montecarlo(mask, upper, i_roll, dice, budget, rng=random):
+    """
+    Compare the greedy move with the next best MONTE_CARLO_CANDIDATES - 1 moves by greedy rollouts
+    of ROLLOUT_TURNS turns, until the budget runs out. In each pass all the candidates roll the
+    same dice, so that they differ by the move and not by luck. Another move replaces the greedy
+    one only if it does better by more than the 95% confidence margin.
+    """
+    dice_id = get_dice_id(dice)
+    open_keys = [c for c in range(N_CATEGORIES) if not mask >> c & 1]
+    # (value this turn above par, move, function playing one rollout after the move with a random generator)
+    # fills first, so that the greedy move is the first one after sorting, as in get_greedy_hold
+    candidates = []
+    for c in open_keys:
+        def after_fill(dice_rng, c=c):
+            new_mask, new_upper, score = fill_value(mask, upper, dice_id, c)
+            if new_mask == FULL_MASK:
+                return score
+            return score + rollout(
+                dice_rng, new_mask, new_upper, MAX_ROLLS - 1, roll_dice(dice_rng, ()), ROLLOUT_TURNS - 1
+            )
+        candidates.append((SCORE_TABLE[dice_id][c] - PAR_SCORES[c], ('fill', CATEGORIES[c]), after_fill))
+    if i_roll < MAX_ROLLS:
+        keep_values = KEEP_VALUES[MAX_ROLLS - i_roll - 1]
+        holds = {}
+        for hold in range(HOLD_ALL):
+            holds.setdefault(HOLD_KEEP[dice_id][hold], hold)
+        for keep_id, hold in holds.items():
+            def after_roll(dice_rng, kept=KEEP_MULTISETS[keep_id]):
+                return rollout(dice_rng, mask, upper, MAX_ROLLS - 1 - i_roll, roll_dice(dice_rng, kept))
+            value = max(keep_values[keep_id][c] - PAR_SCORES[c] for c in open_keys)
+            candidates.append((value, ('roll', hold), after_roll))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    del candidates[MONTE_CARLO_CANDIDATES:]
+
+    # the sum and the sum of squares of the difference of every candidate with the greedy move, pass after pass
+    sums = [0.0] * len(candidates)
+    squares = [0.0] * len(candidates)
+    n_passes = 0
+    deadline = time.perf_counter() + budget
+    while n_passes < 2 or time.perf_counter() < deadline:
+        seed = rng.getrandbits(64)
+        greedy_value = candidates[0][2](random.Random(seed))
+        for i in range(1, len(candidates)):
+            difference = candidates[i][2](random.Random(seed)) - greedy_value
+            sums[i] += difference
+            squares[i] += difference * difference
+        n_passes += 1
+    best, best_margin = 0, 0.0
+    for i in range(1, len(candidates)):
+        mean = sums[i] / n_passes
+        variance = max(0.0, squares[i] / n_passes - mean * mean)
+        margin = mean - Z_95 * math.sqrt(variance / (n_passes - 1))
+        if margin > best_margin:
+            best, best_margin = i, margin
+    kind, arg = candidates[best][1]
+    if kind == 'roll':
+        return kind, get_reroll_index(dice, arg)
+    return kind, arg
+
+
+def choose_optimal(mask, upper, i_roll, dice, table):
+    capped = min(upper, UPPER_BONUS_THRESHOLD)
+    if i_roll < MAX_ROLLS:
+        idx = table.choose_reroll(mask, capped, i_roll, dice)
+        if idx:
+            return 'roll', idx
+    return 'fill', table.choose_key(mask, capped, dice)
+
+
+def decide(level, mask, upper, i_roll, dice, budget):
+    """
+    The next move of the bot after a roll, run in a worker
+    """
+    if level == 'montecarlo':
+        return choose_montecarlo(mask, upper, i_roll, dice, budget)
+    if level == 'optimal' and worker_table is not None:
+        return choose_optimal(mask, upper, i_roll, dice, worker_table)
+    return choose_greedy(mask, upper, i_roll, dice)
+
+
+class BotPool:
+    """
+    The worker processes of the bot, n_workers = 0 makes the moves that take no search on the calling thread
+    """
+    def __init__(self, n_workers, budget):
+        self.n_workers = n_workers
+        self.budget = budget
+        self.max_pending = n_workers * MAX_PENDING_PER_WORKER
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.executor = None
+        # the bot table of the optimal moves made without workers
+        self.table = None
+        if n_workers == 0:
+            self.table = load_bot_table()
+        else:
+            self.executor = ProcessPoolExecutor(
+                n_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker, initargs=(os.getpid(),)
+            )
+            # start all the workers now, so that the first moves do not wait for a worker to load the bot table
+            for future in [self.executor.submit(time.sleep, 0) for _ in range(n_workers)]:
+                future.result()
+
+    def __len__(self):
+        return self.pending
+
+    def submit(self, level, mask, upper, i_roll, dice):
+        """
+        Start deciding the next move of the bot
+        return: a Future of the move, already done with the greedy move when the pool is full,
+            or with the greedy or optimal move when there is no pool
+        """
+        with self.lock:
+            full = self.executor is None or self.pending >= self.max_pending
+            if not full:
+                self.pending += 1
+        if full:
+            future = Future()
+            if self.executor is None and level == 'optimal' and self.table is not None:
+                future.set_result(choose_optimal(mask, upper, i_roll, dice, self.table))
+            else:
+                future.set_result(choose_greedy(mask, upper, i_roll, dice))
+            return future
+        future = self.executor.submit(decide, level, mask, upper, i_roll, list(dice), self.budget)
+        future.add_done_callback(self.release)
+        return future
+
+    def release(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def get_move(self, future, mask, upper, i_roll, dice):
+        """
+        The move decided by the pool, or the greedy move if it is not ready or has failed
+        """
+        if future.done() and not future.cancelled() and future.exception() is None:
+            return future.result()
+        future.cancel()
+        return choose_greedy(mask, upper, i_roll, dice)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
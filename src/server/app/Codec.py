@@ -0,0 +1,124 @@
+"""
+The wire formats of the payloads sent to the clients.
+
+A client chooses its codec when it registers, {'playerId': pid, 'codec': 'msgpack'}, and keeps
+it for the session. Clients that do not ask get JSON, the payloads as they have always been.
+With MessagePack, the payloads of the hottest events, gameUpdate, enterNewGame and
+getPlayersOnlineResponse, are packed into bytes and sent as a binary attachment:
+    - the fields of a gameUpdate are integer ids, their index in FIELDS
+    - a scoring is its index in CATEGORIES
+    - a score sheet is an array of the 13 scores in the order of CATEGORIES, -1 for an open scoring
+    - the preview is an array of the 13 scores too, None for a filled scoring, empty before the first roll
+    - enterNewGame is [game_id, pid of the opponent, username of the opponent]
+    - getPlayersOnlineResponse is [pid, username, pid, username, ...]
+The other events are rare and are sent as JSON whatever the codec.
+The msgpack package is optional, without it every client gets JSON.
+
+The codec is server-side only: the web client does not ask for it and gets JSON. It is for
+clients that decode MessagePack themselves, like the simulated players of test/load_harness.py.
+"""
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from app.Scoring import CATEGORIES, CATEGORY_INDEX
+
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+# all codecs, a codec is stored as its index
+CODECS = (JSON, MSGPACK)
+
+# the fields of gameUpdate, sent as their index
+FIELDS = (
+    'version', 'dice', 'i_roll', 'round', 'active_player', 'score_active', 'score_inactive', 'preview',
+    'player', 'key', 'value', 'upper_sec_total', 'bonus', 'total'
+)
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+
+def negotiate(codec):
+    """
+    Return the codec of a client asking for codec, JSON if it is unknown or msgpack is not installed
+    """
+    if codec == MSGPACK and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+def pack_game_update(update):
+    packed = {}
+    for field, value in update.items():
+        if field in ('score_active', 'score_inactive'):
+            value = [value[key] for key in CATEGORIES]
+        elif field == 'preview':
+            value = [value.get(key) for key in CATEGORIES] if value else []
+        elif field == 'key':
+            value = CATEGORY_INDEX[value]
+        packed[FIELD_INDEX[field]] = value
+    return packed
+
+
+def unpack_game_update(packed):
+    update = {}
+    for i, value in packed.items():
+        field = FIELDS[i]
+        if field in ('score_active', 'score_inactive'):
+            value = dict(zip(CATEGORIES, value))
+        elif field == 'preview':
+            value = {key: score for key, score in zip(CATEGORIES, value) if score is not None}
+        elif field == 'key':
+            value = CATEGORIES[value]
+        update[field] = value
+    return update
+
+
+def pack_new_game(data):
+    return [data['game_id'], data['oppo_player']['pid'], data['oppo_player']['username']]
+
+
+def unpack_new_game(packed):
+    game_id, pid, username = packed
+    return {'game_id': game_id, 'oppo_player': {'pid': pid, 'username': username}}
+
+
+def pack_players(players):
+    packed = []
+    for player in players.values():
+        packed.append(player['pid'])
+        packed.append(player['username'])
+    return packed
+
+
+def unpack_players(packed):
+    return {pid: {'pid': pid, 'username': username} for pid, username in zip(packed[::2], packed[1::2])}
+
+
+# key: event
+# value: (pack, unpack) of its payload
+PACKERS = {
+    'gameUpdate': (pack_game_update, unpack_game_update),
+    'enterNewGame': (pack_new_game, unpack_new_game),
+    'getPlayersOnlineResponse': (pack_players, unpack_players),
+}
+
+
+def encode(codec, event, data):
+    """
+    Return the payload of an event as sent to a client with the codec,
+    the data itself for JSON and for the events without a packed form
+    """
+    if codec == JSON or event not in PACKERS:
+        return data
+    return msgpack.packb(PACKERS[event][0](data))
+
+
+def decode(event, payload):
+    """
+    Return the data of a payload received with the MessagePack codec, the reverse of encode
+    """
+    if not isinstance(payload, bytes):
+        return payload
+    return PACKERS[event][1](msgpack.unpackb(payload, strict_map_key=False))
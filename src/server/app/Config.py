@@ -0,0 +1,68 @@
+"""
+Server configuration, read from the environment with the defaults used in development.
+
+    YAHTZEE_SERVER_MODE   - 'threading' (Flask-SocketIO) or 'asyncio' (python-socketio under uvicorn)
+    YAHTZEE_HOST          - address to listen on
+    YAHTZEE_PORT          - port to listen on
+    YAHTZEE_CORS_ORIGIN   - origin of the web client
+    YAHTZEE_STATE_STORE   - 'memory', or 'sqlite:///<path>' to share the state between workers
+    YAHTZEE_MESSAGE_QUEUE - '', 'sqlite:///<path>' or 'redis://...' to pass emits between workers,
+                            with the SQLite state store, a database file next to it by default.
+                            It must not be the file of the state store: the emits of a handler
+                            would wait for the transaction of the same handler
+    YAHTZEE_WORKERS       - number of worker processes, more than one needs the asyncio mode,
+                            a shared state store and a message queue
+    YAHTZEE_EVENT_LOG     - directory of the write-ahead log of the games, '' for none.
+                            With it, the games of the in-memory store survive a restart
+    YAHTZEE_RECONNECT_GRACE - seconds a disconnected player keeps the game before it ends
+    YAHTZEE_GAME_IDLE_TIMEOUT - seconds without a move before a game is ended
+    YAHTZEE_LEADERBOARD   - path of the SQLite database of the ratings, shared by all workers
+    YAHTZEE_MAX_SPECTATORS - most spectators of one game, further watch requests are rejected
+    YAHTZEE_BOT_WORKERS   - number of processes deciding the moves of the bots, 0 for the greedy
+                            and table moves only, made in the server process
+    YAHTZEE_BOT_BUDGET    - seconds the Monte Carlo bot searches for one move
+    YAHTZEE_RATE_LIMIT    - scale of the per-session rate limits of the events, 0 to turn them off
+    YAHTZEE_EMIT_TICK     - milliseconds the emits are held to be sent together, 0 to send them at once.
+                            The clients have to unpack the 'batch' events, see app.Outbox
+"""
+
+import os
+
+
+SERVER_MODES = ('threading', 'asyncio')
+
+SERVER_MODE = os.environ.get('YAHTZEE_SERVER_MODE', 'threading')
+HOST = os.environ.get('YAHTZEE_HOST', '0.0.0.0')
+PORT = int(os.environ.get('YAHTZEE_PORT', '5000'))
+CORS_ORIGIN = os.environ.get('YAHTZEE_CORS_ORIGIN', 'http://localhost:3001')
+STATE_STORE = os.environ.get('YAHTZEE_STATE_STORE', 'memory')
+if STATE_STORE.startswith('sqlite:///'):
+    MESSAGE_QUEUE = os.environ.get('YAHTZEE_MESSAGE_QUEUE', '%s-queue%s' % os.path.splitext(STATE_STORE))
+else:
+    MESSAGE_QUEUE = os.environ.get('YAHTZEE_MESSAGE_QUEUE', '')
+WORKERS = int(os.environ.get('YAHTZEE_WORKERS', '1'))
+EVENT_LOG = os.environ.get('YAHTZEE_EVENT_LOG', '')
+RECONNECT_GRACE = float(os.environ.get('YAHTZEE_RECONNECT_GRACE', '30'))
+GAME_IDLE_TIMEOUT = float(os.environ.get('YAHTZEE_GAME_IDLE_TIMEOUT', '1800'))
+LEADERBOARD = os.environ.get(
+    'YAHTZEE_LEADERBOARD', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'leaderboard.db')
+)
+MAX_SPECTATORS = int(os.environ.get('YAHTZEE_MAX_SPECTATORS', '1000'))
+BOT_WORKERS = int(os.environ.get('YAHTZEE_BOT_WORKERS', '2'))
+BOT_BUDGET = float(os.environ.get('YAHTZEE_BOT_BUDGET', '0.5'))
+RATE_LIMIT = float(os.environ.get('YAHTZEE_RATE_LIMIT', '1'))
+# in seconds
+EMIT_TICK = float(os.environ.get('YAHTZEE_EMIT_TICK', '0')) / 1000
+
+if SERVER_MODE not in SERVER_MODES:
+    raise ValueError('YAHTZEE_SERVER_MODE must be one of: ' + ', '.join(SERVER_MODES))
+if WORKERS > 1:
+    if SERVER_MODE != 'asyncio':
+        raise ValueError('Multiple workers need YAHTZEE_SERVER_MODE=asyncio. '
+                         'Threaded servers can share the state on different ports behind a load balancer instead.')
+    if STATE_STORE == 'memory' or not MESSAGE_QUEUE:
+        raise ValueError('Multiple workers need a shared YAHTZEE_STATE_STORE and a YAHTZEE_MESSAGE_QUEUE.')
+if MESSAGE_QUEUE and MESSAGE_QUEUE == STATE_STORE:
+    raise ValueError('YAHTZEE_MESSAGE_QUEUE must not be the database of YAHTZEE_STATE_STORE.')
+if EVENT_LOG and STATE_STORE != 'memory':
+    raise ValueError('YAHTZEE_EVENT_LOG is for the in-memory store, the SQLite store keeps the games by itself.')
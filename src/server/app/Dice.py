@@ -0,0 +1,75 @@
+"""
+Seeded dice for the games: every game draws its dice from its own stream, so a game
+is played again die for die from its seed and its moves.
+
+The stream is SplitMix64 from the seed of the game. Each 64-bit output is read as 24
+base-6 digits, the faces of the next 24 dice, and kept until they are drawn.
+Outputs above the largest multiple of 6^24 are skipped, so every face is uniform.
+The position in the stream is the number of outputs used and the number of faces
+left from the last one, a few bytes to store with the game.
+"""
+
+import os
+
+
+MASK_64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+FACES_PER_BLOCK = 24
+BLOCK_RANGE = 6 ** FACES_PER_BLOCK
+# outputs at or above this are skipped, about one in four
+BLOCK_LIMIT = (1 << 64) // BLOCK_RANGE * BLOCK_RANGE
+
+
+def new_seed():
+    """
+    A random 64-bit seed for a new game
+    """
+    return int.from_bytes(os.urandom(8), 'little')
+
+
+def splitmix64(seed, i):
+    """
+    The output i of the SplitMix64 generator started at seed
+    """
+    z = (seed + (i + 1) * GOLDEN_GAMMA) & MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return z ^ (z >> 31)
+
+
+class DiceStream:
+    """
+    The dice of one game, drawn in order from its seed
+    """
+    __slots__ = ('seed', 'block', 'value', 'n_left')
+
+    def __init__(self, seed, block=0, n_left=0):
+        self.seed = seed
+        # number of outputs of the generator used so far, skipped ones included
+        self.block = block
+        # the faces of the last output not drawn yet, as base-6 digits, the next one lowest
+        self.n_left = n_left
+        self.value = splitmix64(seed, block - 1) % BLOCK_RANGE // 6 ** (FACES_PER_BLOCK - n_left) if n_left else 0
+
+    def get_position(self):
+        """
+        return: (block, n_left), to rebuild the stream with DiceStream(seed, block, n_left)
+        """
+        return self.block, self.n_left
+
+    def draw(self, n):
+        """
+        return: the next n faces of the stream
+        """
+        drawn = []
+        for _ in range(n):
+            while not self.n_left:
+                value = splitmix64(self.seed, self.block)
+                self.block += 1
+                if value < BLOCK_LIMIT:
+                    self.value = value % BLOCK_RANGE
+                    self.n_left = FACES_PER_BLOCK
+            self.value, digit = divmod(self.value, 6)
+            self.n_left -= 1
+            drawn.append(digit + 1)
+        return drawn
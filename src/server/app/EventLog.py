@@ -0,0 +1,267 @@
+"""
+Write-ahead log of the games, so that a restarted server picks up the games in play.
+
+Every change of a game is appended to the log before its update is sent:
+    CREATE - a new game with its players, in the compact record of app.Store
+    ROLL   - the index of the dice rolled, replayed from the seeded dice of the game
+    FILL   - the scoring filled by the active player
+    END    - the game is over or abandoned
+A writer thread commits the appended records in groups, one write and one fsync every
+COMMIT_INTERVAL, so a move never waits for the disk. A crash loses at most the moves
+of the last COMMIT_INTERVAL.
+
+The log is split in segments. When a segment is full the writer moves on to a new one
+and a compactor thread folds the full segments into a snapshot of the games in play,
+then deletes them. The snapshot is built from the files alone, not from the live games,
+so it is consistent without locking the handlers. At startup the games are rebuilt
+from the newest snapshot and the segments after it, and the snapshots left half-written
+by a crash are deleted.
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+from app.Scoring import CATEGORIES, CATEGORY_INDEX
+from app.Store import encode_game, decode_game
+
+
+# seconds between two group commits
+COMMIT_INTERVAL = 0.01
+# bytes of a segment before the writer moves on to the next one
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+# record types
+CREATE, ROLL, FILL, END = 1, 2, 3, 4
+
+# every record is its crc32 and length, then the body: the type and its data
+HEADER = struct.Struct('<IH')
+
+
+def frame(body):
+    return HEADER.pack(zlib.crc32(body), len(body)) + body
+
+
+def read_records(path):
+    """
+    Yield the bodies of the records in a file, up to the first torn or corrupt record
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        crc, length = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        body = data[offset:offset + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            # the tail of a write cut by a crash
+            return
+        yield body
+        offset += length
+
+
+def apply_record(games, body):
+    """
+    Replay one record on the games, a dict with game_id as key
+    """
+    kind = body[0]
+    if kind == CREATE:
+        game = decode_game(body[1:])
+        games[game.game_id] = game
+    elif kind == ROLL:
+        n = body[1]
+        game = games.get(body[2 + n:].decode('utf-8'))
+        if game is not None:
+            game.roll(list(body[2:2 + n]))
+    elif kind == FILL:
+        game = games.get(body[2:].decode('utf-8'))
+        if game is not None:
+            game.fill(CATEGORIES[body[1]])
+    elif kind == END:
+        games.pop(body[1:].decode('utf-8'), None)
+    else:
+        raise ValueError('Unknown record type in the event log: %d' % kind)
+
+
+class EventLog:
+    """
+    The log in one directory. Records are dropped until open() is called, so a
+    server without a log directory can call it all the same.
+    """
+    def __init__(self, directory, commit_interval=COMMIT_INTERVAL, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.segment_size = segment_size
+        self.file = None
+        self.segment = 0
+        # the records appended since the last commit, and the signal to the writer
+        self.pending = []
+        self.lock = threading.Lock()
+        self.has_pending = threading.Event()
+        # one commit or rotation at a time
+        self.write_lock = threading.Lock()
+        self.compacting = False
+        self.n_commits = 0
+
+    def segment_path(self, n):
+        return os.path.join(self.directory, 'events-%08d.log' % n)
+
+    def snapshot_path(self, n):
+        return os.path.join(self.directory, 'snapshot-%08d.bin' % n)
+
+    def list_files(self):
+        """
+        return: the number of the newest snapshot (0 for none), the numbers of all segments
+        """
+        snapshots = [0]
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot-') and name.endswith('.bin'):
+                snapshots.append(int(name[9:-4]))
+            elif name.startswith('events-') and name.endswith('.log'):
+                segments.append(int(name[7:-4]))
+        return max(snapshots), sorted(segments)
+
+    def remove_temporary_files(self):
+        """
+        Delete the snapshots left half-written by a crash during compaction, before recovery
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+
+    def load(self, before=None):
+        """
+        Rebuild the games from the newest snapshot and the segments after it
+        before - only replay the segments with a smaller number
+        return: the games in play, key game_id, and the number of the snapshot used
+        """
+        snapshot, segments = self.list_files()
+        games = {}
+        if snapshot:
+            # snapshot n holds the games after all segments before n
+            for body in read_records(self.snapshot_path(snapshot)):
+                apply_record(games, body)
+        for n in segments:
+            if n >= snapshot and (before is None or n < before):
+                for body in read_records(self.segment_path(n)):
+                    apply_record(games, body)
+        return games, snapshot
+
+    def open(self):
+        """
+        Rebuild the games in play, then start logging to a new segment
+        return: dict of the games, key game_id
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.remove_temporary_files()
+        games, snapshot = self.load()
+        _, segments = self.list_files()
+        self.segment = max([snapshot, 1] + [n + 1 for n in segments])
+        self.file = open(self.segment_path(self.segment), 'ab')
+        threading.Thread(target=self.run_writer, daemon=True).start()
+        if any(n >= snapshot for n in segments):
+            # the next start only has to read the snapshot
+            self.start_compaction()
+        return games
+
+    def close(self):
+        """
+        Commit the last records and stop logging
+        """
+        with self.write_lock:
+            if self.file is None:
+                return
+            self.commit()
+            self.file.close()
+            self.file = None
+
+    def append(self, body):
+        if self.file is None:
+            return
+        record = frame(body)
+        with self.lock:
+            self.pending.append(record)
+            self.has_pending.set()
+
+    def log_create(self, game):
+        self.append(bytes([CREATE]) + encode_game(game))
+
+    def log_roll(self, game, idx):
+        self.append(bytes([ROLL, len(idx)]) + bytes(idx) + game.game_id.encode('utf-8'))
+
+    def log_fill(self, game, key):
+        self.append(bytes([FILL, CATEGORY_INDEX[key]]) + game.game_id.encode('utf-8'))
+
+    def log_end(self, game):
+        self.append(bytes([END]) + game.game_id.encode('utf-8'))
+
+    def run_writer(self):
+        while True:
+            self.has_pending.wait()
+            # let the records of other moves join this group
+            time.sleep(self.commit_interval)
+            with self.write_lock:
+                if self.file is None:
+                    return
+                self.commit()
+                if self.file.tell() >= self.segment_size:
+                    self.rotate()
+
+    def commit(self):
+        """
+        Write all pending records with one write and one fsync, with write_lock held
+        """
+        with self.lock:
+            records, self.pending = self.pending, []
+            self.has_pending.clear()
+        if not records:
+            return
+        self.file.write(b''.join(records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.n_commits += 1
+
+    def rotate(self):
+        """
+        Move on to the next segment and fold the full ones into a snapshot
+        """
+        self.file.close()
+        self.segment += 1
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.start_compaction()
+
+    def start_compaction(self):
+        if not self.compacting:
+            self.compacting = True
+            threading.Thread(target=self.compact, args=(self.segment,), daemon=True).start()
+
+    def compact(self, upto):
+        """
+        Write the snapshot of the games after all segments before upto, then delete them
+        """
+        try:
+            games, old_snapshot = self.load(before=upto)
+            path = self.snapshot_path(upto)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(b''.join(frame(bytes([CREATE]) + encode_game(game)) for game in games.values()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            self.sync_directory()
+            if old_snapshot:
+                os.remove(self.snapshot_path(old_snapshot))
+            for n in self.list_files()[1]:
+                if n < upto:
+                    os.remove(self.segment_path(n))
+        finally:
+            self.compacting = False
+
+    def sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
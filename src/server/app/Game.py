@@ -1,6 +1,10 @@
-import random
 import uuid
+from array import array
 from app.Player import Player
+from app.Dice import DiceStream, new_seed
+from app.Scoring import (
+    SCORE_TABLE, CATEGORIES, CATEGORY_INDEX, N_CATEGORIES, N_UPPER, UPPER_BONUS, UPPER_BONUS_THRESHOLD, get_dice_id
+)
 
 
 UPPER_KEYS = {'1s', '2s', '3s', '4s', '5s', '6s'}
@@ -8,10 +12,27 @@ LOWER_KEYS = {'3-of-a-kind', '4-of-a-kind', 'full-house', 'small-straight', 'lar
 
 
 class Game:
-    def __init__(self, player_1, player_2):
+    # slots and array-backed score sheets keep each game small when there are many of them
+    __slots__ = (
+        'game_id', 'p1', 'p2', 'n_player', 'scores', 'filled', 'upper_sec_total', 'bonus', 'total',
+        'dice', 'dice_id', 'round', 'active_player', 'i_roll', 'version', 'seed', 'dice_stream',
+        'bot_level'
+    )
+
+    # the scoring table is shared by all games
+    score_table = SCORE_TABLE
+
+    def __init__(self, player_1, player_2, seed=None, bot_level=None):
         # unique game_id
         self.game_id = str(uuid.uuid4())
 
+        # level of the bot playing in this game, one of app.Bot.BOT_LEVELS, None between two players
+        self.bot_level = bot_level
+
+        # seed of the dice of this game, the game is played again from its seed and moves, see replay_game
+        self.seed = new_seed() if seed is None else seed
+        self.dice_stream = DiceStream(self.seed)
+
         # initialize the players
         if isinstance(player_1, Player):
             self.p1 = player_1
@@ -23,75 +44,51 @@ class Game:
             raise TypeError('TypeError: player 2 is not a Player object.')
 
         # initialize the score sheet
+        # scores - all 13 scorings of each player, in the order of CATEGORIES, player after player
         # the score -1 means 'not filled yet'
         # the score 0 means 'filled with zero' 
+        # filled - bitmask of the filled scorings of each player, bit i for CATEGORIES[i]
         self.n_player = 2
-        self.upper_sec = []
-        for _ in range(self.n_player):
-            self.upper_sec.append({
-                '1s' : -1,
-                '2s' : -1,
-                '3s' : -1,
-                '4s' : -1,
-                '5s' : -1,
-                '6s' : -1
-            })
-        self.upper_sec_total = self.n_player * [0]
-        self.bonus = self.n_player * [0]
-
-        self.lower_sec = []
-        for _ in range(self.n_player):
-            self.lower_sec.append({
-                '3-of-a-kind': -1,
-                '4-of-a-kind': -1,
-                'full-house' : -1,
-                'small-straight' : -1,
-                'large-straight' : -1,
-                'yahtzee' : -1,
-                'chance' : -1
-            })
-        self.total = self.n_player * [0]
+        self.scores = array('h', [-1]) * (self.n_player * N_CATEGORIES)
+        self.filled = array('H', [0]) * self.n_player
+        self.upper_sec_total = array('h', [0]) * self.n_player
+        self.bonus = array('h', [0]) * self.n_player
+        self.total = array('h', [0]) * self.n_player
 
         # initialize the dice
-        self.dice = 5 * [-1]
-        self.dice_count = {
-            '1': 0,
-            '2': 0,
-            '3': 0,
-            '4': 0,
-            '5': 0,
-            '6': 0
-        }
-        self.dice_sum = 0
-        self.calculators = {
-            '1s': self.calculate_1s,
-            '2s': self.calculate_2s,
-            '3s': self.calculate_3s,
-            '4s': self.calculate_4s,
-            '5s': self.calculate_5s,
-            '6s': self.calculate_6s,
-            '3-of-a-kind': self.calculate_3_of_a_kind,
-            '4-of-a-kind': self.calculate_4_of_a_kind,
-            'full-house': self.calculate_full_house,
-            'small-straight': self.calculate_small_straight,
-            'large-straight': self.calculate_large_staright,
-            'yahtzee': self.calculate_yahtzee,
-            'chance': self.calculate_chance
-        }
+        # dice_id - the id of the dice multiset in the scoring table, None before the first roll
+        self.dice = array('b', [-1]) * 5
+        self.dice_id = None
 
         # initialize the game info
         self.round = 1
         self.active_player = 0 # active player - 0 or 1
         self.i_roll = 0 # i_roll - 0, 1, or 2
 
+        # version of the game state, increased by every roll and fill
+        self.version = 0
+
     def get_game_id(self):
         return self.game_id
 
+    def get_seed(self):
+        return self.seed
+
+    def get_bot_level(self):
+        return self.bot_level
+
     def get_score(self, player_idx):
         """
         Return a dict with all 13 scorings and their values
         """
-        return {**self.upper_sec[player_idx], **self.lower_sec[player_idx]}
+        offset = player_idx * N_CATEGORIES
+        return dict(zip(CATEGORIES, self.scores[offset:offset + N_CATEGORIES]))
+
+    def get_key_score(self, player_idx, key):
+        """
+        Return the score of one scoring of a player, -1 if not filled yet
+        """
+        return self.scores[player_idx * N_CATEGORIES + CATEGORY_INDEX[key]]
 
     def get_active_player(self):
         return self.active_player
@@ -102,139 +99,90 @@ class Game:
     def get_i_roll(self):
         return self.i_roll
     
+    def get_version(self):
+        return self.version
+
     def get_dice(self):
-        return self.dice
+        return self.dice.tolist()
 
     def roll(self, idx):
         """
         roll the dice at specific index
         idx - the list of dice to roll, from 0 to 4
         """
+        dice = self.dice.tolist()
         for i in idx:
             if i < 0 or i > 4:
                 raise ValueError("Invalid index for dice. Only index from 0 to 4 is allowed.")
-            self.dice[i] = random.randint(1, 6)
+        for i, face in zip(idx, self.dice_stream.draw(len(idx))):
+            dice[i] = face
+        self.apply_roll(dice)
+
+    def apply_roll(self, dice):
+        """
+        Set the dice after a roll
+        dice - the 5 dice after the roll
+        """
+        self.dice = array('b', dice)
 
         # update the i_roll
         self.i_roll += 1
 
-        # update dice_count
-        for k in self.dice_count.keys():
-            self.dice_count[k] = 0
-
-        for num in self.dice:
-            self.dice_count[str(num)] += 1
-
-        # update dice_sum
-        self.dice_sum = sum(self.dice)
+        # update dice_id
+        self.dice_id = get_dice_id(self.dice)
+        self.version += 1
 
     def calculate_score(self, key):
         """
-        Choose the correct function in "calculators" according to the key to calculate the score
+        Look up the score of the key for the current dice in the scoring table
         """
-        return self.calculators[key]()
-
-    def calculate_1s(self):
-        return self.dice_count['1']
-
-    def calculate_2s(self):
-        return 2 * self.dice_count['2']
-
-    def calculate_3s(self):
-        return 3 * self.dice_count['3']
-
-    def calculate_4s(self):
-        return 4 * self.dice_count['4']
-
-    def calculate_5s(self):
-        return 5 * self.dice_count['5']
-
-    def calculate_6s(self):
-        return 6 * self.dice_count['6']
-
-    def calculate_3_of_a_kind(self):
-        for count in self.dice_count.values():
-            if count >= 3:
-                return self.dice_sum
-        return 0
-
-    def calculate_4_of_a_kind(self):
-        for count in self.dice_count.values():
-            if count >= 4:
-                return self.dice_sum
-        return 0
-
-    def calculate_full_house(self):
-        for count in self.dice_count.values():
-            if count == 3:
-                for pair_count in self.dice_count.values():
-                    if pair_count == 2:
-                        return 25
-        return 0
-
-    def calculate_small_straight(self):
-        if (self.dice_count['1'] >= 1) and (self.dice_count['2'] >= 1) and (self.dice_count['3'] >= 1) and (self.dice_count['4'] >= 1):
-            return 30
-        elif (self.dice_count['2'] >= 1) and (self.dice_count['3'] >= 1) and (self.dice_count['4'] >= 1) and (self.dice_count['5'] >= 1):
-            return 30
-        elif (self.dice_count['3'] >= 1) and (self.dice_count['4'] >= 1) and (self.dice_count['5'] >= 1) and (self.dice_count['6'] >= 1):
-            return 30
-        else:
-            return 0
-
-    def calculate_large_staright(self):
-        if (self.dice_count['1'] == 1) and (self.dice_count['2'] == 1) and (self.dice_count['3'] == 1) and (self.dice_count['4'] == 1) and (self.dice_count['5'] == 1):
-            return 40
-        elif (self.dice_count['2'] == 1) and (self.dice_count['3'] == 1) and (self.dice_count['4'] == 1) and (self.dice_count['5'] == 1) and (self.dice_count['6'] == 1):
-            return 40
-        else:
+        if self.dice_id is None:
             return 0
+        return self.score_table[self.dice_id][CATEGORY_INDEX[key]]
 
-    def calculate_yahtzee(self):
-        for count in self.dice_count.values():
-            if count == 5:
-                return 50
-        return 0
-
-    def calculate_chance(self):
-        return self.dice_sum
+    def get_preview(self):
+        """
+        Return the scores the active player would get for each open scoring with the current dice,
+        read from the row of the dice in the scoring table; empty before the first roll of the turn
+        """
+        if self.i_roll == 0 or self.dice_id is None:
+            return {}
+        filled = self.filled[self.active_player]
+        row = self.score_table[self.dice_id]
+        return {key: row[i] for i, key in enumerate(CATEGORIES) if not filled >> i & 1}
 
     def fill(self, key):
-        if key in UPPER_KEYS:
-            if self.upper_sec[self.active_player][key] == -1:
-                self.upper_sec[self.active_player][key] = self.calculate_score(key)
-            else:
+        if key not in CATEGORY_INDEX:
+            raise KeyError('Invalid input key encountered.')
+        i = CATEGORY_INDEX[key]
+        if self.filled[self.active_player] >> i & 1:
+            if key in UPPER_KEYS:
                 raise ValueError("This scoring has already been occupied. Client must choose available scoring.")
-        elif key in LOWER_KEYS:
-            if self.lower_sec[self.active_player][key] == -1:
-                self.lower_sec[self.active_player][key] = self.calculate_score(key)
             else:
                 raise ValueError("This scoring has already been occupied. You must choose another scoring.")
-        else:
-            raise KeyError('Invalid input key encountered.')
+        score = self.calculate_score(key)
+        self.scores[self.active_player * N_CATEGORIES + i] = score
+        self.filled[self.active_player] |= 1 << i
 
         # update the bonus and total score after update a term
-        self.update_total()
+        self.update_total(i, score)
+        self.version += 1
 
         # hand over to the next player
         # return true - game continue; false - game over and ready to decide the winner
         return self.hand_over()
     
-    def update_total(self):
+    def update_total(self, i, score):
         """
-        update the bonus and total score after update a term
+        update the bonus and total score after filling the scoring i with score
         """
-        sum_upper_sec = 0
-        for score_upper_sec in self.upper_sec[self.active_player].values():
-            sum_upper_sec += score_upper_sec
-        self.upper_sec_total[self.active_player] = sum_upper_sec
-        if self.upper_sec_total[self.active_player] >= 63:
-            self.bonus[self.active_player] = 35
-
-        sum_lower_sec = 0
-        for score_lower in self.lower_sec[self.active_player].values():
-            sum_lower_sec += score_lower
-        self.total[self.active_player] = sum_upper_sec + sum_lower_sec + self.bonus[self.active_player]
+        if i < N_UPPER:
+            self.upper_sec_total[self.active_player] += score
+            upper_total = self.upper_sec_total[self.active_player]
+            if upper_total >= UPPER_BONUS_THRESHOLD and self.bonus[self.active_player] == 0:
+                self.bonus[self.active_player] = UPPER_BONUS
+                self.total[self.active_player] += UPPER_BONUS
+        self.total[self.active_player] += score
 
     def hand_over(self):
         """
@@ -273,3 +221,19 @@ class Game:
             return 2
         else:
             return 0
+
+
+def replay_game(player_1, player_2, seed, moves):
+    """
+    Play a game again from its seed and its moves
+    moves - the moves in order: a list of dice index for a roll, a key for a fill
+    return:
+        the Game after the moves, with the same dice and scores as the original
+    """
+    game = Game(player_1, player_2, seed=seed)
+    for move in moves:
+        if isinstance(move, str):
+            game.fill(move)
+        else:
+            game.roll(move)
+    return game
@@ -0,0 +1,1349 @@
+"""
+The Socket.IO event handlers of the game server and the state they share.
+
+The handlers receive the session id of the client first, then the message, and
+talk to the clients only through the transport, see app.Transport.
+"""
+
+import atexit
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from app.Player import Player
+from app.Game import Game
+from app.Bot import BOT_LEVELS, load_bot_table
+from app.BotPool import BotPool
+from app.Store import open_store, player_key, game_key
+from app.EventLog import EventLog
+from app.Timers import TimerWheel
+from app.Leaderboard import Leaderboard
+from app.Advisor import get_advice
+from app.Metrics import metrics
+from app.RateLimit import RateLimiter
+from app.Outbox import Outbox
+from app.Scoring import CATEGORY_INDEX
+from app import Codec
+from app import Config
+
+
+# The Socket.IO server the handlers send through, set by the entry point with set_transport
+transport = None
+
+# All event handlers
+# key: event name
+# value: handler function, called with (sid, *args)
+EVENT_HANDLERS = {}
+
+
+def set_transport(new_transport):
+    global transport
+    if Config.EMIT_TICK > 0:
+        new_transport = Outbox(new_transport, Config.EMIT_TICK, URGENT_EVENTS, merge_updates)
+        metrics.add_gauge('yahtzee_outbox_messages', 'Messages waiting for the next tick of the outbox.', new_transport.__len__)
+    transport = new_transport
+    transport.register({
+        event: rate_limited(event, metrics.instrument(event, in_transaction(handler)))
+        for event, handler in EVENT_HANDLERS.items()
+    })
+
+
+def start_server():
+    """
+    Open the leaderboard, put the games of the event log back in play and start the bot pool,
+    called by the entry point when the server starts. Importing this module starts nothing.
+    """
+    open_leaderboard()
+    if Config.EVENT_LOG and event_log.file is None:
+        restore_games(event_log.open())
+        atexit.register(event_log.close)
+    start_bot_pool()
+
+
+def start_bot_pool():
+    """
+    Start the worker processes of the bots
+    """
+    global bot_pool
+    if Config.BOT_WORKERS > 0 and bot_pool.executor is None:
+        bot_pool = BotPool(Config.BOT_WORKERS, Config.BOT_BUDGET)
+        atexit.register(bot_pool.close)
+
+
+def open_leaderboard(path=None):
+    """
+    Open the database of the ratings, at YAHTZEE_LEADERBOARD unless a path is given
+    """
+    global leaderboard
+    if leaderboard is None:
+        leaderboard = Leaderboard(path or Config.LEADERBOARD)
+
+
+def on(event):
+    """
+    Register a function as the handler of an event, like @socketio.on
+    """
+    def decorator(handler):
+        EVENT_HANDLERS[event] = handler
+        return handler
+    return decorator
+
+
+def in_transaction(handler):
+    """
+    Run every call of the handler in one transaction of the store
+    """
+    def run(*args):
+        with store.transaction():
+            return handler(*args)
+    return run
+
+
+def rate_limited(event, handler):
+    """
+    Drop the events of a session over its rate limit, before they reach the store
+    """
+    def run(sid, *args):
+        if not rate_limiter.allow(sid, event):
+            metrics.count_dropped(event, 'rate_limited')
+            return None
+        return handler(sid, *args)
+    return run
+
+
+def start_task(task, *args):
+    """
+    Start a background task, each of its steps runs in one transaction of the store
+    """
+    def run():
+        steps = task(*args)
+        while True:
+            with store.transaction():
+                delay = next(steps, None)
+            if delay is None:
+                return
+            yield delay
+    transport.start_task(run)
+
+
+# The most events a session may send, per event: (tokens per second, burst), scaled by YAHTZEE_RATE_LIMIT
+# The events not listed share the 'default' bucket of the session, the events limited to None are never dropped
+RATE_LIMITS = {
+    'connect': None,
+    'disconnect': None,
+    'roll': (4, 8),
+    'fill': (4, 8),
+    'get_advice': (4, 8),
+    'send_invite': (1, 5),
+    'accept_invite': (1, 5),
+    'decline_invite': (2, 10),
+    'default': (10, 30),
+}
+
+# The events sent at once when the emits are coalesced every YAHTZEE_EMIT_TICK, see app.Outbox:
+# the replies a client waits for before it can go on
+URGENT_EVENTS = (
+    'registerSuccessResponse',
+    'resumeGame',
+    'enterNewGame',
+    'playerNoLongerAvailable',
+    'botUnavailable',
+    'watchRejected',
+)
+
+
+def merge_updates(event, earlier, later):
+    """
+    Merge two gameUpdates waiting in the outbox for the same target, None to send both.
+    A snapshot replaces the update before it. Otherwise the later changes are applied over the
+    earlier ones, unless both fill a scoring, and 'base' is the version the merged update applies to.
+    The payloads packed by app.Codec are not merged.
+    """
+    if event != 'gameUpdate' or not isinstance(earlier, dict) or not isinstance(later, dict):
+        return None
+    if 'score_active' in later:
+        return later
+    if 'score_active' in earlier or ('key' in earlier and 'key' in later):
+        return None
+    merged = dict(earlier, **later)
+    merged['base'] = earlier.get('base', earlier['version'] - 1)
+    if 'preview' not in later:
+        # the turn has ended with the scoring, there is nothing to preview
+        merged.pop('preview', None)
+    return merged
+
+
+# The token buckets of the sessions of this process, see app.RateLimit
+rate_limiter = RateLimiter(RATE_LIMITS, Config.RATE_LIMIT)
+
+# The worker processes deciding the moves of the bots, see app.BotPool
+# Until the entry point calls start_server, the bots make the moves that take no search
+bot_pool = BotPool(0, Config.BOT_BUDGET)
+
+# The state of the server, in this process or shared by all workers, see app.Store
+# A Player or a Game changed by a handler is written back with store.save_player / store.save_game
+# The handlers run in parallel threads: they change a player or a game only while holding its locks,
+# with lock_player or lock_game
+store = open_store(Config.STATE_STORE)
+
+# All online players in this dictionary
+# key: pid
+# value: A Player object
+online_players = store.online_players
+
+# Map all current active sessions to the player
+# key: sid
+# value: pid
+sid_to_pid = store.sid_to_pid
+
+# All available players in the lobby, with the presence version and pending changes
+# Change it only through lobby.add / lobby.remove, so that subscribers receive the diffs
+# lobby.players - dict of all available players
+#   key: pid
+#   value: A dict generate from Player.to_dict(), like {'pid': xxx, 'username':xxx}
+lobby = store.lobby
+
+# Interval of pushing the coalesced lobby changes to the subscribers, in seconds
+LOBBY_TICK = 0.5
+lobby_ticker_started = False
+
+# The players waiting for an opponent of a similar rating, see app.Matchmaking
+match_queue = store.match_queue
+
+# Interval of pairing the waiting players, in seconds
+MATCH_TICK = 0.5
+
+# The Elo ratings of all players who have finished a game against another player, see app.Leaderboard
+# Opened by open_leaderboard when the server starts
+leaderboard = None
+
+# The most players sent in one page of the leaderboard
+MAX_LEADERBOARD_PAGE = 100
+
+# All ongoing games in this dictionary
+# key: game_id
+# value: a Game object
+ongoing_games = store.ongoing_games
+
+# The number of spectators of each watched game, shared by all workers
+# key: game_id
+# value: int
+spectators = store.spectators
+
+# The games followed by the spectators connected to this process
+# key: sid
+# value: game_id
+watching = {}
+
+# The moves of the watched games made in this process, not sent to the spectators yet
+# key: game_id
+# value: list of (event, data)
+spectator_feed = {}
+# held while adding a move to the feed and while taking the feed to send it
+spectator_feed_lock = threading.Lock()
+# held while sending the feed, so that a new spectator enters the room after the moves its snapshot has
+spectator_push_lock = threading.Lock()
+
+# Interval of sending the moves to the spectators, in seconds
+# The players get every move at once, the spectators get at most one broadcast per game per tick
+SPECTATOR_TICK = 0.2
+spectator_ticker_started = False
+
+# The timeouts of this process: suspended players, idle games and the session sweep
+# key: ('suspended', pid), value: the lost sid
+# key: ('idle', game_id), value: the version of the game when it was scheduled
+# key: ('sweep', None)
+timers = TimerWheel()
+
+# Interval of checking the timers, in seconds
+TIMER_TICK = 1
+# Interval of dropping the sessions that have been lost without a disconnect, in seconds
+SESSION_SWEEP_INTERVAL = 300
+background_tasks_started = False
+
+# The write-ahead log of the games, every change of a game is logged before it is sent
+# It does nothing without YAHTZEE_EVENT_LOG, see app.EventLog
+event_log = EventLog(Config.EVENT_LOG)
+
+
+def restore_games(games):
+    """
+    Put the games rebuilt from the event log back in play.
+    Their players are offline until they register again, then they resume the game.
+    """
+    for game in games.values():
+        for player in (game.p1, game.p2):
+            if not player.is_bot:
+                player.rating = round(leaderboard.get_rating(player.pid))
+                online_players[player.pid] = player
+        ongoing_games[game.get_game_id()] = game
+    print('%d GAMES RESTORED FROM THE EVENT LOG.' % len(games))
+
+
+def count_in_store(items):
+    """
+    Return a function that counts the items in a transaction, for the gauges of the metrics
+    """
+    def get_value():
+        with store.transaction():
+            return len(items)
+    return get_value
+
+
+metrics.add_gauge('yahtzee_online_players', 'Players online.', count_in_store(online_players))
+metrics.add_gauge('yahtzee_ongoing_games', 'Games being played.', count_in_store(ongoing_games))
+metrics.add_gauge('yahtzee_available_players', 'Players available in the lobby.', count_in_store(lobby))
+metrics.add_gauge('yahtzee_queued_players', 'Players waiting in the matchmaking queue.', count_in_store(match_queue))
+metrics.add_gauge('yahtzee_pending_bot_moves', 'Moves of the bots being decided by the bot pool.', lambda: len(bot_pool))
+
+
+# The precomputed strategy of the bot, memory-mapped once and shared by all games
+# Build it with `python -m app.Solver`
+# The workers of the bot pool load their own copy, this one tells whether the optimal level is available
+bot_table = load_bot_table()
+if bot_table is None:
+    print('BOT TABLE NOT FOUND. THE OPTIMAL BOT IS DISABLED.')
+
+# The level of the bot when the client does not choose one
+DEFAULT_BOT_LEVEL = 'montecarlo' if bot_table is None else 'optimal'
+
+# Delay between two moves of the bot, so that the client can follow them
+# The bot pool decides the next move during the delay
+BOT_MOVE_DELAY = 0.8
+# Interval of checking a decision that takes longer than the delay, in seconds
+BOT_POLL_INTERVAL = 0.02
+# Time allowed to a decision after its budget, before the bot makes the greedy move instead
+BOT_BUDGET_GRACE = 0.5
+
+
+def get_game_keys(game):
+    return {game_key(game.get_game_id()), player_key(game.p1.pid), player_key(game.p2.pid)}
+
+
+def get_player_keys(player_id):
+    """
+    The keys of a player, with the game and the opponent of the player if there is one
+    """
+    keys = {player_key(player_id)}
+    player = online_players.get(player_id)
+    if player is not None and player.game_id != '-1':
+        game = ongoing_games.get(player.game_id)
+        if game is not None:
+            keys |= get_game_keys(game)
+    return keys
+
+
+@contextmanager
+def lock_player(player_id):
+    """
+    Hold the locks of a player, of the game of the player and of the opponent.
+    The player may start or end a game while waiting for them, then they are taken again.
+    Gives the player, None if the player is not online.
+    """
+    while True:
+        keys = get_player_keys(player_id)
+        with store.lock(*keys):
+            if get_player_keys(player_id) == keys:
+                yield online_players.get(player_id)
+                return
+
+
+@contextmanager
+def lock_game(game_id):
+    """
+    Hold the locks of a game and of its players.
+    Gives the game, None if it is not ongoing, or has ended while waiting for the locks.
+    """
+    game = ongoing_games.get(game_id)
+    if game is None:
+        yield None
+        return
+    with store.lock(*get_game_keys(game)):
+        yield ongoing_games.get(game_id)
+
+
+def send(player, event, data):
+    """
+    Send an event to the session of an online player, in the codec of the session
+    """
+    transport.emit(event, Codec.encode(player.codec, event, data), to=player.sid)
+
+
+def notify(player, event, data):
+    """
+    Send an event to the current session of a player. Bot players have no session.
+    """
+    if not player.is_bot:
+        send(online_players[player.pid], event, data)
+
+
+def get_session_codec(sid):
+    """
+    The codec the session has registered with, JSON if it has not registered
+    """
+    player_id = sid_to_pid.get(sid)
+    player = None if player_id is None else online_players.get(player_id)
+    if player is None or player.sid != sid:
+        return Codec.JSON
+    return player.codec
+
+
+def enter_game_room(player, game_id):
+    """
+    The sessions with the JSON codec get the events of the game through its room,
+    the others get them one by one from broadcast, in their codec
+    """
+    if player.codec == Codec.JSON:
+        transport.enter_room(player.sid, game_id)
+    else:
+        transport.leave_room(player.sid, game_id)
+
+
+def broadcast(game, event, data):
+    """
+    Send one event to everyone in the room of the game.
+    Each game owns a Socket.IO room keyed by its game_id, the players with another codec
+    get the event encoded once for both.
+    The spectators of the game get it with the next tick of push_spectator_updates.
+    """
+    in_room = False
+    packed = []
+    for player in (game.p1, game.p2):
+        if not player.is_bot:
+            player = online_players.get(player.pid)
+            if player is None:
+                continue
+            if player.codec == Codec.JSON:
+                in_room = True
+            else:
+                packed.append(player)
+    if in_room:
+        transport.emit(event, data, to=game.get_game_id())
+    if packed:
+        payload = Codec.encode(Codec.MSGPACK, event, data)
+        for player in packed:
+            transport.emit(event, payload, to=player.sid)
+    if game.get_game_id() in spectators:
+        add_spectator_update(game.get_game_id(), event, data)
+
+
+def add_spectator_update(game_id, event, data):
+    """
+    Queue a message for the spectators of a game, sent at the next push_spectator_updates
+    """
+    with spectator_feed_lock:
+        spectator_feed.setdefault(game_id, []).append((event, data))
+
+
+def end_game(game):
+    """
+    Remove a game from the ongoing games and close its room
+    """
+    watched = game.get_game_id() in spectators
+    if not store.end_game(game.get_game_id()):
+        return
+    event_log.log_end(game)
+    timers.cancel(('idle', game.get_game_id()))
+    transport.close_room(game.get_game_id())
+    if watched:
+        # the room of the spectators is closed after they get the last moves
+        add_spectator_update(game.get_game_id(), 'watchEnded', game.get_game_id())
+
+
+def run_timers():
+    """
+    Handle the timers that are due once per tick
+    A background task, it yields the delay before each check
+    """
+    while True:
+        yield TIMER_TICK
+        for (kind, key), value in timers.expire():
+            if kind == 'suspended':
+                expire_suspension(key, value)
+            elif kind == 'idle':
+                expire_idle_game(key, value)
+            elif kind == 'sweep':
+                sweep_sessions()
+                rate_limiter.sweep()
+                timers.schedule(('sweep', None), SESSION_SWEEP_INTERVAL)
+
+
+def expire_suspension(player_id, lost_sid):
+    """
+    End the game of a suspended player who has not come back
+    """
+    with lock_player(player_id) as player:
+        if player is not None and player.sid == lost_sid and not is_connected(player):
+            print('PLAYER DID NOT COME BACK: ' + str(player))
+            remove_player(player)
+
+
+def watch_idle_game(game):
+    timers.schedule(('idle', game.get_game_id()), Config.GAME_IDLE_TIMEOUT, game.get_version())
+
+
+def expire_idle_game(game_id, version):
+    """
+    End a game without any move for GAME_IDLE_TIMEOUT seconds.
+    The moves do not touch the timer, a game that has moved since is watched again from now.
+    """
+    with lock_game(game_id) as game:
+        if game is None:
+            return
+        if game.get_version() != version:
+            watch_idle_game(game)
+            return
+        print('GAME EXPIRED: ' + game_id)
+        broadcast(game, 'gameExpired', game_id)
+        for player in (game.p1, game.p2):
+            if not player.is_bot:
+                player = online_players.get(player.pid)
+                if player is not None and player.game_id == game_id:
+                    player.set_game_id('-1')
+                    store.save_player(player)
+                    if is_connected(player):
+                        lobby.add(player.pid, player.to_dict())
+        end_game(game)
+
+
+def sweep_sessions():
+    """
+    Drop the sessions that are not connected to this process and no longer lead to a player,
+    left behind when a connection is lost without a disconnect, like in a crashed worker
+    """
+    stale = []
+    for sid, pid in list(sid_to_pid.items()):
+        with lock_player(pid) as player:
+            if sid_to_pid.get(sid) != pid or (player is not None and player.sid == sid) or transport.is_connected(sid):
+                continue
+            del sid_to_pid[sid]
+            stale.append(sid)
+    if stale:
+        print('%d STALE SESSIONS DROPPED.' % len(stale))
+
+
+def start_background_tasks():
+    """
+    Start the timers, and the games rebuilt from the event log, with the first connection:
+    the asyncio server can only run tasks once it is serving
+    """
+    global background_tasks_started
+    if background_tasks_started:
+        return
+    background_tasks_started = True
+    if Config.EVENT_LOG:
+        # the games rebuilt from the event log wait for their players, the bots play on
+        for game in list(ongoing_games.values()):
+            for player in (game.p1, game.p2):
+                if not player.is_bot:
+                    timers.schedule(('suspended', player.pid), Config.RECONNECT_GRACE, player.sid)
+            watch_idle_game(game)
+            start_bot_turn(game)
+    timers.schedule(('sweep', None), SESSION_SWEEP_INTERVAL)
+    start_task(run_timers)
+    start_task(match_waiting_players)
+    if isinstance(transport, Outbox):
+        transport.start_task(transport.run)
+
+
+@on('connect')
+def handle_connect(sid):
+    start_background_tasks()
+    print('NEW CONNECTION (SESSION ID: %s) FROM: %s' % (sid, transport.get_remote_addr(sid)))
+
+
+@on('register_player')
+def handle_register_player(sid, message):
+    """
+    The player send his pid to the server.
+    Create a new Player object.
+    Parameters:
+        message: {'playerId': pid, 'codec': optional, 'json' by default or 'msgpack', see app.Codec}
+    """
+    player_id = message['playerId']
+    codec = Codec.negotiate(message.get('codec', Codec.JSON))
+    with lock_player(player_id) as player:
+        # check if the player have already registerd:
+        if player is not None:
+            # update existing player
+            # the player might refresh the browser or have encountered an Internet issue
+            previous_sid = store.rehome_session(player_id, sid)
+            suspended = previous_sid not in sid_to_pid
+            player = online_players[player_id]
+            player.set_ip(transport.get_remote_addr(sid))
+            player.codec = codec
+            store.save_player(player)
+            print('PLAYER RESTABLISH A CONNECTION: ' + str(player))
+            transport.emit('registerSuccessResponse', dict(player.to_dict(), codec=codec), to=sid)
+            if player.game_id != '-1':
+                # there is an ongoing game for the current player
+                # it may have been started by another worker
+                game_id = player.game_id
+                game = ongoing_games[game_id]
+                enter_game_room(player, game_id)
+                if suspended:
+                    timers.cancel(('suspended', player_id))
+                    notify(get_opponent(game, player_id), 'opponentReconnected', player_id)
+                if game.p1.pid == player_id:
+                    transport.emit('resumeGame', {'game_id': game_id, 'oppo_player': game.p2.to_dict()}, to=sid)
+                elif game.p2.pid == player_id:
+                    transport.emit('resumeGame', {'game_id': game_id, 'oppo_player': game.p1.to_dict()}, to=sid)
+                else:
+                    raise ValueError("Cannot find player in this game!")
+            else:
+                # add the player to the available players
+                lobby.add(player_id, player.to_dict())
+        else:
+            # create new player
+            new_player = Player(
+                pid=player_id ,sid=sid, ip=transport.get_remote_addr(sid), rating=round(leaderboard.get_rating(player_id))
+            )
+            new_player.codec = codec
+            sid_to_pid[sid] = player_id
+            online_players[player_id] = new_player
+            print('NEW PLAYER REGISTERED: ' + str(new_player))
+            lobby.add(player_id, new_player.to_dict())
+            transport.emit('registerSuccessResponse', dict(new_player.to_dict(), codec=codec), to=sid)
+
+
+@on('disconnect')
+def handle_disconnect(sid):
+    print('CONNECTION TERMINATED (SESSION ID: %s).' % sid)
+    rate_limiter.forget(sid)
+    stop_watching(sid)
+    player_id = sid_to_pid.get(sid)
+    if player_id is None:
+        print('UNKNOWN SESSION HAS BEEN DISCONNECTED. (SESSION ID: %s)' % sid)
+        return
+    with lock_player(player_id) as player:
+        if sid in sid_to_pid:
+            del sid_to_pid[sid]
+        # check if the player_id is connected through another session
+        if player is None:
+            print('UNKNOWN SESSION HAS BEEN DISCONNECTED. (SESSION ID: %s)' % sid)
+        elif player.sid != sid:
+            # the player is still connected through another session
+            # the player possibly refresh the browser or have encountered an Internet issue
+            pass
+        elif player.game_id != '-1':
+            # the connection may come back, keep the game for the grace period
+            suspend_player(player)
+        else:
+            remove_player(player)
+
+
+def is_connected(player):
+    """
+    A player is connected while the session is known, a suspended player has no session
+    """
+    return player.sid in sid_to_pid
+
+
+def get_opponent(game, player_id):
+    if game.p1.pid == player_id:
+        return game.p2
+    elif game.p2.pid == player_id:
+        return game.p1
+    else:
+        raise ValueError('Cannot find the player in the game.')
+
+
+def suspend_player(player):
+    """
+    The player of an ongoing game has lost the connection.
+    The game waits for RECONNECT_GRACE seconds, then ends if the player has not registered again.
+    The caller holds the locks of lock_player
+    """
+    print('PLAYER SUSPENDED: ' + str(player))
+    timers.schedule(('suspended', player.pid), Config.RECONNECT_GRACE, player.sid)
+    opponent = get_opponent(ongoing_games[player.game_id], player.pid)
+    notify(opponent, 'opponentSuspended', {'pid': player.pid, 'grace': Config.RECONNECT_GRACE})
+
+
+def remove_player(player):
+    """
+    The player has left: end the ongoing game if there is one, the opponent goes back to the lobby
+    The caller holds the locks of lock_player
+    """
+    player_id = player.pid
+    if player.game_id != '-1':
+        ended_game = ongoing_games[player.game_id]
+        try:
+            opponent = get_opponent(ended_game, player_id)
+            notify(opponent, 'opponentDisconnect', player_id)
+            if not opponent.is_bot:
+                opponent = online_players[opponent.pid]
+                opponent.game_id = '-1'
+                store.save_player(opponent)
+                if is_connected(opponent):
+                    lobby.add(opponent.pid, opponent.to_dict())
+        except ValueError as e:
+            print(e)
+        end_game(ended_game)
+
+    # delete the player from available players
+    lobby.remove(player_id, 'left')
+    match_queue.leave(player_id)
+    del online_players[player_id]
+    timers.cancel(('suspended', player_id))
+
+
+@on('play_bot')
+def handle_play_bot(sid, message=None):
+    """
+    One client requests to play with the bot.
+    Start a bot on the server to play with the client.
+    message: optional, {'level': one of BOT_LEVELS}, DEFAULT_BOT_LEVEL without it
+    """
+    player_id = sid_to_pid.get(sid)
+    if player_id is None:
+        return
+    level = message.get('level', DEFAULT_BOT_LEVEL) if isinstance(message, dict) else DEFAULT_BOT_LEVEL
+    if level not in BOT_LEVELS or (level == 'optimal' and bot_table is None):
+        transport.emit('botUnavailable', to=sid)
+        return
+    with lock_player(player_id) as player:
+        if player is None or not store.claim_players(player_id):
+            transport.emit('playerNoLongerAvailable', player_id, to=sid)
+            return
+        bot = Player(pid='bot-' + str(uuid.uuid4()), username='YahtzeeBot', is_bot=True)
+        if random.randint(0, 1):
+            new_game = Game(player, bot, bot_level=level)
+        else:
+            new_game = Game(bot, player, bot_level=level)
+        ongoing_games[new_game.get_game_id()] = new_game
+        event_log.log_create(new_game)
+        watch_idle_game(new_game)
+        player.set_game_id(new_game.get_game_id())
+        bot.set_game_id(new_game.get_game_id())
+        store.save_player(player)
+        enter_game_room(player, new_game.get_game_id())
+        send(player, 'enterNewGame', {'game_id': new_game.get_game_id(), 'oppo_player': bot.to_dict()})
+    start_bot_turn(new_game)
+
+
+def start_bot_turn(game):
+    """
+    Let the bot play its turn in the background if it is the active player
+    """
+    if get_active_player_object(game).is_bot:
+        start_task(play_bot_turn, game.get_game_id())
+
+
+def get_active_player_object(game):
+    if game.get_active_player() == 0:
+        return game.p1
+    else:
+        return game.p2
+
+
+def roll_for_bot(game, idx):
+    game.roll(idx)
+    event_log.log_roll(game, idx)
+    store.save_game(game)
+    broadcast(game, 'gameUpdate', get_roll_update(game))
+
+
+def decide_bot_move(game):
+    """
+    Ask the bot pool for the next move of the bot
+    return: (future of the move, version of the game, position), the position is passed on to bot_pool.get_move
+    """
+    player_idx = game.get_active_player()
+    position = (game.filled[player_idx], game.upper_sec_total[player_idx], game.get_i_roll(), game.get_dice())
+    future = bot_pool.submit(game.get_bot_level() or DEFAULT_BOT_LEVEL, *position)
+    return future, game.get_version(), position
+
+
+def play_bot_turn(game_id):
+    """
+    Play one turn of the bot. The bot pool decides each move while the bot waits BOT_MOVE_DELAY,
+    the handlers never wait for it. The move is sent to the players once it is decided.
+    A background task, it yields the delay before each move, without holding the locks of the game
+    """
+    yield BOT_MOVE_DELAY
+    with lock_game(game_id) as game:
+        if game is None:
+            return
+        if game.get_i_roll() == 0:
+            roll_for_bot(game, [0, 1, 2, 3, 4])
+        future, version, position = decide_bot_move(game)
+    while True:
+        deadline = time.monotonic() + bot_pool.budget + BOT_BUDGET_GRACE
+        yield BOT_MOVE_DELAY
+        while not future.done() and time.monotonic() < deadline:
+            yield BOT_POLL_INTERVAL
+        with lock_game(game_id) as game:
+            if game is None or game.get_version() != version:
+                # the opponent has left the game
+                future.cancel()
+                return
+            kind, move = bot_pool.get_move(future, *position)
+            if kind == 'fill':
+                fill_score(game, move)
+                return
+            roll_for_bot(game, move)
+            future, version, position = decide_bot_move(game)
+
+
+@on('get_players_online')
+def handle_get_players_online(sid):
+    """
+    One client requests info on all available players online.
+    Return all available players to the client.
+    Kept for clients without the lobby feed, new clients use subscribe_lobby instead.
+    """
+    players = dict(lobby.players)
+    transport.emit('getPlayersOnlineResponse', Codec.encode(get_session_codec(sid), 'getPlayersOnlineResponse', players), to=sid)
+
+
+@on('subscribe_lobby')
+def handle_subscribe_lobby(sid, message):
+    """
+    One client starts following the lobby.
+    Send the first page of available players, then push the changes every LOBBY_TICK.
+    Parameters:
+        message: {'limit': int}
+    """
+    global lobby_ticker_started
+    if not lobby_ticker_started:
+        lobby_ticker_started = True
+        start_task(push_lobby_changes)
+    transport.enter_room(sid, 'lobby')
+    transport.emit('lobbySnapshot', lobby.snapshot(limit=message.get('limit', 100)), to=sid)
+
+
+@on('get_lobby_page')
+def handle_get_lobby_page(sid, message):
+    """
+    One client requests the next page of available players.
+    Parameters:
+        message: {'cursor': pid, 'limit': int}
+    """
+    transport.emit('lobbySnapshot', lobby.snapshot(cursor=message['cursor'], limit=message.get('limit', 100)), to=sid)
+
+
+@on('unsubscribe_lobby')
+def handle_unsubscribe_lobby(sid):
+    transport.leave_room(sid, 'lobby')
+
+
+def push_lobby_changes():
+    """
+    Push the coalesced lobby changes to all subscribers once per tick
+    A background task, it yields the delay before each push
+    """
+    while True:
+        yield LOBBY_TICK
+        changes = lobby.drain()
+        if changes is not None:
+            transport.emit('lobbyUpdate', changes, to='lobby')
+
+
+@on('get_leaderboard')
+def handle_get_leaderboard(sid, message):
+    """
+    One client requests the players with the highest ratings.
+    Parameters:
+        message: {'limit': int}
+    """
+    limit = min(message.get('limit', MAX_LEADERBOARD_PAGE), MAX_LEADERBOARD_PAGE)
+    transport.emit('leaderboard', {'players': leaderboard.top(limit), 'total': leaderboard.count()}, to=sid)
+
+
+@on('get_rank')
+def handle_get_rank(sid):
+    """
+    One client requests its rating and rank.
+    Send {'pid', 'rating', 'rank', 'total'} back, rank is None before the first rated game.
+    """
+    player_id = sid_to_pid.get(sid)
+    if player_id is None:
+        return
+    transport.emit('rank', leaderboard.rank(player_id), to=sid)
+
+
+@on('send_invite')
+def handle_send_invite(sid, message):
+    """
+    Inviter client sent an invitation to invitee client.
+    Receive the invitation, and notify the invitee client.
+    Parameters:
+        message: {'inviter': pid, 'invitee': pid}
+    """
+    inviter = online_players.get(message['inviter'])
+    if inviter is None:
+        return
+    # the end of a game of the invitee returns the invitee to the lobby under the same locks
+    with lock_player(message['invitee']) as invitee:
+        available = invitee is not None and message['invitee'] in lobby
+        if available:
+            transport.emit('receiveInvitation', inviter.to_dict(), to=invitee.sid)
+    if not available:
+        transport.emit('playerNoLongerAvailable', message['invitee'], to=sid)
+
+
+@on('accept_invite')
+def handle_accept_invite(sid, message):
+    """
+    Invitee client accept the invitation from inviter client.
+    Send the accept info to the inviter.
+    Start a new game and add both clients to the game.
+    Parameters:
+        message: { 'inviter': pid, 'invitee': pid }
+    """
+    if not start_game(message['inviter'], message['invitee']):
+        transport.emit('playerNoLongerAvailable', message['inviter'], to=sid)
+
+
+def start_game(inviter_id, invitee_id):
+    """
+    Start a new game between two available players, in random seat order, and add both clients to the game.
+    Of the events starting games with the same player, only the first one gets the player.
+    return: whether the game has started, False if one of the players is no longer available
+    """
+    with store.lock(player_key(inviter_id), player_key(invitee_id)):
+        if not store.claim_players(inviter_id, invitee_id):
+            return False
+        create_game(online_players[inviter_id], online_players[invitee_id])
+    return True
+
+
+def create_game(inviter, invitee):
+    """
+    Seat two claimed players in a new game, the caller holds their locks
+    """
+    if random.randint(0, 1):
+        new_game = Game(inviter, invitee)
+    else:
+        new_game = Game(invitee, inviter)
+    ongoing_games[new_game.get_game_id()] = new_game
+    event_log.log_create(new_game)
+    watch_idle_game(new_game)
+    inviter.set_game_id(new_game.get_game_id())
+    invitee.set_game_id(new_game.get_game_id())
+    store.save_player(inviter)
+    store.save_player(invitee)
+    enter_game_room(inviter, new_game.get_game_id())
+    enter_game_room(invitee, new_game.get_game_id())
+    send(inviter, 'enterNewGame', {'game_id': new_game.get_game_id(), 'oppo_player': invitee.to_dict()})
+    send(invitee, 'enterNewGame', {'game_id': new_game.get_game_id(), 'oppo_player': inviter.to_dict()})
+
+
+@on('join_queue')
+def handle_join_queue(sid):
+    """
+    One client wants a game against anyone of a similar rating.
+    Pair the player right away if possible, otherwise the player waits in the
+    matchmaking queue and the search widens every MATCH_TICK.
+    The player stays in the lobby and can still be invited meanwhile.
+    """
+    player_id = sid_to_pid.get(sid)
+    if player_id is None:
+        return
+    with lock_player(player_id) as player:
+        # a player in the queue is always in the lobby, claiming the player for a game takes both
+        if player is None or player_id not in lobby:
+            transport.emit('playerNoLongerAvailable', player_id, to=sid)
+            return
+        match_queue.join(player_id, player.rating, time.time())
+    transport.emit('queueJoined', {'rating': player.rating}, to=sid)
+    opponent_id = match_queue.find_opponent(player_id, time.time())
+    if opponent_id is not None:
+        start_match(player_id, opponent_id)
+
+
+@on('leave_queue')
+def handle_leave_queue(sid):
+    player_id = sid_to_pid.get(sid)
+    if player_id is None:
+        return
+    match_queue.leave(player_id)
+    transport.emit('queueLeft', to=sid)
+
+
+def match_waiting_players():
+    """
+    Pair the waiting players once per tick, with the windows widened by their waiting time
+    A background task, it yields the delay before each round
+    """
+    while True:
+        yield MATCH_TICK
+        now = time.time()
+        for player_id in match_queue.waiting():
+            if player_id in match_queue:
+                opponent_id = match_queue.find_opponent(player_id, now)
+                if opponent_id is not None:
+                    start_match(player_id, opponent_id)
+
+
+def start_match(player_id, opponent_id):
+    """
+    Start the game of two players paired by the queue, both have left it.
+    If one of them has been claimed by another game meanwhile, the other one waits again.
+    """
+    if start_game(player_id, opponent_id):
+        return
+    for pid in (player_id, opponent_id):
+        with lock_player(pid) as player:
+            if player is not None and pid in lobby:
+                match_queue.join(pid, player.rating, time.time())
+
+
+@on('decline_invite')
+def handle_decline_invite(sid, message):
+    """
+    Invitee client decline the invitation from inviter client.
+    Send the decline info to the inviter.
+    Parameters:
+        message: {'inviter': pid, 'invitee': pid}
+    """
+    inviter = online_players.get(message['inviter'])
+    invitee = online_players.get(message['invitee'])
+    if inviter is not None and invitee is not None:
+        transport.emit('invitationDeclined', invitee.to_dict(), to=inviter.sid)
+
+
+@on('game_initialize')
+def handle_game_initialize(sid, message):
+    """
+    One client request to get the initial state of the game, or to resync after it missed an update.
+    Send a full snapshot of the game back to the client.
+    Parameters:
+        message: { 'game_id': uuid, 'player_id': pid }
+    """
+    game_id = message['game_id']
+    # in case game_id is null
+    if game_id is None:
+        player = online_players.get(message['player_id'])
+        if player is None:
+            return
+        game_id = player.game_id
+    with lock_game(game_id) as game:
+        if game is not None:
+            transport.emit('gameUpdate', Codec.encode(get_session_codec(sid), 'gameUpdate', get_snapshot(game)), to=sid)
+
+
+def get_snapshot(game):
+    """
+    The full state of a game, as sent in a gameUpdate
+    """
+    if game.get_active_player() == 0:
+        active_player = game.p1.pid
+        score_active = game.get_score(0)
+        score_inactive = game.get_score(1)
+    else:
+        active_player = game.p2.pid
+        score_active = game.get_score(1)
+        score_inactive = game.get_score(0)
+    return {
+        'version': game.get_version(),
+        'dice': game.get_dice(),
+        'i_roll': game.get_i_roll(),
+        'round': game.get_round(),
+        'active_player': active_player,
+        'score_active': score_active,
+        'score_inactive': score_inactive,
+        'preview': game.get_preview()
+    }
+
+
+@on('watch_game')
+def handle_watch_game(sid, message):
+    """
+    One client starts following a game it does not play in.
+    Send a snapshot of the game, then the moves every SPECTATOR_TICK.
+    Parameters:
+        message: {'game_id': uuid}
+    """
+    global spectator_ticker_started
+    game_id = message['game_id']
+    # the game watched before is left first, a spectator follows one game at a time
+    stop_watching(sid)
+    with lock_game(game_id) as game:
+        if game is None:
+            transport.emit('watchRejected', {'game_id': game_id, 'reason': 'not found'}, to=sid)
+            return
+        n_spectators = spectators.get(game_id, 0)
+        if n_spectators >= Config.MAX_SPECTATORS:
+            transport.emit('watchRejected', {'game_id': game_id, 'reason': 'full'}, to=sid)
+            return
+        if not spectator_ticker_started:
+            spectator_ticker_started = True
+            start_task(push_spectator_updates)
+        spectators[game_id] = n_spectators + 1
+        watching[sid] = game_id
+        with spectator_push_lock:
+            # the moves waiting are in the snapshot, the spectators already watching get them first
+            with spectator_feed_lock:
+                updates = spectator_feed.pop(game_id, None)
+            if updates is not None:
+                send_spectator_updates(game_id, updates)
+            transport.enter_room(sid, 'watch:' + game_id)
+            transport.emit('watchSnapshot', {
+                    'game_id': game_id,
+                    'players': [game.p1.to_dict(), game.p2.to_dict()],
+                    'state': get_snapshot(game)
+                }, to=sid)
+
+
+@on('unwatch_game')
+def handle_unwatch_game(sid):
+    stop_watching(sid)
+
+
+def stop_watching(sid):
+    game_id = watching.pop(sid, None)
+    if game_id is None:
+        return
+    transport.leave_room(sid, 'watch:' + game_id)
+    with lock_game(game_id):
+        n_spectators = spectators.get(game_id)
+        if n_spectators is None:
+            # the game has ended
+            return
+        if n_spectators > 1:
+            spectators[game_id] = n_spectators - 1
+        else:
+            del spectators[game_id]
+
+
+def push_spectator_updates():
+    """
+    Send the moves of the watched games to their spectators once per tick, one broadcast per game.
+    When several moves of a game wait, the spectators get one snapshot instead, so a game with
+    many spectators costs the same however fast it is played.
+    A background task, it yields the delay before each push
+    """
+    global spectator_feed
+    while True:
+        yield SPECTATOR_TICK
+        with spectator_push_lock:
+            with spectator_feed_lock:
+                feed, spectator_feed = spectator_feed, {}
+            for game_id, updates in feed.items():
+                send_spectator_updates(game_id, updates)
+
+
+def send_spectator_updates(game_id, updates):
+    """
+    Send the moves of a game taken from the feed to its spectators, with spectator_push_lock held
+    """
+    room = 'watch:' + game_id
+    game = ongoing_games.get(game_id)
+    moves = [data for event, data in updates if event == 'gameUpdate']
+    if len(moves) > 1 and game is not None:
+        transport.emit('gameUpdate', get_snapshot(game), to=room)
+    else:
+        for data in moves:
+            transport.emit('gameUpdate', data, to=room)
+    for event, data in updates:
+        if event != 'gameUpdate':
+            transport.emit(event, data, to=room)
+    if game is None:
+        transport.close_room(room)
+        for sid in [sid for sid, watched in list(watching.items()) if watched == game_id]:
+            watching.pop(sid, None)
+
+
+# @on('start_roll')
+# def handle_start_roll(sid, message):
+#     """
+#     One client start a physical simulation of rolling in three.js
+#     Parameters:
+#         message: {'game_id': uuid, 'player_id': pid, 'index': [int, ]}
+#     """
+#     game = ongoing_games[message['game_id']]
+#     if message['player_id'] == game.p1.pid:
+#         oppo_player_sid = game.p2.sid
+#     elif message['player_id'] == game.p2.pid:
+#         oppo_player_sid = game.p1.sid
+#     transport.emit('oppoStartRoll', {'index': message['index']}, to=oppo_player_sid)
+
+
+@on('roll')
+def handle_roll(sid, message):
+    """
+    One client request to make a roll.
+    Make a roll in the game. Once success, send the dice back to the client.
+    Parameters:
+        message: {'game_id': uuid, 'player_id': pid, 'index' : [int, ]}
+    """
+    # make a roll in this game
+    with lock_game(message['game_id']) as game:
+        if game is None:
+            # the game has ended meanwhile
+            return
+        reason = check_move(sid, game, 'roll', message)
+        if reason is not None:
+            metrics.count_dropped('roll', reason)
+            return
+        game.roll(message['index'])
+        event_log.log_roll(game, message['index'])
+        store.save_game(game)
+        broadcast(game, 'gameUpdate', get_roll_update(game))
+
+
+def get_roll_update(game):
+    """
+    The changes of a roll, as sent in a gameUpdate, with the preview of the open scorings of the active player.
+    The clients show the preview as it is, the scores are only computed by the server.
+    """
+    return {
+        'version': game.get_version(),
+        'dice': game.get_dice(),
+        'i_roll': game.get_i_roll(),
+        'preview': game.get_preview()
+    }
+
+
+# Rolls in one turn
+ROLLS_PER_TURN = 3
+
+
+def check_move(sid, game, event, message):
+    """
+    Check a roll or a fill against the turn before it touches the game
+    return: the reason to drop the move, None for a valid move
+    """
+    if sid_to_pid.get(sid) != get_active_player_object(game).pid:
+        return 'not_your_turn'
+    i_roll = game.get_i_roll()
+    if event == 'roll':
+        index = message.get('index')
+        if i_roll >= ROLLS_PER_TURN:
+            return 'no_rolls_left'
+        if not isinstance(index, list) or not all(isinstance(i, int) and 0 <= i <= 4 for i in index):
+            return 'invalid_index'
+        # the first roll of a turn rolls all dice
+        if len(set(index)) != len(index) or not index or (i_roll == 0 and len(index) != 5):
+            return 'invalid_index'
+    else:
+        key = message.get('key')
+        if i_roll == 0:
+            return 'not_rolled'
+        if not isinstance(key, str) or key not in CATEGORY_INDEX:
+            return 'invalid_key'
+        if game.filled[game.get_active_player()] >> CATEGORY_INDEX[key] & 1:
+            return 'filled_key'
+    return None
+
+
+@on('get_advice')
+def handle_get_advice(sid, message):
+    """
+    One client asks for hints on the dice to keep.
+    Send the expected score of every open scoring for each of the 32 holds of the dice,
+    empty before the first roll and after the last one.
+    Only the active player of the game gets hints, the opponent and the spectators do not.
+    Parameters:
+        message: {'game_id': uuid}
+    """
+    with lock_game(message['game_id']) as game:
+        if game is None:
+            return
+        if sid_to_pid.get(sid) != get_active_player_object(game).pid:
+            metrics.count_dropped('get_advice', 'not_your_turn')
+            return
+        version, i_roll, dice = game.get_version(), game.get_i_roll(), game.get_dice()
+        mask = game.filled[game.get_active_player()]
+    if 1 <= i_roll <= 2:
+        holds = get_advice(dice, i_roll, mask)
+    else:
+        holds = []
+    transport.emit('advice', {'version': version, 'holds': holds}, to=sid)
+
+
+@on('fill')
+def handle_fill(sid, message):
+    """
+    One client request to fill a scoring.
+    Fill the score in the game, and send the succuss info back to the client.
+    Paramters:
+        message: {'game_id': uuid, 'player_id': pid, 'key': str}
+    """
+    with lock_game(message['game_id']) as game:
+        if game is None:
+            return
+        reason = check_move(sid, game, 'fill', message)
+        if reason is not None:
+            metrics.count_dropped('fill', reason)
+            return
+        fill_score(game, message['key'])
+
+
+def get_fill_update(game, player_idx, key):
+    """
+    The changes of a scoring filled by the player player_idx, as sent in a gameUpdate
+    """
+    if player_idx == 0:
+        filled_by = game.p1.pid
+    else:
+        filled_by = game.p2.pid
+    if game.get_active_player() == 0:
+        active_player = game.p1.pid
+    else:
+        active_player = game.p2.pid
+    return {
+        'version': game.get_version(),
+        'player': filled_by,
+        'key': key,
+        'value': game.get_key_score(player_idx, key),
+        'upper_sec_total': game.upper_sec_total[player_idx],
+        'bonus': game.bonus[player_idx],
+        'total': game.total[player_idx],
+        'i_roll': game.get_i_roll(), 
+        'round': game.get_round(), 
+        'active_player': active_player
+    }
+
+
+def fill_score(game, key):
+    """
+    Fill the score for the active player and send only the changes to both players.
+    End the game after the last scoring, or hand over to the bot.
+    The caller holds the locks of lock_game
+    """
+    player_idx = game.get_active_player()
+    game_not_over = game.fill(key)
+    event_log.log_fill(game, key)
+    store.save_game(game)
+    broadcast(game, 'gameUpdate', get_fill_update(game, player_idx, key))
+    if game_not_over:
+        start_bot_turn(game)
+
+    else:
+        winner = game.get_winner()
+        if game.p1.is_bot or game.p2.is_bot:
+            new_ratings = None
+        else:
+            # only the games between two players are rated
+            new_ratings = leaderboard.record_game(game.p1, game.p2, winner)
+        # the players are back in the lobby before they learn that the game is over,
+        # so that an invite sent at once finds them available
+        # key: pid of the players, value: their ratingUpdate
+        rating_updates = {}
+        for i, player in enumerate((game.p1, game.p2)):
+            if not player.is_bot:
+                player = online_players[player.pid]
+                player.set_game_id('-1')
+                if new_ratings is not None:
+                    rating = round(new_ratings[i])
+                    rating_updates[player.pid] = {'rating': rating, 'change': rating - player.rating}
+                    player.rating = rating
+                store.save_player(player)
+                # a suspended player returns to the lobby when registering again
+                if is_connected(player):
+                    lobby.add(player.pid, player.to_dict())
+        # winner: pid of the winner, None for a tie
+        if winner == 0:
+            broadcast(game, 'gameOver', {'winner': None})
+        elif winner == 1:
+            broadcast(game, 'gameOver', {'winner': game.p1.pid})
+        elif winner == 2:
+            broadcast(game, 'gameOver', {'winner': game.p2.pid})
+        for pid, rating_update in rating_updates.items():
+            notify(online_players[pid], 'ratingUpdate', rating_update)
+        end_game(game)
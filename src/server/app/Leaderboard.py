@@ -0,0 +1,300 @@
+"""
+Elo ratings of the players, kept in an SQLite database and ranked in logarithmic time.
+
+The ratings table has an index on the rating, so the top of the leaderboard is read
+straight from it. The rank of a player is the number of players with a higher
+rating, answered by a Fenwick tree of the players per rating point, also stored in
+the database: an update or a rank query reads or writes log2(MAX_RATING) rows,
+however many players there are. Players with the same rounded rating share a rank.
+
+The results of the games are queued in memory and written in one transaction every
+FLUSH_INTERVAL by a writer thread, on its own connection and without holding the lock
+of the queue, so the end of a game never waits for the disk. The leaderboard and the
+ranks can be behind by that interval. The transaction reads the ratings again and
+applies the queued games to them, so workers sharing the database do not overwrite
+the games of each other.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from app.Player import DEFAULT_RATING
+
+
+# Elo update of each game
+K_FACTOR = 32
+# ratings are ranked by rating point from 0 to MAX_RATING, higher ratings count as MAX_RATING
+MAX_RATING = 4095
+# seconds between two writes of the queued rating changes
+FLUSH_INTERVAL = 1.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ratings (
+    pid TEXT PRIMARY KEY,
+    username TEXT,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ratings_rating ON ratings (rating DESC, pid);
+CREATE TABLE IF NOT EXISTS rating_tree (i INTEGER PRIMARY KEY, n INTEGER NOT NULL);
+'''
+
+
+def expected_score(rating, other_rating):
+    return 1 / (1 + 10 ** ((other_rating - rating) / 400))
+
+
+def get_new_ratings(rating_1, rating_2, score_1):
+    """
+    Return the ratings of both players after a game
+    score_1 - 1 if player 1 won, 0.5 for a tie, 0 if player 2 won
+    """
+    change = K_FACTOR * (score_1 - expected_score(rating_1, rating_2))
+    return rating_1 + change, rating_2 - change
+
+
+def get_bucket(rating):
+    """
+    Position of a rating in the Fenwick tree, from 1 to MAX_RATING + 1
+    """
+    return min(max(int(round(rating)), 0), MAX_RATING) + 1
+
+
+def tree_path_up(i):
+    """
+    The nodes of the Fenwick tree to update when the count at i changes
+    """
+    path = []
+    while i <= MAX_RATING + 1:
+        path.append(i)
+        i += i & -i
+    return path
+
+
+def tree_path_down(i):
+    """
+    The nodes of the Fenwick tree that sum up the counts from 1 to i
+    """
+    path = []
+    while i > 0:
+        path.append(i)
+        i -= i & -i
+    return path
+
+
+def apply_game(records, game):
+    """
+    Update the records of both players of a game
+    records - key: pid, value: (username, rating, games, wins), None for a player never rated
+    game    - (pid_1, username_1, pid_2, username_2, winner), winner as in Leaderboard.record_game
+    """
+    pid_1, username_1, pid_2, username_2, winner = game
+    record_1 = records[pid_1] or (username_1, DEFAULT_RATING, 0, 0)
+    record_2 = records[pid_2] or (username_2, DEFAULT_RATING, 0, 0)
+    rating_1, rating_2 = get_new_ratings(record_1[1], record_2[1], {0: 0.5, 1: 1, 2: 0}[winner])
+    records[pid_1] = (username_1, rating_1, record_1[2] + 1, record_1[3] + (winner == 1))
+    records[pid_2] = (username_2, rating_2, record_2[2] + 1, record_2[3] + (winner == 2))
+
+
+class Leaderboard:
+    """
+    The ratings in the database at path, shared by all workers on the host
+    """
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = self.connect(path)
+        # the connection of the writer thread, its transactions can wait for the other workers
+        self.writer_conn = self.connect(path)
+        self.lock = threading.RLock()
+        # held through a whole write, so that one write runs at a time on writer_conn
+        self.writer_lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO rating_tree (i, n) VALUES (?, 0)', ((i,) for i in range(1, MAX_RATING + 2))
+            )
+            self.conn.execute('COMMIT')
+        self.flush_interval = flush_interval
+        # the ratings of this worker not written yet
+        # key: pid
+        # value: (username, rating, games, wins)
+        self.pending = {}
+        # the ratings being written by the writer thread, read until the write has committed
+        self.flushing = {}
+        # the games not written yet, in order, as (pid_1, username_1, pid_2, username_2, winner)
+        self.games = []
+        self.has_pending = threading.Event()
+        threading.Thread(target=self.run_writer, daemon=True).start()
+
+    @staticmethod
+    def connect(path):
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def get(self, pid):
+        """
+        return: (username, rating, games, wins) of the player, None for a player never rated
+        """
+        with self.lock:
+            record = self.pending.get(pid) or self.flushing.get(pid)
+            if record is None:
+                record = self.conn.execute(
+                    'SELECT username, rating, games, wins FROM ratings WHERE pid = ?', (pid,)
+                ).fetchone()
+        return record
+
+    def get_rating(self, pid):
+        record = self.get(pid)
+        return DEFAULT_RATING if record is None else record[1]
+
+    def record_game(self, player_1, player_2, winner):
+        """
+        Update the ratings of both players of a finished game
+        winner - the result of Game.get_winner: 0 for a tie, 1 or 2 for the player who won
+        return: the new ratings of player 1 and player 2
+        """
+        with self.lock:
+            records = {player_1.pid: self.get(player_1.pid), player_2.pid: self.get(player_2.pid)}
+            game = (player_1.pid, player_1.username, player_2.pid, player_2.username, winner)
+            apply_game(records, game)
+            self.pending.update(records)
+            self.games.append(game)
+            self.has_pending.set()
+        return records[player_1.pid][1], records[player_2.pid][1]
+
+    def run_writer(self):
+        while True:
+            self.has_pending.wait()
+            self.has_pending.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print('WRITING THE RATINGS FAILED, RETRYING: %s' % e)
+                self.has_pending.set()
+            # let the changes of other games join this write
+            time.sleep(self.flush_interval)
+
+    def flush(self):
+        """
+        Write all queued rating changes in one transaction.
+        The queue is taken under the lock, the transaction runs without it.
+        """
+        with self.writer_lock:
+            with self.lock:
+                games, self.games = self.games, []
+                if not games:
+                    return
+                self.flushing, self.pending = self.pending, {}
+            conn = self.writer_conn
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                # the ratings as other workers may have written them, before the games
+                before = {}
+                for game in games:
+                    for pid in (game[0], game[2]):
+                        if pid not in before:
+                            before[pid] = conn.execute(
+                                'SELECT username, rating, games, wins FROM ratings WHERE pid = ?', (pid,)
+                            ).fetchone()
+                records = dict(before)
+                for game in games:
+                    apply_game(records, game)
+                deltas = {}
+                for pid, record in records.items():
+                    if before[pid] is not None:
+                        deltas[get_bucket(before[pid][1])] = deltas.get(get_bucket(before[pid][1]), 0) - 1
+                    deltas[get_bucket(record[1])] = deltas.get(get_bucket(record[1]), 0) + 1
+                conn.executemany(
+                    'INSERT OR REPLACE INTO ratings (pid, username, rating, games, wins) VALUES (?, ?, ?, ?, ?)',
+                    [(pid,) + record for pid, record in records.items()]
+                )
+                tree_deltas = {}
+                for bucket, delta in deltas.items():
+                    if delta:
+                        for i in tree_path_up(bucket):
+                            tree_deltas[i] = tree_deltas.get(i, 0) + delta
+                conn.executemany(
+                    'UPDATE rating_tree SET n = n + ? WHERE i = ?', [(delta, i) for i, delta in tree_deltas.items() if delta]
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                with self.lock:
+                    # keep the games for the next write, in order, and the newer ratings over the older ones
+                    self.games = games + self.games
+                    self.pending = dict(self.flushing, **self.pending)
+                    self.flushing = {}
+                raise
+            with self.lock:
+                # the database has the ratings now, with the games of the other workers
+                self.flushing = {}
+
+    def count_up_to(self, bucket):
+        """
+        Number of rated players with a rounded rating in a bucket up to this one
+        """
+        path = tree_path_down(bucket)
+        return self.conn.execute(
+            'SELECT coalesce(sum(n), 0) FROM rating_tree WHERE i IN (%s)' % ','.join('?' * len(path)), path
+        ).fetchone()[0]
+
+    def count(self):
+        with self.lock:
+            return self.count_up_to(MAX_RATING + 1)
+
+    def rebuild_tree(self):
+        """
+        Recount the players per rating point from the ratings table, after loading ratings in bulk
+        """
+        counts = [0] * (MAX_RATING + 2)
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for rating, in self.conn.execute('SELECT rating FROM ratings'):
+                counts[get_bucket(rating)] += 1
+            # each node holds the sum of the counts below it in the tree
+            tree = counts[:]
+            for i in range(1, MAX_RATING + 2):
+                parent = i + (i & -i)
+                if parent <= MAX_RATING + 1:
+                    tree[parent] += tree[i]
+            self.conn.executemany('UPDATE rating_tree SET n = ? WHERE i = ?', [(tree[i], i) for i in range(1, MAX_RATING + 2)])
+            self.conn.execute('COMMIT')
+
+    def rank(self, pid):
+        """
+        return: {'pid', 'rating', 'rank', 'total'} of the player, rank None for a player never rated
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT rating FROM ratings WHERE pid = ?', (pid,)).fetchone()
+            total = self.count()
+            if row is None:
+                return {'pid': pid, 'rating': DEFAULT_RATING, 'rank': None, 'total': total}
+            # one more than the players with a higher rating
+            return {'pid': pid, 'rating': round(row[0]), 'rank': total - self.count_up_to(get_bucket(row[0])) + 1,
+                    'total': total}
+
+    def top(self, limit=100):
+        """
+        return: the players with the highest ratings, as
+            [{'pid', 'username', 'rating', 'rank', 'games', 'wins'}, ]
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT pid, username, rating, games, wins FROM ratings ORDER BY rating DESC, pid LIMIT ?', (limit,)
+            ).fetchall()
+        players = []
+        for i, (pid, username, rating, games, wins) in enumerate(rows):
+            if i > 0 and get_bucket(rating) == get_bucket(rows[i - 1][2]):
+                rank = players[-1]['rank']
+            else:
+                rank = i + 1
+            players.append({'pid': pid, 'username': username, 'rating': round(rating), 'rank': rank,
+                            'games': games, 'wins': wins})
+        return players
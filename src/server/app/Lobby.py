@@ -0,0 +1,102 @@
+import threading
+from bisect import bisect_right, insort
+
+
+class LobbyFeed:
+    """
+    The available players in the lobby, with a presence version and the
+    changes since the last published version.
+    Changes are coalesced per player until drain() is called, so a player who
+    joins and leaves within one tick costs subscribers nothing.
+    Safe to use from several threads, each method holds the lock of the feed.
+    """
+    def __init__(self):
+        # key: pid
+        # value: a dict generate from Player.to_dict(), like {'pid': xxx, 'username':xxx}
+        self.players = {}
+        # all pids in order, for cursor-based pages
+        self.sorted_pids = []
+        self.version = 0
+        # key: pid
+        # value: whether the player was available at the last published version
+        self.pending = {}
+        # key: pid
+        # value: 'left' or 'busy' for players no longer available
+        self.removed_status = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, pid):
+        return pid in self.players
+
+    def __len__(self):
+        return len(self.players)
+
+    def add(self, pid, player):
+        """
+        The player is available in the lobby
+        """
+        with self.lock:
+            self.pending.setdefault(pid, pid in self.players)
+            if pid not in self.players:
+                insort(self.sorted_pids, pid)
+            self.players[pid] = player
+            self.removed_status.pop(pid, None)
+
+    def remove(self, pid, status):
+        """
+        The player is no longer available
+        status - 'left' if the player has gone offline, 'busy' if the player is in a game
+        """
+        with self.lock:
+            if pid not in self.players:
+                return
+            self.pending.setdefault(pid, True)
+            del self.players[pid]
+            i = bisect_right(self.sorted_pids, pid) - 1
+            del self.sorted_pids[i]
+            self.removed_status[pid] = status
+
+    def snapshot(self, cursor=None, limit=100):
+        """
+        Return one page of available players after the cursor
+        return:
+            {'version': int, 'players': [player, ], 'next_cursor': pid or None for the last page}
+        """
+        with self.lock:
+            start = 0 if cursor is None else bisect_right(self.sorted_pids, cursor)
+            pids = self.sorted_pids[start:start + limit]
+            if start + limit < len(self.sorted_pids):
+                next_cursor = pids[-1]
+            else:
+                next_cursor = None
+            return {
+                'version': self.version,
+                'players': [self.players[pid] for pid in pids],
+                'next_cursor': next_cursor
+            }
+
+    def drain(self):
+        """
+        Publish the coalesced changes as a new presence version
+        return:
+            {'version': int, 'joined': [player, ], 'left': [pid, ], 'busy': [pid, ]},
+            or None if nothing has changed
+        """
+        joined = []
+        left = []
+        busy = []
+        with self.lock:
+            for pid, was_available in self.pending.items():
+                if pid in self.players:
+                    joined.append(self.players[pid])
+                elif was_available:
+                    if self.removed_status[pid] == 'busy':
+                        busy.append(pid)
+                    else:
+                        left.append(pid)
+            self.pending = {}
+            self.removed_status = {}
+            if not (joined or left or busy):
+                return None
+            self.version += 1
+            return {'version': self.version, 'joined': joined, 'left': left, 'busy': busy}
@@ -0,0 +1,148 @@
+"""
+The matchmaking queue: players who want a game now, paired by rating.
+
+A waiting player accepts opponents within a rating window that widens with the time
+spent in the queue, so that nobody waits forever when there is no close opponent.
+The waiting players are kept per rating point, with a Fenwick tree of their number
+per rating point like app.Leaderboard: joining, leaving and finding the nearest
+ratings below and above a player take log2(MAX_RATING) steps, however many players
+are waiting.
+"""
+
+import threading
+
+from app.Leaderboard import MAX_RATING, get_bucket
+
+
+# rating difference accepted when joining the queue
+BASE_WINDOW = 50
+# how much the accepted difference grows per second of waiting
+WINDOW_PER_SECOND = 25
+MAX_WINDOW = 1000
+
+N_BUCKETS = MAX_RATING + 1
+# the largest power of two not above N_BUCKETS, where the search of the Fenwick tree starts
+TOP_STEP = 1 << N_BUCKETS.bit_length() - 1
+
+
+def search_window(waited):
+    """
+    The rating difference accepted after waiting for some seconds
+    """
+    return min(BASE_WINDOW + WINDOW_PER_SECOND * waited, MAX_WINDOW)
+
+
+class MatchQueue:
+    """
+    The waiting players of this process, safe to use from several threads
+    """
+    def __init__(self):
+        # key: pid, in the order of joining
+        # value: (rating, time of joining)
+        self.players = {}
+        # the waiting players of every rating point, see app.Leaderboard.get_bucket
+        # key: bucket
+        # value: dict of the pids, in the order of joining
+        self.buckets = {}
+        # Fenwick tree of the number of waiting players per bucket, from 1 to N_BUCKETS
+        self.tree = [0] * (N_BUCKETS + 1)
+        self.lock = threading.Lock()
+
+    def __contains__(self, pid):
+        return pid in self.players
+
+    def __len__(self):
+        return len(self.players)
+
+    def join(self, pid, rating, now):
+        with self.lock:
+            self._leave(pid)
+            self.players[pid] = (rating, now)
+            bucket = get_bucket(rating)
+            self.buckets.setdefault(bucket, {})[pid] = None
+            self.add_count(bucket, 1)
+
+    def leave(self, pid):
+        """
+        return: whether the player was waiting
+        """
+        with self.lock:
+            return self._leave(pid)
+
+    def _leave(self, pid):
+        entry = self.players.pop(pid, None)
+        if entry is None:
+            return False
+        bucket = get_bucket(entry[0])
+        pids = self.buckets[bucket]
+        del pids[pid]
+        if not pids:
+            del self.buckets[bucket]
+        self.add_count(bucket, -1)
+        return True
+
+    def waiting(self):
+        """
+        return: the pids of the waiting players, the longest waiting first
+        """
+        with self.lock:
+            return list(self.players)
+
+    def add_count(self, bucket, delta):
+        while bucket <= N_BUCKETS:
+            self.tree[bucket] += delta
+            bucket += bucket & -bucket
+
+    def count_up_to(self, bucket):
+        """
+        Number of waiting players in the buckets up to this one
+        """
+        n = 0
+        while bucket > 0:
+            n += self.tree[bucket]
+            bucket -= bucket & -bucket
+        return n
+
+    def find_bucket(self, k):
+        """
+        The bucket of the k-th waiting player in the order of the ratings, from 1
+        """
+        bucket, step = 0, TOP_STEP
+        while step:
+            if bucket + step <= N_BUCKETS and self.tree[bucket + step] < k:
+                bucket += step
+                k -= self.tree[bucket]
+            step >>= 1
+        return bucket + 1
+
+    def find_opponent(self, pid, now):
+        """
+        Pair a waiting player with the nearest rating that is within the window of either player.
+        return: the pid of the opponent, both players have left the queue; None if nobody is close enough
+        """
+        with self.lock:
+            if pid not in self.players:
+                return None
+            rating, joined = self.players[pid]
+            bucket = get_bucket(rating)
+            # the longest waiting player of the same rating, else the nearest players below and above
+            candidates = [next((other for other in self.buckets[bucket] if other != pid), None)]
+            if candidates[0] is None:
+                candidates = []
+                below = self.count_up_to(bucket - 1)
+                if below:
+                    candidates.append(next(iter(self.buckets[self.find_bucket(below)])))
+                if below + 1 < len(self.players):
+                    candidates.append(next(iter(self.buckets[self.find_bucket(below + 2)])))
+            best = None
+            for other in candidates:
+                other_rating, other_joined = self.players[other]
+                distance = abs(other_rating - rating)
+                window = max(search_window(now - joined), search_window(now - other_joined))
+                if distance <= window and (best is None or distance < best[0]):
+                    best = (distance, other)
+            if best is None:
+                return None
+            self._leave(pid)
+            self._leave(best[1])
+            return best[1]
@@ -0,0 +1,138 @@
+"""
+Message queues that carry emits and room changes between worker processes.
+
+Each worker delivers to its own clients and publishes every emit on the queue; the
+other workers read it back and deliver to theirs, so any worker can emit to any
+player or game room. Redis uses the managers of python-socketio, the SQLite queue
+is a table polled by every worker, for a single host without a Redis server.
+"""
+
+import asyncio
+import sqlite3
+import time
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+
+# how often a worker polls the SQLite queue, in seconds
+POLL_INTERVAL = 0.005
+# how long a message is kept in the SQLite queue, in seconds
+MESSAGE_TTL = 60
+
+QUEUE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    created REAL NOT NULL,
+    data TEXT NOT NULL
+)
+'''
+
+
+class SQLiteQueue:
+    """
+    The messages table, with one connection for publishing and one per listener
+    """
+    def __init__(self, path, channel):
+        self.path = path
+        self.channel = channel
+        self.publisher = self.connect()
+        self.publisher.execute(QUEUE_SCHEMA)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        return conn
+
+    def publish(self, data):
+        self.publisher.execute(
+            'INSERT INTO messages (channel, created, data) VALUES (?, ?, ?)', (self.channel, time.time(), data)
+        )
+
+    def open_listener(self):
+        return SQLiteListener(self)
+
+
+class SQLiteListener:
+    """
+    Reads the messages of one channel in order, starting after the newest message at creation
+    """
+    def __init__(self, queue):
+        self.queue = queue
+        self.conn = queue.connect()
+        self.last_id = self.conn.execute('SELECT coalesce(max(id), 0) FROM messages').fetchone()[0]
+        self.next_cleanup = time.time() + MESSAGE_TTL
+
+    def read(self):
+        """
+        Return the new messages, and drop the expired ones once in a while
+        """
+        rows = self.conn.execute(
+            'SELECT id, data FROM messages WHERE id > ? AND channel = ? ORDER BY id', (self.last_id, self.queue.channel)
+        ).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        if time.time() > self.next_cleanup:
+            self.conn.execute('DELETE FROM messages WHERE created < ?', (time.time() - MESSAGE_TTL,))
+            self.next_cleanup = time.time() + MESSAGE_TTL
+        return [data for _, data in rows]
+
+
+class SQLiteManager(socketio.PubSubManager):
+    """
+    Client manager of the threaded server on the SQLite queue
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.queue = SQLiteQueue(path, channel)
+
+    def _publish(self, data):
+        self.queue.publish(self.json.dumps(data))
+
+    def _listen(self):
+        listener = self.queue.open_listener()
+        while True:
+            for data in listener.read():
+                yield data
+            time.sleep(POLL_INTERVAL)
+
+
+class AsyncSQLiteManager(AsyncPubSubManager):
+    """
+    Client manager of the asyncio server on the SQLite queue
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.queue = SQLiteQueue(path, channel)
+
+    async def _publish(self, data):
+        self.queue.publish(self.json.dumps(data))
+
+    async def _listen(self):
+        listener = self.queue.open_listener()
+        while True:
+            for data in listener.read():
+                yield data
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def get_client_manager(url, asyncio_mode=False):
+    """
+    Return the client manager for the message queue at url, None for a single worker
+        ''                 - no queue
+        'sqlite:///<path>' - the SQLite queue in the database file at path
+        'redis://...'      - Redis through python-socketio, needs the redis package
+    """
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        return AsyncSQLiteManager(path) if asyncio_mode else SQLiteManager(path)
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.AsyncRedisManager(url) if asyncio_mode else socketio.RedisManager(url)
+    raise ValueError('Unsupported message queue: ' + url)
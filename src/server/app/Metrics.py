@@ -0,0 +1,181 @@
+"""
+Counters of the server, exposed in the Prometheus text format.
+
+Every handler call is counted per event, with its errors and a latency histogram.
+The events dropped before their handler, over the rate limit or out of turn, are counted per reason.
+Each thread writes only to its own shard, so recording takes no lock; the shards
+are merged when the metrics are scraped. The numbers are per process, with several
+workers each of them reports its own.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+
+# upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class Shard:
+    """
+    The counters written by one thread
+    """
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latency_sum = defaultdict(float)
+        # key: event
+        # value: count of calls per bucket, the last one for slower calls
+        self.histograms = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        # key: (event, reason)
+        # value: count of events dropped before their handler
+        self.dropped = defaultdict(int)
+        self.emits = 0
+
+    def merge(self, other):
+        # the other shard may be written meanwhile, it is only read here
+        for event, n in list(other.calls.items()):
+            self.calls[event] += n
+            self.latency_sum[event] += other.latency_sum.get(event, 0.0)
+            histogram = self.histograms[event]
+            for i, n_bucket in enumerate(other.histograms.get(event, ())):
+                histogram[i] += n_bucket
+        for event, n in list(other.errors.items()):
+            self.errors[event] += n
+        for key, n in list(other.dropped.items()):
+            self.dropped[key] += n
+        self.emits += other.emits
+
+
+class Metrics:
+    def __init__(self):
+        self.local = threading.local()
+        # the shards of live threads, and the sum of the shards of finished threads
+        self.shards = []
+        self.retired = Shard()
+        # only taken when a thread records for the first time and when scraping
+        self.lock = threading.Lock()
+        # key: name
+        # value: (help text, function returning the value)
+        self.gauges = {}
+        self.last_scrape = (time.time(), 0)
+
+    def _shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = Shard(threading.current_thread())
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def observe(self, event, seconds, error=False):
+        shard = self._shard()
+        shard.calls[event] += 1
+        shard.latency_sum[event] += seconds
+        shard.histograms[event][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error:
+            shard.errors[event] += 1
+
+    def count_emit(self):
+        self._shard().emits += 1
+
+    def count_dropped(self, event, reason):
+        self._shard().dropped[(event, reason)] += 1
+
+    def add_gauge(self, name, help_text, get_value):
+        self.gauges[name] = (help_text, get_value)
+
+    def instrument(self, event, handler):
+        """
+        Wrap a handler to record its calls, errors and latency under the event name
+        """
+        def run(*args):
+            start = time.perf_counter()
+            try:
+                result = handler(*args)
+            except BaseException:
+                self.observe(event, time.perf_counter() - start, error=True)
+                raise
+            self.observe(event, time.perf_counter() - start)
+            return result
+        return run
+
+    def collect(self):
+        """
+        Merge all shards into one, shards of finished threads are folded into the retired shard
+        """
+        total = Shard()
+        with self.lock:
+            alive = []
+            for shard in self.shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self.retired.merge(shard)
+            self.shards = alive
+            total.merge(self.retired)
+            for shard in alive:
+                total.merge(shard)
+        return total
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format
+        """
+        total = self.collect()
+        lines = [
+            '# HELP yahtzee_events_total Socket.IO events handled.',
+            '# TYPE yahtzee_events_total counter',
+        ]
+        for event in sorted(total.calls):
+            lines.append('yahtzee_events_total{event="%s"} %d' % (event, total.calls[event]))
+        lines += [
+            '# HELP yahtzee_event_errors_total Socket.IO events whose handler raised an error.',
+            '# TYPE yahtzee_event_errors_total counter',
+        ]
+        for event in sorted(total.calls):
+            lines.append('yahtzee_event_errors_total{event="%s"} %d' % (event, total.errors[event]))
+        lines += [
+            '# HELP yahtzee_event_latency_seconds Time spent in the handler of each event.',
+            '# TYPE yahtzee_event_latency_seconds histogram',
+        ]
+        for event in sorted(total.calls):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), total.histograms[event]):
+                cumulative += n
+                lines.append('yahtzee_event_latency_seconds_bucket{event="%s",le="%s"} %d' % (event, bound, cumulative))
+            lines.append('yahtzee_event_latency_seconds_sum{event="%s"} %.6f' % (event, total.latency_sum[event]))
+            lines.append('yahtzee_event_latency_seconds_count{event="%s"} %d' % (event, total.calls[event]))
+
+        lines += [
+            '# HELP yahtzee_events_dropped_total Socket.IO events dropped before their handler, by reason.',
+            '# TYPE yahtzee_events_dropped_total counter',
+        ]
+        for (event, reason), n in sorted(total.dropped.items()):
+            lines.append('yahtzee_events_dropped_total{event="%s",reason="%s"} %d' % (event, reason, n))
+
+        now = time.time()
+        last_time, last_emits = self.last_scrape
+        self.last_scrape = (now, total.emits)
+        lines += [
+            '# HELP yahtzee_emits_total Messages sent to clients.',
+            '# TYPE yahtzee_emits_total counter',
+            'yahtzee_emits_total %d' % total.emits,
+            '# HELP yahtzee_emits_per_second Messages sent to clients per second since the last scrape.',
+            '# TYPE yahtzee_emits_per_second gauge',
+            'yahtzee_emits_per_second %.3f' % ((total.emits - last_emits) / max(now - last_time, 1e-9)),
+        ]
+        for name, (help_text, get_value) in self.gauges.items():
+            lines += [
+                '# HELP %s %s' % (name, help_text),
+                '# TYPE %s gauge' % name,
+                '%s %d' % (name, get_value()),
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of this process
+metrics = Metrics()
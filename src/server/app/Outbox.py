@@ -0,0 +1,122 @@
+"""
+Coalescing of the emits of the handlers, sent once per tick.
+
+The outbox wraps the transport of the handlers. Emits are queued in the order they are made,
+whatever their target, a session or a room, and sent together every tick, still in that order:
+the messages to the same target that follow each other are sent in one frame, as they are if
+there is one, or as one 'batch' event with the list of [event, data] in order, which the clients
+unpack and pass to their own handlers. A message following one of the same event to the same
+target may be merged into it before it is sent, see merge.
+
+A session gets the messages of its rooms and its own in the order they were emitted, since the
+outbox does not know who is in a room. For the same reason, the urgent events skip the tick
+after all the messages waiting have been sent, and so does entering, leaving or closing a room.
+"""
+
+import threading
+
+
+class Outbox:
+    """
+    A transport sending the emits of another transport once per tick.
+    transport - the transport sending the frames, see app.Transport
+    tick      - seconds between two flushes
+    urgent    - the events sent at once
+    merge     - merge(event, earlier, later) returns the data of one message replacing both,
+                None to send both
+    """
+    def __init__(self, transport, tick, urgent=(), merge=None):
+        self.transport = transport
+        self.tick = tick
+        self.urgent = frozenset(urgent)
+        self.merge = merge
+        # the messages not sent yet, as [target, event, data] in the order of the emits,
+        # the target a sid or a room
+        self.messages = []
+        self.lock = threading.Lock()
+        # held while sending, so that the messages leave in order
+        self.send_lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.messages)
+
+    def emit(self, event, data=None, to=None):
+        if event in self.urgent:
+            with self.send_lock:
+                self._send_waiting()
+                self.transport.emit(event, data, to=to)
+            return
+        with self.lock:
+            if self.messages and self.merge is not None:
+                last = self.messages[-1]
+                if last[0] == to and last[1] == event:
+                    merged = self.merge(event, last[2], data)
+                    if merged is not None:
+                        last[2] = merged
+                        return
+            self.messages.append([to, event, data])
+
+    def _send_waiting(self):
+        """
+        Send the messages waiting, one frame per run of messages to the same target.
+        The caller holds the send lock
+        """
+        with self.lock:
+            messages, self.messages = self.messages, []
+        start = 0
+        while start < len(messages):
+            to = messages[start][0]
+            end = start + 1
+            while end < len(messages) and messages[end][0] == to:
+                end += 1
+            self._send(to, [[event, data] for _, event, data in messages[start:end]])
+            start = end
+
+    def _send(self, to, queue):
+        if len(queue) == 1:
+            self.transport.emit(queue[0][0], queue[0][1], to=to)
+        else:
+            self.transport.emit('batch', queue, to=to)
+
+    def flush(self):
+        """
+        Send all waiting messages
+        """
+        with self.send_lock:
+            self._send_waiting()
+
+    def run(self):
+        """
+        Flush every tick. A background task, it yields the delay before each flush
+        """
+        while True:
+            yield self.tick
+            self.flush()
+
+    def enter_room(self, sid, room):
+        with self.send_lock:
+            self._send_waiting()
+            self.transport.enter_room(sid, room)
+
+    def leave_room(self, sid, room):
+        with self.send_lock:
+            self._send_waiting()
+            self.transport.leave_room(sid, room)
+
+    def close_room(self, room):
+        with self.send_lock:
+            self._send_waiting()
+            self.transport.close_room(room)
+
+    def get_remote_addr(self, sid):
+        return self.transport.get_remote_addr(sid)
+
+    def is_connected(self, sid):
+        return self.transport.is_connected(sid)
+
+    def start_task(self, task, *args):
+        self.transport.start_task(task, *args)
+
+    def register(self, handlers):
+        self.transport.register(handlers)
@@ -1,8 +1,14 @@
 from app.RandomName import get_random_name
 
 
+# the rating of a new player
+DEFAULT_RATING = 1500
+
+
 class Player:
-    def __init__(self, pid, sid=None, ip=None, username=None):
+    __slots__ = ('pid', 'sid', 'ip', 'username', 'game_id', 'is_bot', 'rating', 'codec')
+
+    def __init__(self, pid, sid=None, ip=None, username=None, is_bot=False, rating=DEFAULT_RATING):
         self.pid = pid
         self.sid = sid
         self.ip = ip
@@ -11,6 +17,12 @@ class Player:
         else:
             self.username = username
         self.game_id = '-1'
+        # a bot player has no session, it is driven by the server
+        self.is_bot = is_bot
+        # skill rating, used to pair players in the matchmaking queue
+        self.rating = rating
+        # the name of the wire format the session has registered with, chosen by the handlers with app.Codec.negotiate
+        self.codec = 'json'
 
     def __str__(self):
         return "Player:{pid:%s, sid:%s, ip:%s, username:%s, game_id:%s}" \
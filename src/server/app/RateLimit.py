@@ -0,0 +1,83 @@
+"""
+Per-session rate limits of the events, with token buckets.
+
+Every session has a bucket per limited event. A bucket holds up to burst tokens, each event
+takes one, and the bucket refills at rate tokens per second. The refill is lazy: a bucket only
+keeps its tokens and the time they were counted, and catches up with the elapsed time when the
+next event arrives. A check is O(1) however many sessions there are, and a bucket that has
+refilled completely is the same as no bucket, so the buckets of quiet sessions are dropped.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token buckets per session and event.
+    limits - {event: (tokens per second, burst)}, the events not in it share the bucket of
+             limits['default']; an event limited to None is never limited
+    scale  - multiplies all rates and bursts, 0 turns the limits off
+    """
+    def __init__(self, limits, scale=1.0):
+        self.enabled = scale > 0
+        self.limits = {
+            event: None if limit is None else (limit[0] * scale, limit[1] * scale) for event, limit in limits.items()
+        }
+        # key: (sid, event), event is 'default' for the events sharing it
+        # value: [tokens, time they were counted]
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, sid, event, now=None):
+        """
+        Take a token for an event of the session
+        return: whether the event is within the limit
+        """
+        if not self.enabled:
+            return True
+        if event not in self.limits:
+            event = 'default'
+        limit = self.limits[event]
+        if limit is None:
+            return True
+        rate, burst = limit
+        if now is None:
+            now = time.monotonic()
+        key = (sid, event)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = [burst - 1, now]
+                return True
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def forget(self, sid):
+        """
+        Drop the buckets of a session that has disconnected
+        """
+        with self.lock:
+            for event in self.limits:
+                self.buckets.pop((sid, event), None)
+
+    def sweep(self, now=None):
+        """
+        Drop the buckets that have refilled completely, they would allow a full burst anyway
+        return: the number of buckets dropped
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            full = [
+                key for key, (tokens, counted) in self.buckets.items()
+                if tokens + (now - counted) * self.limits[key[1]][0] >= self.limits[key[1]][1]
+            ]
+            for key in full:
+                del self.buckets[key]
+        return len(full)
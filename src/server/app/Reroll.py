@@ -0,0 +1,68 @@
+from itertools import combinations_with_replacement
+from math import factorial
+
+from app.Scoring import DICE_MULTISETS, N_DICE_MULTISETS, get_dice_id
+
+
+# all 462 multisets of dice that can be kept before a re-roll (0 to 5 dice), as sorted tuples
+KEEP_MULTISETS = tuple(
+    keep for n_keep in range(6) for keep in combinations_with_replacement(range(1, 7), n_keep)
+)
+KEEP_ID = {keep: i for i, keep in enumerate(KEEP_MULTISETS)}
+N_KEEP_MULTISETS = len(KEEP_MULTISETS)
+KEEP_NOTHING = KEEP_ID[()]
+
+# a hold is a 5-bit mask over the dice of a multiset in sorted order
+# bit i set - keep the i-th smallest die
+N_HOLDS = 32
+HOLD_ALL = N_HOLDS - 1
+
+# HOLD_KEEP[dice_id][hold] - the keep id of a hold on a dice multiset
+HOLD_KEEP = tuple(
+    tuple(KEEP_ID[tuple(dice[i] for i in range(5) if hold >> i & 1)] for hold in range(N_HOLDS))
+    for dice in DICE_MULTISETS
+)
+
+
+def _outcome_probability(outcome):
+    """
+    Probability of rolling exactly this multiset with len(outcome) dice
+    """
+    n_ways = factorial(len(outcome))
+    for face in set(outcome):
+        n_ways //= factorial(outcome.count(face))
+    return n_ways / 6 ** len(outcome)
+
+
+def _reroll_outcomes(keep):
+    outcomes = {}
+    for outcome in combinations_with_replacement(range(1, 7), 5 - len(keep)):
+        dice_id = get_dice_id(keep + outcome)
+        outcomes[dice_id] = outcomes.get(dice_id, 0.0) + _outcome_probability(outcome)
+    return tuple(sorted(outcomes.items()))
+
+
+# REROLL_OUTCOMES[keep_id] - all (dice_id, probability) after re-rolling the dice not kept
+REROLL_OUTCOMES = tuple(_reroll_outcomes(keep) for keep in KEEP_MULTISETS)
+
+
+def get_reroll_index(dice, hold):
+    """
+    Translate a hold on the sorted dice back to the positions of the dice in the game
+    return:
+        the list of dice index to roll, from 0 to 4
+    """
+    order = sorted(range(5), key=dice.__getitem__)
+    return [order[i] for i in range(5) if not hold >> i & 1]
+
+
+def get_transition_matrix():
+    """
+    Return the keep-to-dice transition probabilities as a list of N_KEEP_MULTISETS rows,
+    each row with N_DICE_MULTISETS probabilities
+    """
+    matrix = [N_DICE_MULTISETS * [0.0] for _ in range(N_KEEP_MULTISETS)]
+    for keep_id, outcomes in enumerate(REROLL_OUTCOMES):
+        for dice_id, probability in outcomes:
+            matrix[keep_id][dice_id] = probability
+    return matrix
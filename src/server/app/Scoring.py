@@ -0,0 +1,74 @@
+from itertools import combinations_with_replacement, product
+
+
+# all 13 scorings in the order of the score sheet
+CATEGORIES = (
+    '1s', '2s', '3s', '4s', '5s', '6s',
+    '3-of-a-kind', '4-of-a-kind', 'full-house', 'small-straight', 'large-straight', 'yahtzee', 'chance'
+)
+CATEGORY_INDEX = {key: i for i, key in enumerate(CATEGORIES)}
+N_CATEGORIES = len(CATEGORIES)
+N_UPPER = 6
+# an upper section of at least UPPER_BONUS_THRESHOLD points scores UPPER_BONUS more
+UPPER_BONUS_THRESHOLD = 63
+UPPER_BONUS = 35
+
+
+def score_counts(counts):
+    """
+    Calculate all 13 scorings of one roll following the rules of Game.
+    Only used to build the table below.
+    Parameters:
+        counts: number of dice showing each face, counts[0] for 1 ... counts[5] for 6
+    return:
+        a tuple with the 13 scores in the order of CATEGORIES
+    """
+    dice_sum = sum((face + 1) * n for face, n in enumerate(counts))
+    present = [n >= 1 for n in counts]
+
+    upper = tuple((face + 1) * n for face, n in enumerate(counts))
+    three_of_a_kind = dice_sum if max(counts) >= 3 else 0
+    four_of_a_kind = dice_sum if max(counts) >= 4 else 0
+    full_house = 25 if (3 in counts) and (2 in counts) else 0
+    small_straight = 0
+    for start in range(3):
+        if all(present[start:start + 4]):
+            small_straight = 30
+    large_straight = 0
+    for start in range(2):
+        if all(n == 1 for n in counts[start:start + 5]):
+            large_straight = 40
+    yahtzee = 50 if max(counts) == 5 else 0
+    chance = dice_sum
+
+    return upper + (three_of_a_kind, four_of_a_kind, full_house, small_straight, large_straight, yahtzee, chance)
+
+
+# all 252 distinct dice multisets as sorted tuples, the index in this tuple is the dice id
+DICE_MULTISETS = tuple(combinations_with_replacement(range(1, 7), 5))
+N_DICE_MULTISETS = len(DICE_MULTISETS)
+
+# number of dice showing each face for every dice id
+DICE_COUNTS = tuple(tuple(dice.count(face) for face in range(1, 7)) for dice in DICE_MULTISETS)
+
+# scores of all 13 scorings for every dice id
+# SCORE_TABLE[dice_id][CATEGORY_INDEX[key]]
+SCORE_TABLE = tuple(score_counts(counts) for counts in DICE_COUNTS)
+
+# map every ordered 5-dice tuple (7776 of them) to its dice id
+_SORTED_ID = {dice: i for i, dice in enumerate(DICE_MULTISETS)}
+DICE_ID = {dice: _SORTED_ID[tuple(sorted(dice))] for dice in product(range(1, 7), repeat=5)}
+
+
+def get_dice_id(dice):
+    """
+    Return the dice id of 5 dice in any order
+    """
+    return DICE_ID[tuple(dice)]
+
+
+def get_scores(dice):
+    """
+    Return all 13 scores of 5 dice in the order of CATEGORIES
+    """
+    return SCORE_TABLE[DICE_ID[tuple(dice)]]
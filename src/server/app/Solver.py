@@ -0,0 +1,123 @@
+"""
+Offline retrograde dynamic-programming solver for solitaire Yahtzee under the rules of Game.
+It writes the bot table memory-mapped by app.Bot.
+
+Usage (from src/server):
+    python -m app.Solver [output_path]
+"""
+
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from app.Scoring import SCORE_TABLE, N_CATEGORIES, N_UPPER, UPPER_BONUS, UPPER_BONUS_THRESHOLD
+from app.Reroll import HOLD_KEEP, KEEP_NOTHING, get_transition_matrix
+from app.Bot import (
+    BOT_TABLE_PATH, TABLE_MAGIC, TABLE_VERSION, HEADER_FORMAT, HEADER_SIZE,
+    N_MASKS, FULL_MASK, N_UPPER_TOTALS, N_STATES, N_STAGES, FILL_STAGE
+)
+
+
+def get_reachable_upper_totals(mask):
+    """
+    Return the set of capped upper section subtotals reachable with the upper scorings filled in mask
+    """
+    totals = {0}
+    for face in range(1, N_UPPER + 1):
+        if mask >> (face - 1) & 1:
+            totals = {min(UPPER_BONUS_THRESHOLD, t + face * n) for t in totals for n in range(6)}
+    return totals
+
+
+def get_reachable_states():
+    """
+    Return a boolean array over all states, true if the state can occur before the game is over
+    """
+    reachable = np.zeros((N_MASKS, N_UPPER_TOTALS), dtype=bool)
+    upper_masks = (1 << N_UPPER) - 1
+    totals = [sorted(get_reachable_upper_totals(m)) for m in range(1 << N_UPPER)]
+    for mask in range(FULL_MASK):
+        reachable[mask, totals[mask & upper_masks]] = True
+    return reachable
+
+
+def solve(path=BOT_TABLE_PATH, verbose=True):
+    scores = np.array(SCORE_TABLE, dtype=np.float64)
+    n_dice = scores.shape[0]
+    transition_t = np.array(get_transition_matrix(), dtype=np.float64).T
+    first_roll = transition_t[:, KEEP_NOTHING]
+    hold_keep = np.array(HOLD_KEEP, dtype=np.intp)
+    uppers = np.arange(N_UPPER_TOTALS)
+
+    reachable = get_reachable_states()
+    index = np.full(N_STATES, -1, dtype=np.int32)
+    index[reachable.reshape(-1)] = np.arange(int(reachable.sum()), dtype=np.int32)
+    n_rows = int(reachable.sum())
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, TABLE_MAGIC, TABLE_VERSION, N_STATES, n_dice, n_rows).ljust(HEADER_SIZE, b'\0'))
+    ev_offset = HEADER_SIZE + index.nbytes
+    policy_offset = ev_offset + 4 * N_STATES
+    file_size = policy_offset + n_rows * N_STAGES * n_dice
+    with open(tmp_path, 'r+b') as f:
+        f.truncate(file_size)
+    np.memmap(tmp_path, dtype='<i4', mode='r+', offset=HEADER_SIZE, shape=(N_STATES,))[:] = index
+    policy = np.memmap(tmp_path, dtype=np.uint8, mode='r+', offset=policy_offset, shape=(n_rows, N_STAGES, n_dice))
+
+    # ev[mask, upper] - expected score of the rest of the game, the full sheet scores nothing more
+    ev = np.zeros((N_MASKS, N_UPPER_TOTALS), dtype=np.float64)
+    start_time = time.time()
+
+    # a superset of a mask is always a larger number, so the masks are solved from the full sheet back
+    for mask in range(FULL_MASK - 1, -1, -1):
+        states = reachable[mask]
+        if not states.any():
+            continue
+        open_keys = [c for c in range(N_CATEGORIES) if not mask >> c & 1]
+
+        # after the last roll: fill the scoring with the best score plus expected rest of the game
+        fill_values = np.empty((len(open_keys), N_UPPER_TOTALS, n_dice))
+        for j, c in enumerate(open_keys):
+            next_ev = ev[mask | 1 << c]
+            if c < N_UPPER:
+                new_upper = np.minimum(UPPER_BONUS_THRESHOLD, uppers[:, None] + scores[None, :, c]).astype(np.intp)
+                bonus = UPPER_BONUS * ((uppers[:, None] < UPPER_BONUS_THRESHOLD) & (new_upper >= UPPER_BONUS_THRESHOLD))
+                fill_values[j] = scores[None, :, c] + bonus + next_ev[new_upper]
+            else:
+                fill_values[j] = scores[None, :, c] + next_ev[:, None]
+        best_fill = fill_values.argmax(axis=0)
+        value = fill_values.max(axis=0)
+        stage_policy = [None, None, np.array(open_keys, dtype=np.uint8)[best_fill]]
+
+        # the second and then the first roll: keep the hold with the best expected value
+        for stage in (1, 0):
+            keep_values = value @ transition_t
+            hold_values = keep_values[:, hold_keep]
+            stage_policy[stage] = hold_values.argmax(axis=2).astype(np.uint8)
+            value = hold_values.max(axis=2)
+
+        ev[mask] = value @ first_roll
+        rows = index[mask * N_UPPER_TOTALS:(mask + 1) * N_UPPER_TOTALS][states]
+        for stage in range(N_STAGES):
+            policy[rows, stage] = stage_policy[stage][states]
+
+        if verbose and mask % 512 == 0:
+            print('mask %5d / %d solved, %.1fs' % (FULL_MASK - mask, FULL_MASK, time.time() - start_time))
+
+    policy.flush()
+    del policy
+    np.memmap(tmp_path, dtype='<f4', mode='r+', offset=ev_offset, shape=(N_STATES,))[:] = ev.reshape(-1)
+    os.replace(tmp_path, path)
+    if verbose:
+        print('Expected score of the optimal strategy: %.4f' % ev[0, 0])
+        print('Bot table written to %s (%d states, %.1f MB)' % (path, n_rows, file_size / 1e6))
+    return ev[0, 0]
+
+
+if __name__ == '__main__':
+    solve(sys.argv[1] if len(sys.argv) > 1 else BOT_TABLE_PATH)
@@ -0,0 +1,497 @@
+"""
+Where the server keeps its players, sessions, games and lobby.
+
+    MemoryStore - plain dicts in this process, for a single worker
+    SQLiteStore - one SQLite database shared by all worker processes on the host
+
+Both expose the same maps, used by app.Handlers like dicts:
+    online_players[pid] -> Player, sid_to_pid[sid] -> pid, ongoing_games[game_id] -> Game,
+    spectators[game_id] -> number of spectators of the game
+a lobby with the interface of LobbyFeed and a match_queue with the interface of MatchQueue.
+
+An object read from the SQLite store is a copy: after changing a Player or a Game,
+the handlers write it back with save_player / save_game. Every event runs in
+store.transaction(), which makes it atomic across the workers.
+
+The threads of the in-memory store do not share a transaction. A handler holds the locks of
+the players and the game it changes instead, with store.lock(player_key(pid), game_key(game_id)),
+so that the events of different games run in parallel. The changes that decide between racing
+events are the operations of StateOperations: claim_players, end_game and rehome_session.
+"""
+
+import json
+import sqlite3
+import struct
+import threading
+from array import array
+from contextlib import contextmanager, nullcontext
+
+from app.Game import Game
+from app.Bot import BOT_LEVELS
+from app.Codec import CODECS
+from app.Dice import DiceStream
+from app.Player import Player
+from app.Lobby import LobbyFeed
+from app.Matchmaking import MatchQueue, search_window
+from app.Scoring import N_CATEGORIES
+
+
+def player_key(pid):
+    return ('player', pid)
+
+
+def game_key(game_id):
+    return ('game', game_id)
+
+
+# number of locks shared by the keys of the in-memory store
+N_LOCK_STRIPES = 256
+
+
+class KeyLocks:
+    """
+    Locks of the players and games, a key takes one of n_stripes locks by its hash.
+    The locks of one call are taken in the order of the stripes, so two threads never wait for
+    each other in a cycle. A thread takes all the locks it needs at once: while it holds some,
+    it can only take the same keys again.
+    """
+    def __init__(self, n_stripes=N_LOCK_STRIPES):
+        self.stripes = [threading.Lock() for _ in range(n_stripes)]
+        # held: the keys held by the thread
+        self.local = threading.local()
+
+    @contextmanager
+    def hold(self, keys):
+        held = getattr(self.local, 'held', None)
+        if held is not None:
+            if not held.issuperset(keys):
+                raise RuntimeError('Cannot lock %s while holding %s, take all the keys at once.' % (keys, held))
+            yield
+            return
+        stripes = sorted({hash(key) % len(self.stripes) for key in keys})
+        for i in stripes:
+            self.stripes[i].acquire()
+        self.local.held = set(keys)
+        try:
+            yield
+        finally:
+            self.local.held = None
+            for i in reversed(stripes):
+                self.stripes[i].release()
+
+
+class StateOperations:
+    """
+    The changes of the state that decide between racing events, the same for both stores.
+    Each one holds the locks of what it changes, the caller may already hold them.
+    """
+    def claim_players(self, *pids):
+        """
+        Take available players out of the lobby and the matchmaking queue for a new game
+        return: whether all of them were available, none is claimed otherwise
+        """
+        with self.lock(*[player_key(pid) for pid in pids]):
+            if len(set(pids)) < len(pids) or not all(pid in self.lobby for pid in pids):
+                return False
+            for pid in pids:
+                self.lobby.remove(pid, 'busy')
+                self.match_queue.leave(pid)
+            return True
+
+    def end_game(self, game_id):
+        """
+        Remove a game and its spectator count
+        return: whether the game was ongoing, only one of the events ending a game gets True
+        """
+        with self.lock(game_key(game_id)):
+            if game_id not in self.ongoing_games:
+                return False
+            del self.ongoing_games[game_id]
+            if game_id in self.spectators:
+                del self.spectators[game_id]
+            return True
+
+    def rehome_session(self, pid, sid):
+        """
+        Move an online player to a new session, the previous session stays known until it disconnects
+        return: the previous sid of the player, None if the player is not online
+        """
+        with self.lock(player_key(pid)):
+            player = self.online_players.get(pid)
+            if player is None:
+                return None
+            previous_sid = player.sid
+            player.set_sid(sid)
+            self.sid_to_pid[sid] = pid
+            self.save_player(player)
+            return previous_sid
+
+
+class MemoryStore(StateOperations):
+    """
+    All state in dicts of this process. Objects are shared, nothing needs to be saved back.
+    """
+    def __init__(self):
+        self.online_players = {}
+        self.sid_to_pid = {}
+        self.ongoing_games = {}
+        self.spectators = {}
+        self.lobby = LobbyFeed()
+        self.match_queue = MatchQueue()
+        self.key_locks = KeyLocks()
+
+    def transaction(self):
+        return nullcontext()
+
+    def lock(self, *keys):
+        """
+        Hold the locks of the keys, see KeyLocks
+        """
+        return self.key_locks.hold(keys)
+
+    def save_player(self, player):
+        pass
+
+    def save_game(self, game):
+        pass
+
+
+# compact records of players and games
+# strings are stored as a uint16 length and utf-8 bytes, NO_STRING stands for None
+NO_STRING = 0xffff
+# flags, scores, filled, upper_sec_total, bonus, total, dice, dice_id (-1 for None), round, active_player, i_roll, version,
+# seed and position of the dice stream
+GAME_FORMAT = '<B%dh2H2h2h2h5bhBBBIQHB' % (2 * N_CATEGORIES)
+GAME_SIZE = struct.calcsize(GAME_FORMAT)
+
+
+def pack_strings(*strings):
+    parts = []
+    for s in strings:
+        if s is None:
+            parts.append(struct.pack('<H', NO_STRING))
+        else:
+            data = s.encode('utf-8')
+            parts.append(struct.pack('<H', len(data)))
+            parts.append(data)
+    return b''.join(parts)
+
+
+def unpack_strings(data, offset, n):
+    strings = []
+    for _ in range(n):
+        length, = struct.unpack_from('<H', data, offset)
+        offset += 2
+        if length == NO_STRING:
+            strings.append(None)
+        else:
+            strings.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+    return strings
+
+
+# is_bot and the index of the codec shifted by one bit, rating
+PLAYER_FORMAT = '<Bh'
+PLAYER_SIZE = struct.calcsize(PLAYER_FORMAT)
+
+
+def encode_player(player):
+    flags = player.is_bot | CODECS.index(player.codec) << 1
+    return struct.pack(PLAYER_FORMAT, flags, player.rating) + \
+        pack_strings(player.pid, player.sid, player.ip, player.username, player.game_id)
+
+
+def decode_player(data):
+    flags, rating = struct.unpack_from(PLAYER_FORMAT, data)
+    pid, sid, ip, username, game_id = unpack_strings(data, PLAYER_SIZE, 5)
+    player = Player(pid, sid=sid, ip=ip, username=username, is_bot=bool(flags & 1), rating=rating)
+    player.game_id = game_id
+    player.codec = CODECS[flags >> 1]
+    return player
+
+
+def encode_game(game):
+    """
+    The state of the game and who plays in it. The sessions of the players are not
+    part of the game, they are looked up in online_players.
+    """
+    # bits 2-3: the level of the bot, 0 between two players, else its index in BOT_LEVELS plus one
+    bot_level = 0 if game.bot_level is None else BOT_LEVELS.index(game.bot_level) + 1
+    flags = game.p1.is_bot | game.p2.is_bot << 1 | bot_level << 2
+    dice_id = -1 if game.dice_id is None else game.dice_id
+    return struct.pack(
+        GAME_FORMAT, flags, *game.scores, *game.filled, *game.upper_sec_total, *game.bonus, *game.total,
+        *game.dice, dice_id, game.round, game.active_player, game.i_roll, game.version,
+        game.seed, *game.dice_stream.get_position()
+    ) + pack_strings(game.game_id, game.p1.pid, game.p1.username, game.p2.pid, game.p2.username)
+
+
+def decode_game(data):
+    values = struct.unpack_from(GAME_FORMAT, data)
+    game_id, p1_pid, p1_username, p2_pid, p2_username = unpack_strings(data, GAME_SIZE, 5)
+    game = Game.__new__(Game)
+    game.game_id = game_id
+    game.p1 = Player(p1_pid, username=p1_username, is_bot=bool(values[0] & 1))
+    game.p2 = Player(p2_pid, username=p2_username, is_bot=bool(values[0] & 2))
+    game.p1.game_id = game.p2.game_id = game_id
+    game.bot_level = BOT_LEVELS[(values[0] >> 2) - 1] if values[0] >> 2 else None
+    game.n_player = 2
+    i = 1
+    for name, typecode, n in (
+        ('scores', 'h', 2 * N_CATEGORIES), ('filled', 'H', 2), ('upper_sec_total', 'h', 2),
+        ('bonus', 'h', 2), ('total', 'h', 2), ('dice', 'b', 5)
+    ):
+        setattr(game, name, array(typecode, values[i:i + n]))
+        i += n
+    dice_id, game.round, game.active_player, game.i_roll, game.version, game.seed, block, n_left = values[i:]
+    game.dice_id = None if dice_id < 0 else dice_id
+    game.dice_stream = DiceStream(game.seed, block, n_left)
+    return game
+
+
+class SQLiteMap:
+    """
+    A table of the SQLite store used like a dict
+    """
+    def __init__(self, store, table, encode, decode):
+        self.store = store
+        self.table = table
+        self.encode = encode
+        self.decode = decode
+
+    def get(self, key, default=None):
+        row = self.store.execute('SELECT value FROM %s WHERE key = ?' % self.table, (key,)).fetchone()
+        if row is None:
+            return default
+        return self.decode(row[0])
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.store.execute('SELECT 1 FROM %s WHERE key = ?' % self.table, (key,)).fetchone() is not None
+
+    def __setitem__(self, key, value):
+        self.store.execute('INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table, (key, self.encode(value)))
+
+    def __delitem__(self, key):
+        if self.store.execute('DELETE FROM %s WHERE key = ?' % self.table, (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __len__(self):
+        return self.store.execute('SELECT count(*) FROM %s' % self.table).fetchone()[0]
+
+    def items(self):
+        return [(key, self.decode(value)) for key, value in self.store.execute('SELECT key, value FROM %s' % self.table)]
+
+
+class SQLiteLobby:
+    """
+    LobbyFeed kept in the SQLite store, so that all workers publish one presence feed.
+    Whichever worker drains the pending changes first publishes them to every subscriber.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, pid):
+        return self.store.execute('SELECT 1 FROM lobby WHERE pid = ?', (pid,)).fetchone() is not None
+
+    def __len__(self):
+        return self.store.execute('SELECT count(*) FROM lobby').fetchone()[0]
+
+    @property
+    def players(self):
+        return {pid: json.loads(player) for pid, player in self.store.execute('SELECT pid, player FROM lobby')}
+
+    def get_version(self):
+        return self.store.execute("SELECT value FROM meta WHERE key = 'lobby_version'").fetchone()[0]
+
+    def add(self, pid, player):
+        self.store.execute(
+            'INSERT OR IGNORE INTO lobby_pending (pid, was_available) '
+            'VALUES (?, EXISTS (SELECT 1 FROM lobby WHERE pid = ?))', (pid, pid)
+        )
+        self.store.execute('UPDATE lobby_pending SET status = NULL WHERE pid = ?', (pid,))
+        self.store.execute('INSERT OR REPLACE INTO lobby (pid, player) VALUES (?, ?)', (pid, json.dumps(player)))
+
+    def remove(self, pid, status):
+        if self.store.execute('DELETE FROM lobby WHERE pid = ?', (pid,)).rowcount == 0:
+            return
+        self.store.execute('INSERT OR IGNORE INTO lobby_pending (pid, was_available) VALUES (?, 1)', (pid,))
+        self.store.execute('UPDATE lobby_pending SET status = ? WHERE pid = ?', (status, pid))
+
+    def snapshot(self, cursor=None, limit=100):
+        rows = self.store.execute(
+            'SELECT pid, player FROM lobby WHERE pid > ? ORDER BY pid LIMIT ?', ('' if cursor is None else cursor, limit + 1)
+        ).fetchall()
+        return {
+            'version': self.get_version(),
+            'players': [json.loads(player) for _, player in rows[:limit]],
+            'next_cursor': rows[limit - 1][0] if len(rows) > limit else None
+        }
+
+    def drain(self):
+        joined = []
+        left = []
+        busy = []
+        rows = self.store.execute(
+            'SELECT p.pid, p.was_available, p.status, l.player FROM lobby_pending p LEFT JOIN lobby l ON l.pid = p.pid'
+        ).fetchall()
+        for pid, was_available, status, player in rows:
+            if player is not None:
+                joined.append(json.loads(player))
+            elif was_available:
+                if status == 'busy':
+                    busy.append(pid)
+                else:
+                    left.append(pid)
+        self.store.execute('DELETE FROM lobby_pending')
+        if not (joined or left or busy):
+            return None
+        version = self.get_version() + 1
+        self.store.execute("UPDATE meta SET value = ? WHERE key = 'lobby_version'", (version,))
+        return {'version': version, 'joined': joined, 'left': left, 'busy': busy}
+
+
+class SQLiteMatchQueue:
+    """
+    MatchQueue kept in the SQLite store, so that players on all workers are paired.
+    The index on (rating, pid) finds the nearest opponents.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, pid):
+        return self.store.execute('SELECT 1 FROM match_queue WHERE pid = ?', (pid,)).fetchone() is not None
+
+    def __len__(self):
+        return self.store.execute('SELECT count(*) FROM match_queue').fetchone()[0]
+
+    def join(self, pid, rating, now):
+        self.store.execute('DELETE FROM match_queue WHERE pid = ?', (pid,))
+        self.store.execute('INSERT INTO match_queue (pid, rating, joined) VALUES (?, ?, ?)', (pid, rating, now))
+
+    def leave(self, pid):
+        return self.store.execute('DELETE FROM match_queue WHERE pid = ?', (pid,)).rowcount > 0
+
+    def waiting(self):
+        return [pid for pid, in self.store.execute('SELECT pid FROM match_queue ORDER BY joined')]
+
+    def find_opponent(self, pid, now):
+        rating, joined = self.store.execute('SELECT rating, joined FROM match_queue WHERE pid = ?', (pid,)).fetchone()
+        best = None
+        for sql in (
+            'SELECT rating, pid, joined FROM match_queue WHERE (rating, pid) < (?, ?) ORDER BY rating DESC, pid DESC LIMIT 1',
+            'SELECT rating, pid, joined FROM match_queue WHERE (rating, pid) > (?, ?) ORDER BY rating, pid LIMIT 1',
+        ):
+            row = self.store.execute(sql, (rating, pid)).fetchone()
+            if row is None:
+                continue
+            other_rating, other, other_joined = row
+            distance = abs(other_rating - rating)
+            window = max(search_window(now - joined), search_window(now - other_joined))
+            if distance <= window and (best is None or distance < best[0]):
+                best = (distance, other)
+        if best is None:
+            return None
+        self.leave(pid)
+        self.leave(best[1])
+        return best[1]
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS games (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS spectators (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lobby (pid TEXT PRIMARY KEY, player TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lobby_pending (pid TEXT PRIMARY KEY, was_available INTEGER NOT NULL, status TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (key, value) VALUES ('lobby_version', 0);
+CREATE TABLE IF NOT EXISTS match_queue (pid TEXT PRIMARY KEY, rating INTEGER NOT NULL, joined REAL NOT NULL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS match_queue_rating ON match_queue (rating, pid);
+CREATE INDEX IF NOT EXISTS match_queue_joined ON match_queue (joined);
+'''
+
+# how long a worker waits for another worker to finish its transaction, in seconds
+BUSY_TIMEOUT = 10
+
+
+class SQLiteStore(StateOperations):
+    """
+    All state in one SQLite database in WAL mode, shared by the worker processes.
+    The threads of one worker share its connection, one transaction at a time.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.connection_lock = threading.RLock()
+        self.depth = 0
+        with self.transaction():
+            for statement in SCHEMA.strip().split(';\n'):
+                self.conn.execute(statement)
+
+        self.online_players = SQLiteMap(self, 'players', encode_player, decode_player)
+        self.sid_to_pid = SQLiteMap(self, 'sessions', str, str)
+        self.ongoing_games = SQLiteMap(self, 'games', encode_game, decode_game)
+        self.spectators = SQLiteMap(self, 'spectators', int, int)
+        self.lobby = SQLiteLobby(self)
+        self.match_queue = SQLiteMatchQueue(self)
+
+    def execute(self, sql, parameters=()):
+        return self.conn.execute(sql, parameters)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the block atomically, nested blocks join the outer transaction
+        """
+        with self.connection_lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield
+                finally:
+                    self.depth -= 1
+                return
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.depth = 1
+            try:
+                yield
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            else:
+                self.conn.execute('COMMIT')
+            finally:
+                self.depth = 0
+
+    def lock(self, *keys):
+        """
+        Nothing to lock, the transaction of the event already holds the whole database
+        """
+        return nullcontext()
+
+    def save_player(self, player):
+        self.online_players[player.pid] = player
+
+    def save_game(self, game):
+        self.ongoing_games[game.game_id] = game
+
+
+def open_store(url):
+    """
+    Open the state store from its url
+        'memory'             - MemoryStore
+        'sqlite:///<path>'   - SQLiteStore on the database file at path
+    """
+    if url == 'memory':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError('Unsupported state store: ' + url)
@@ -0,0 +1,79 @@
+"""
+A hashed timer wheel for the timeouts of the server: reconnection grace periods,
+idle games and the periodic session sweep.
+
+Timers are kept in a ring of slots, one slot per tick, so scheduling, cancelling
+and rescheduling a timer are O(1) however many are pending, and each tick only
+looks at the timers of its own slot. A timer further away than one turn of the
+ring waits in its slot until the turn where it is due.
+"""
+
+import threading
+import time
+
+
+class TimerWheel:
+    """
+    Timers identified by a key, each with a value given back when it expires.
+    Scheduling a key again replaces its timer.
+    """
+    def __init__(self, tick=1.0, n_slots=4096):
+        self.tick = tick
+        self.n_slots = n_slots
+        # key: timer key
+        # value: (due tick, value)
+        self.slots = [{} for _ in range(n_slots)]
+        # key: timer key
+        # value: index of its slot
+        self.where = {}
+        self.current = int(time.time() / tick)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, delay, value=None, now=None):
+        """
+        Expire the key after delay seconds, with value
+        """
+        if now is None:
+            now = time.time()
+        # due on the first tick after the deadline, never in the past
+        due = max(int((now + delay) / self.tick) + 1, self.current + 1)
+        with self.lock:
+            self._cancel(key)
+            slot = due % self.n_slots
+            self.slots[slot][key] = (due, value)
+            self.where[key] = slot
+
+    def cancel(self, key):
+        with self.lock:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        slot = self.where.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def expire(self, now=None):
+        """
+        Move the wheel to now
+        return: list of (key, value) of the timers that are due
+        """
+        if now is None:
+            now = time.time()
+        target = int(now / self.tick)
+        expired = []
+        with self.lock:
+            # after a long pause, one turn of the ring visits every slot
+            for t in range(max(self.current + 1, target - self.n_slots + 1), target + 1):
+                slot = self.slots[t % self.n_slots]
+                due_keys = [key for key, (due, _) in slot.items() if due <= target]
+                for key in due_keys:
+                    expired.append((key, slot.pop(key)[1]))
+                    del self.where[key]
+            self.current = max(self.current, target)
+        return expired
@@ -0,0 +1,371 @@
+"""
+Tournaments between bot strategies, to compare a change of the bot with the current one
+before it is deployed.
+
+A strategy chooses the moves of the active player of a Game: called with the game after
+each roll, it returns ('roll', [dice index]) or ('fill', key). play_game plays one game
+between two strategies; test/console_test.py plays it with the moves typed in the console.
+
+The built-in strategies are random, greedy, montecarlo and optimal (see app.BotPool),
+any other one is given as module:function. Every pair of entrants plays each seed twice,
+once in each seat, which reduces the luck of the dice: both seats draw from the one dice
+stream of the seed, so the faces a player gets also depend on the dice rerolled before,
+and the two games of a seed only start with the same roll. The games are spread over a
+pool of processes, started the default way of the platform, and every game sends back
+only its 26 scores. The results are the win rates, the score distributions and how often
+each scoring is filled with more than zero, with 95% confidence intervals.
+
+Usage (from src/server):
+    python -m app.Tournament greedy optimal [more strategies] [--games 2000] [--format round-robin|swiss]
+"""
+
+import argparse
+import importlib
+import math
+import multiprocessing
+import os
+import random
+import struct
+import time
+from itertools import combinations
+
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES, N_CATEGORIES, N_UPPER, UPPER_BONUS, UPPER_BONUS_THRESHOLD
+from app.Bot import load_bot_table
+from app.BotPool import Z_95, choose_greedy, choose_montecarlo, choose_optimal
+
+
+MAX_ROLLS = 3
+MAX_SCORE = 375
+# seeds played by one task of the pool, each seed is two games
+SEEDS_PER_TASK = 25
+# result of one game: the entrant of each seat and the scores of both players, in the order of CATEGORIES
+RESULT_FORMAT = '<2H%db' % (2 * N_CATEGORIES)
+RESULT_SIZE = struct.calcsize(RESULT_FORMAT)
+
+# the strategies built in each worker, loaded once
+# key: strategy spec
+# value: function of the game
+worker_strategies = {}
+
+
+def play_game(game, strategies, moves=None):
+    """
+    Play a game to the end, the strategy of the active player choosing every move after a roll
+    Parameters:
+        strategies: the strategy of player 1 and of player 2
+        moves: a list to add the moves to, to replay the game with app.Game.replay_game
+    return:
+        the winner, as Game.get_winner
+    """
+    game_continue = True
+    while game_continue:
+        strategy = strategies[game.get_active_player()]
+        kind, move = 'roll', [0, 1, 2, 3, 4]
+        while kind == 'roll':
+            if game.get_i_roll() >= MAX_ROLLS or not move:
+                raise ValueError('A strategy can only roll one to five dice, at most %d times a turn.' % MAX_ROLLS)
+            game.roll(move)
+            if moves is not None:
+                moves.append(move)
+            kind, move = strategy(game)
+        game_continue = game.fill(move)
+        if moves is not None:
+            moves.append(move)
+    return game.get_winner()
+
+
+def get_state(game):
+    """
+    The state of the active player: (filled scorings bitmask, upper section subtotal, i_roll, dice)
+    """
+    player_idx = game.get_active_player()
+    return game.filled[player_idx], game.upper_sec_total[player_idx], game.get_i_roll(), game.get_dice()
+
+
+def random_move(game):
+    """
+    Roll random dice or fill a random open scoring, the baseline of the strategies
+    """
+    if game.get_i_roll() < MAX_ROLLS and random.random() < 0.5:
+        return 'roll', random.sample(range(5), random.randint(1, 5))
+    mask = game.filled[game.get_active_player()]
+    return 'fill', random.choice([key for c, key in enumerate(CATEGORIES) if not mask >> c & 1])
+
+
+def load_strategy(spec, budget):
+    """
+    Build a strategy from its name, or from module:function for a strategy written elsewhere
+    Parameters:
+        budget: seconds the Monte Carlo strategy searches for one move
+    """
+    if spec == 'random':
+        return random_move
+    if spec == 'greedy':
+        return lambda game: choose_greedy(*get_state(game))
+    if spec == 'montecarlo':
+        return lambda game: choose_montecarlo(*get_state(game), budget)
+    if spec == 'optimal':
+        table = load_bot_table()
+        if table is None:
+            raise ValueError('The optimal strategy needs the bot table, build it with python -m app.Solver.')
+        return lambda game: choose_optimal(*get_state(game), table)
+    if ':' in spec:
+        module, name = spec.split(':', 1)
+        return getattr(importlib.import_module(module), name)
+    raise ValueError('Unknown strategy: ' + spec)
+
+
+def play_seeds(task):
+    """
+    Play the games of one task in a worker, each seed in both seats
+    Parameters:
+        task: (specs of all entrants, budget, entrant a, entrant b, seeds)
+    return:
+        the results of the games, RESULT_SIZE bytes each
+    """
+    specs, budget, a, b, seeds = task
+    for i in (a, b):
+        if specs[i] not in worker_strategies:
+            worker_strategies[specs[i]] = load_strategy(specs[i], budget)
+    results = []
+    for seed in seeds:
+        for p1, p2 in ((a, b), (b, a)):
+            game = Game(Player('p1', username=specs[p1]), Player('p2', username=specs[p2]), seed=seed)
+            play_game(game, (worker_strategies[specs[p1]], worker_strategies[specs[p2]]))
+            results.append(struct.pack(RESULT_FORMAT, p1, p2, *game.scores))
+    return b''.join(results)
+
+
+def get_total(scores):
+    upper = sum(scores[:N_UPPER])
+    return sum(scores) + (UPPER_BONUS if upper >= UPPER_BONUS_THRESHOLD else 0)
+
+
+def wilson_interval(successes, n):
+    """
+    95% confidence interval of a proportion
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    center = (p + Z_95 ** 2 / (2 * n)) / (1 + Z_95 ** 2 / n)
+    half = Z_95 * math.sqrt(p * (1 - p) / n + Z_95 ** 2 / (4 * n * n)) / (1 + Z_95 ** 2 / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class TournamentStats:
+    """
+    The results of all games, added one game at a time
+    """
+    def __init__(self, specs):
+        self.specs = specs
+        n = len(specs)
+        self.games = [0] * n
+        # wins count 1 and ties 1/2
+        self.points = [0.0] * n
+        self.histograms = [[0] * (MAX_SCORE + 1) for _ in range(n)]
+        # games with a score above zero in each scoring
+        self.hits = [[0] * N_CATEGORIES for _ in range(n)]
+        self.category_totals = [[0] * N_CATEGORIES for _ in range(n)]
+        # head to head points and games of the entrant of the row against the entrant of the column
+        self.pair_points = [[0.0] * n for _ in range(n)]
+        self.pair_games = [[0] * n for _ in range(n)]
+
+    def add_results(self, data):
+        for offset in range(0, len(data), RESULT_SIZE):
+            values = struct.unpack_from(RESULT_FORMAT, data, offset)
+            seats = values[:2]
+            sheets = values[2:2 + N_CATEGORIES], values[2 + N_CATEGORIES:]
+            totals = [get_total(sheet) for sheet in sheets]
+            for seat, i in enumerate(seats):
+                other = seats[1 - seat]
+                point = 1.0 if totals[seat] > totals[1 - seat] else 0.5 if totals[seat] == totals[1 - seat] else 0.0
+                self.games[i] += 1
+                self.points[i] += point
+                self.pair_games[i][other] += 1
+                self.pair_points[i][other] += point
+                self.histograms[i][totals[seat]] += 1
+                for c, score in enumerate(sheets[seat]):
+                    self.hits[i][c] += score > 0
+                    self.category_totals[i][c] += score
+
+    def get_match_points(self, a, b):
+        return self.pair_points[a][b]
+
+    def get_score_summary(self, i):
+        """
+        return: mean, half width of its 95% confidence interval, std, and the 10th, 50th and 90th percentiles
+        """
+        histogram = self.histograms[i]
+        n = sum(histogram)
+        mean = sum(score * count for score, count in enumerate(histogram)) / n
+        std = math.sqrt(sum(count * (score - mean) ** 2 for score, count in enumerate(histogram)) / n)
+        percentiles = []
+        for p in (10, 50, 90):
+            rank, seen = p / 100 * n, 0
+            for score, count in enumerate(histogram):
+                seen += count
+                if seen >= rank:
+                    percentiles.append(score)
+                    break
+        return (mean, Z_95 * std / math.sqrt(n), std, *percentiles)
+
+    def report(self):
+        names = ['%d:%s' % (i, spec) for i, spec in enumerate(self.specs)]
+        width = max(12, max(len(name) for name in names))
+        print('%-*s %7s %20s %16s %6s %5s %5s %5s' % (
+            width, 'entrant', 'games', 'win rate (95% CI)', 'score (95% CI)', 'std', 'p10', 'p50', 'p90'
+        ))
+        for i, name in enumerate(names):
+            if not self.games[i]:
+                continue
+            low, high = wilson_interval(self.points[i], self.games[i])
+            mean, half, std, p10, p50, p90 = self.get_score_summary(i)
+            print('%-*s %7d %6.1f%% (%4.1f-%4.1f) %7.1f +- %5.2f %6.1f %5d %5d %5d' % (
+                width, name, self.games[i], 100 * self.points[i] / self.games[i], 100 * low, 100 * high,
+                mean, half, std, p10, p50, p90
+            ))
+
+        print()
+        print('Win rate of the row against the column:')
+        print(' ' * width + ''.join(' %12s' % name[:12] for name in names))
+        for i, name in enumerate(names):
+            cells = []
+            for j in range(len(names)):
+                if self.pair_games[i][j]:
+                    cells.append(' %11.1f%%' % (100 * self.pair_points[i][j] / self.pair_games[i][j]))
+                else:
+                    cells.append(' %12s' % '-')
+            print('%-*s%s' % (width, name, ''.join(cells)))
+
+        print()
+        print('Scorings filled with more than zero, % of the games (95% CI half width), and mean score:')
+        print('%-16s' % 'scoring' + ''.join(' %20s' % name[:20] for name in names))
+        for c, key in enumerate(CATEGORIES):
+            cells = []
+            for i in range(len(names)):
+                n = self.games[i]
+                if not n:
+                    cells.append(' %20s' % '-')
+                    continue
+                low, high = wilson_interval(self.hits[i][c], n)
+                cells.append(' %5.1f%% (%4.1f) %5.1f' % (
+                    100 * self.hits[i][c] / n, 100 * (high - low) / 2, self.category_totals[i][c] / n
+                ))
+            print('%-16s' % key + ''.join(cells))
+
+
+def get_tasks(specs, budget, pairs, n_seeds, rng):
+    tasks = []
+    for a, b in pairs:
+        seeds = [rng.getrandbits(64) for _ in range(n_seeds)]
+        for start in range(0, n_seeds, SEEDS_PER_TASK):
+            tasks.append((specs, budget, a, b, seeds[start:start + SEEDS_PER_TASK]))
+    return tasks
+
+
+def run_tasks(pool, tasks, stats):
+    for data in pool.imap_unordered(play_seeds, tasks):
+        stats.add_results(data)
+
+
+def get_swiss_pairs(standings, played, byes):
+    """
+    Pair the entrants with the closest standings who have not met yet
+    Parameters:
+        standings: the entrants, best first
+        played: set of the pairs (a, b), a < b, who have met
+        byes: set of the entrants who have had a bye
+    return:
+        the pairs of this round, and the entrant with a bye or None
+    """
+    waiting = list(standings)
+    pairs = []
+    bye = None
+    if len(waiting) % 2:
+        # the last entrant without a bye yet sits out and gets the points of a win
+        bye = next((i for i in reversed(waiting) if i not in byes), waiting[-1])
+        waiting.remove(bye)
+    while waiting:
+        a = waiting.pop(0)
+        opponent = next((b for b in waiting if (min(a, b), max(a, b)) not in played), waiting[0])
+        waiting.remove(opponent)
+        pairs.append((min(a, opponent), max(a, opponent)))
+    return pairs, bye
+
+
+def run_tournament(specs, n_games, tournament_format='round-robin', n_rounds=None, n_workers=None,
+                   budget=0.01, seed=None):
+    """
+    Play a tournament between the strategies
+    Parameters:
+        specs: the strategy of each entrant, see load_strategy
+        n_games: games of every match, each seed is played in both seats
+        tournament_format: 'round-robin', every entrant meets every other one,
+                           or 'swiss', n_rounds rounds between the entrants with the closest standings
+    return:
+        a TournamentStats with all games, and the standings as a list of (match points, entrant)
+    """
+    rng = random.Random(seed)
+    n_seeds = max(1, (n_games + 1) // 2)
+    stats = TournamentStats(specs)
+    match_points = [0.0] * len(specs)
+    with multiprocessing.Pool(n_workers or os.cpu_count()) as pool:
+        if tournament_format == 'round-robin':
+            rounds = [list(combinations(range(len(specs)), 2))]
+        elif tournament_format == 'swiss':
+            rounds = [None] * (n_rounds or max(1, math.ceil(math.log2(len(specs)))))
+        else:
+            raise ValueError('The tournament format must be round-robin or swiss.')
+        played = set()
+        byes = set()
+        for pairs in rounds:
+            bye = None
+            if pairs is None:
+                standings = sorted(range(len(specs)), key=lambda i: (-match_points[i], i))
+                pairs, bye = get_swiss_pairs(standings, played, byes)
+            before = [[stats.get_match_points(a, b), stats.get_match_points(b, a)] for a, b in pairs]
+            run_tasks(pool, get_tasks(specs, budget, pairs, n_seeds, rng), stats)
+            for (a, b), (points_a, points_b) in zip(pairs, before):
+                points_a = stats.get_match_points(a, b) - points_a
+                points_b = stats.get_match_points(b, a) - points_b
+                match_points[a] += 1.0 if points_a > points_b else 0.5 if points_a == points_b else 0.0
+                match_points[b] += 1.0 if points_b > points_a else 0.5 if points_a == points_b else 0.0
+                played.add((a, b))
+            if bye is not None:
+                byes.add(bye)
+                match_points[bye] += 1.0
+    standings = sorted(((points, i) for i, points in enumerate(match_points)), key=lambda item: (-item[0], item[1]))
+    return stats, standings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play a tournament between bot strategies.')
+    parser.add_argument('strategies', nargs='+', help='random, greedy, montecarlo, optimal or module:function')
+    parser.add_argument('--games', type=int, default=2000, help='games of every match, half in each seat')
+    parser.add_argument('--format', default='round-robin', help='round-robin or swiss')
+    parser.add_argument('--rounds', type=int, help='rounds of a swiss tournament, log2 of the entrants by default')
+    parser.add_argument('--workers', type=int, help='processes playing the games, one per core by default')
+    parser.add_argument('--budget', type=float, default=0.01, help='seconds the montecarlo strategy searches for a move')
+    parser.add_argument('--seed', type=int, help='seed of the tournament, the same seed plays the same dice')
+    options = parser.parse_args()
+    if len(options.strategies) < 2:
+        parser.error('a tournament needs at least two strategies')
+
+    start_time = time.time()
+    stats, standings = run_tournament(
+        options.strategies, options.games, options.format, options.rounds, options.workers, options.budget, options.seed
+    )
+    print('%d games in %.1fs' % (sum(stats.games) // 2, time.time() - start_time))
+    print()
+    stats.report()
+    print()
+    print('Standings, match points:')
+    for points, i in standings:
+        print('  %4.1f  %d:%s' % (points, i, options.strategies[i]))
+
+
+if __name__ == '__main__':
+    main()
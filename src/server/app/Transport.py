@@ -0,0 +1,145 @@
+"""
+The Socket.IO server behind the handlers in app.Handlers.
+
+The handlers are plain functions and only talk to the transport, so the same
+event protocol is served by the threaded Flask-SocketIO server (server.py) and
+by the asyncio python-socketio server (server_async.py).
+
+Background tasks are generator functions that yield the number of seconds to
+sleep before their next step, so they run unchanged on threads and on asyncio.
+"""
+
+import contextvars
+
+from app.Metrics import metrics
+
+
+class ThreadingTransport:
+    """
+    Flask-SocketIO in threading mode: every call goes straight to the server
+    """
+    def __init__(self, socketio):
+        self.socketio = socketio
+
+    def emit(self, event, data=None, to=None):
+        metrics.count_emit()
+        self.socketio.emit(event, data, to=to)
+
+    def enter_room(self, sid, room):
+        self.socketio.server.enter_room(sid, room, namespace='/')
+
+    def leave_room(self, sid, room):
+        self.socketio.server.leave_room(sid, room, namespace='/')
+
+    def close_room(self, room):
+        self.socketio.server.close_room(room, namespace='/')
+
+    def get_remote_addr(self, sid):
+        return self.socketio.server.get_environ(sid, namespace='/').get('REMOTE_ADDR')
+
+    def is_connected(self, sid):
+        return self.socketio.server.manager.is_connected(sid, '/')
+
+    def start_task(self, task, *args):
+        def run():
+            for delay in task(*args):
+                self.socketio.sleep(delay)
+        self.socketio.start_background_task(run)
+
+    def register(self, handlers):
+        """
+        Register the handlers of app.Handlers as Flask-SocketIO event handlers
+        """
+        from flask import request
+
+        def make_handler(event, handler):
+            if event in ('connect', 'disconnect'):
+                return lambda *args: handler(request.sid)
+            return lambda *args: handler(request.sid, *args)
+
+        for event, handler in handlers.items():
+            self.socketio.on_event(event, make_handler(event, handler))
+
+
+# the calls to the server made by the handler running in the current task
+_outbox = contextvars.ContextVar('outbox', default=None)
+
+
+class AsyncTransport:
+    """
+    python-socketio AsyncServer: the handlers stay synchronous, their calls to
+    the server are queued while they run and awaited in order right after
+    """
+    def __init__(self, sio):
+        self.sio = sio
+
+    def _queue(self, call, *args, **kwargs):
+        outbox = _outbox.get()
+        if outbox is None:
+            # called outside of a handler, send it on its own
+            self.sio.start_background_task(call, *args, **kwargs)
+        else:
+            outbox.append((call, args, kwargs))
+
+    async def _flush(self, outbox):
+        for call, args, kwargs in outbox:
+            await call(*args, **kwargs)
+
+    async def _run(self, step, *args):
+        """
+        Run one synchronous step, then send everything it queued
+        """
+        outbox = []
+        token = _outbox.set(outbox)
+        try:
+            return step(*args)
+        finally:
+            _outbox.reset(token)
+            await self._flush(outbox)
+
+    def emit(self, event, data=None, to=None):
+        metrics.count_emit()
+        self._queue(self.sio.emit, event, data, to=to)
+
+    def enter_room(self, sid, room):
+        self._queue(self.sio.enter_room, sid, room)
+
+    def leave_room(self, sid, room):
+        self._queue(self.sio.leave_room, sid, room)
+
+    def close_room(self, room):
+        self._queue(self.sio.close_room, room)
+
+    def get_remote_addr(self, sid):
+        client = self.sio.get_environ(sid)['asgi.scope'].get('client')
+        return client[0] if client else None
+
+    def is_connected(self, sid):
+        return self.sio.manager.is_connected(sid, '/')
+
+    def start_task(self, task, *args):
+        async def run():
+            steps = task(*args)
+            done = object()
+            while True:
+                delay = await self._run(next, steps, done)
+                if delay is done:
+                    return
+                await self.sio.sleep(delay)
+        self.sio.start_background_task(run)
+
+    def register(self, handlers):
+        """
+        Register the handlers of app.Handlers as AsyncServer event handlers
+        """
+        def make_handler(event, handler):
+            if event in ('connect', 'disconnect'):
+                async def run(sid, *args):
+                    await self._run(handler, sid)
+            else:
+                async def run(sid, *args):
+                    await self._run(handler, sid, *args)
+            return run
+
+        for event, handler in handlers.items():
+            self.sio.on(event, make_handler(event, handler))
@@ -0,0 +1,72 @@
+"""
+The game server on the asyncio python-socketio server, run by uvicorn.
+It serves the same handlers as server.py without a thread per connection.
+
+Usage (from src/server):
+    python server_async.py
+or with any ASGI server:
+    uvicorn server_async:app --host 0.0.0.0 --port 5000
+
+With YAHTZEE_WORKERS=N, uvicorn starts N worker processes on the same port. They share the
+state store and pass emits through the message queue, so each of them can host any game.
+Clients then have to connect with the websocket transport, long-polling requests of one
+session could reach different workers.
+
+The handlers are loaded when the server starts, not when this module is imported: the
+worker processes of the bot pool import it again, and must not load the state of the server.
+"""
+
+import socketio
+import uvicorn
+
+from app import Config
+from app.Transport import AsyncTransport
+from app.MessageQueue import get_client_manager
+from app.Metrics import metrics
+
+
+sio = socketio.AsyncServer(
+    async_mode='asgi', cors_allowed_origins=Config.CORS_ORIGIN,
+    client_manager=get_client_manager(Config.MESSAGE_QUEUE, asyncio_mode=True)
+)
+
+
+async def metrics_app(scope, receive, send):
+    """
+    Serve the counters of the events and the state of this worker at /metrics for Prometheus,
+    the same route as server.py
+    """
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/metrics':
+        status, body = 200, metrics.render().encode('utf-8')
+    else:
+        status, body = 404, b'Not Found'
+    await send({
+        'type': 'http.response.start', 'status': status,
+        'headers': [(b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def start():
+    """
+    Register the handlers and start the server, at the startup of the ASGI app
+    """
+    from app import Handlers
+    Handlers.set_transport(AsyncTransport(sio))
+    Handlers.start_server()
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=metrics_app, on_startup=start)
+
+
+def main():
+    if Config.WORKERS > 1:
+        uvicorn.run('server_async:app', host=Config.HOST, port=Config.PORT, workers=Config.WORKERS, log_level='warning')
+    else:
+        uvicorn.run(app, host=Config.HOST, port=Config.PORT, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
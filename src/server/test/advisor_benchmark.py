@@ -0,0 +1,42 @@
+"""
+This code measures the hints for the dice to keep: the time of a hint for random dice
+and score sheets, when its values are already cached and when they have to be looked up.
+
+Usage (from src/server):
+    python test/advisor_benchmark.py [n_hints]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+start = time.perf_counter()
+from app.Advisor import get_advice, get_hold_values
+from app.Scoring import N_CATEGORIES
+import_time = time.perf_counter() - start
+
+
+def per_call(requests):
+    start = time.perf_counter()
+    for dice, i_roll, filled in requests:
+        get_advice(dice, i_roll, filled)
+    return (time.perf_counter() - start) / len(requests) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('Transition tables built at import: %.1f ms' % (import_time * 1e3))
+    requests = [
+        ([random.randint(1, 6) for _ in range(5)], random.randint(1, 2), random.randrange((1 << N_CATEGORIES) - 1))
+        for _ in range(n)
+    ]
+    print('Hint, not cached: %6.1f us' % per_call(requests))
+    print('Hint, cached:     %6.1f us' % per_call(requests[-get_hold_values.cache_info().maxsize:]))
+    print(get_hold_values.cache_info())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+This code checks the hints of app.Advisor against an enumeration of every roll of the dice:
+for sampled dice and score sheets, the expected score of each open scoring for each hold must
+be the mean score of all the ordered rolls of the dice not held, playing the best hold for the
+scoring at the next roll. It also checks hand-counted hints, like keeping a large straight,
+and that the cached hints are the ones computed without the cache.
+
+Usage (from src/server):
+    python test/advisor_test.py
+or with pytest:
+    python -m pytest test/advisor_test.py
+"""
+
+import os
+import random
+import sys
+from functools import lru_cache
+from itertools import product
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Advisor import get_advice, get_hold_values
+from app.Scoring import CATEGORIES, CATEGORY_INDEX, N_CATEGORIES, SCORE_TABLE, get_dice_id
+
+
+@lru_cache(maxsize=None)
+def reference_values(kept, rolls_left):
+    """
+    The expected score of every scoring, keeping the dice kept and rolling the others,
+    then with rolls left after this one, keeping the best dice for each scoring
+    """
+    totals = [0.0] * N_CATEGORIES
+    outcomes = list(product(range(1, 7), repeat=5 - len(kept)))
+    for outcome in outcomes:
+        dice = tuple(sorted(kept + outcome))
+        if rolls_left == 1:
+            values = SCORE_TABLE[get_dice_id(dice)]
+        else:
+            values = reference_best(dice, rolls_left - 1)
+        for c in range(N_CATEGORIES):
+            totals[c] += values[c]
+    return tuple(total / len(outcomes) for total in totals)
+
+
+@lru_cache(maxsize=None)
+def reference_best(dice, rolls_left):
+    """
+    The expected score of every scoring with the best of the 32 holds on the sorted dice for it
+    """
+    holds = [reference_values(tuple(dice[i] for i in range(5) if hold >> i & 1), rolls_left) for hold in range(32)]
+    return tuple(max(values[c] for values in holds) for c in range(N_CATEGORIES))
+
+
+def test_against_enumeration(n_samples=300):
+    rng = random.Random(1)
+    for _ in range(n_samples):
+        dice = [rng.randint(1, 6) for _ in range(5)]
+        i_roll = rng.randint(1, 2)
+        filled = rng.randrange((1 << N_CATEGORIES) - 1)
+        advice = get_advice(dice, i_roll, filled)
+        assert len(advice) == 32
+        assert len({tuple(sorted(hint['index'])) for hint in advice}) == 32
+        for hint in advice:
+            kept = tuple(sorted(dice[i] for i in range(5) if i not in hint['index']))
+            expected = reference_values(kept, 3 - i_roll)
+            assert set(hint['scores']) == {key for key in CATEGORIES if not filled >> CATEGORY_INDEX[key] & 1}
+            for key, value in hint['scores'].items():
+                assert abs(value - expected[CATEGORY_INDEX[key]]) < 0.006, (dice, i_roll, hint['index'], key)
+
+
+def best_index(advice, key):
+    return max(advice, key=lambda hint: hint['scores'][key])['index']
+
+
+def test_hand_counted():
+    # a large straight made after the first roll: keep it, roll nothing
+    advice = get_advice([6, 2, 4, 3, 5], 1, 0)
+    assert best_index(advice, 'large-straight') == []
+    assert next(hint for hint in advice if hint['index'] == [])['scores']['large-straight'] == 40
+    # a yahtzee kept with two rolls left scores 50 as a yahtzee and 25 in the 5s
+    advice = get_advice([5, 5, 5, 5, 5], 2, 0)
+    keep_all = next(hint for hint in advice if hint['index'] == [])
+    assert keep_all['scores']['yahtzee'] == 50 and keep_all['scores']['5s'] == 25
+    # four 2s and a 6 with one roll left: rolling the 6 makes a yahtzee one time in six
+    advice = get_advice([2, 6, 2, 2, 2], 2, 0)
+    assert best_index(advice, 'yahtzee') == [1]
+    assert next(hint for hint in advice if hint['index'] == [1])['scores']['yahtzee'] == round(50 / 6, 2)
+    # the filled scorings get no hint
+    filled = 1 << CATEGORY_INDEX['yahtzee'] | 1 << CATEGORY_INDEX['chance']
+    assert all(set(hint['scores']).isdisjoint({'yahtzee', 'chance'}) for hint in get_advice([1, 2, 3, 4, 6], 1, filled))
+
+
+def test_cache():
+    rng = random.Random(2)
+    get_hold_values.cache_clear()
+    for _ in range(200):
+        dice_id = rng.randrange(len(SCORE_TABLE))
+        rolls_left = rng.randint(1, 2)
+        open_mask = rng.randrange(1, 1 << N_CATEGORIES)
+        cached = get_hold_values(dice_id, rolls_left, open_mask)
+        assert get_hold_values(dice_id, rolls_left, open_mask) is cached
+        assert cached == get_hold_values.__wrapped__(dice_id, rolls_left, open_mask)
+    assert get_hold_values.cache_info().hits >= 200
+
+
+def main():
+    test_against_enumeration()
+    test_hand_counted()
+    test_cache()
+    print('The hints match an enumeration of the rolls, with and without the cache.')
+
+
+if __name__ == '__main__':
+    main()
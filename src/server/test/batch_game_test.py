@@ -0,0 +1,99 @@
+"""
+This code checks that app.BatchGame follows the rules of app.Game: seeded batches are played
+with the greedy policy and with random holds and scorings, and every roll and scoring is
+played again on one Game per batch game. After each move, the score sheets, upper subtotals,
+bonuses, totals, rounds and turns must be the same.
+
+Usage (from src/server):
+    python test/batch_game_test.py [n_games]
+or with pytest:
+    python -m pytest test/batch_game_test.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.BatchGame import BatchGame, GreedyPolicy
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES, N_CATEGORIES
+
+
+class RandomPolicy:
+    """
+    Random holds and random open scorings, to reach every scoring and bonus
+    """
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def choose_reroll(self, batch):
+        return self.rng.random(batch.dice.shape) < 0.5
+
+    def choose_key(self, batch):
+        weights = np.where(batch.get_open(), self.rng.random((batch.n_games, N_CATEGORIES)), -1)
+        return weights.argmax(axis=1)
+
+
+def check_same(batch, games):
+    for g, game in enumerate(games):
+        for player in range(2):
+            sheet = game.scores[player * N_CATEGORIES:(player + 1) * N_CATEGORIES].tolist()
+            assert batch.scores[g, player].tolist() == sheet, (g, player)
+            assert batch.filled[g, player] == game.filled[player], (g, player)
+            assert batch.upper_sec_total[g, player] == game.upper_sec_total[player], (g, player)
+            assert batch.bonus[g, player] == game.bonus[player], (g, player)
+            assert batch.total[g, player] == game.total[player], (g, player)
+        assert batch.round[g] == game.get_round(), g
+        assert batch.active_player[g] == game.get_active_player(), g
+        assert batch.i_roll[g] == game.get_i_roll(), g
+
+
+def play_both(n_games, policy, seed):
+    """
+    Play a batch to the end with the policy and the same dice and scorings on Game
+    return: the winners of the batch
+    """
+    batch = BatchGame(n_games, seed=seed)
+    games = [Game(Player('p1-%d' % g), Player('p2-%d' % g)) for g in range(n_games)]
+    game_not_over = np.ones(n_games, dtype=bool)
+    while game_not_over.all():
+        reroll = np.ones(batch.dice.shape, dtype=bool)
+        for i_roll in range(3):
+            if i_roll > 0:
+                reroll = policy.choose_reroll(batch)
+                if not reroll.any():
+                    break
+            batch.roll(reroll)
+            for g in np.flatnonzero(reroll.any(axis=1)):
+                games[g].apply_roll(batch.dice[g].tolist())
+            check_same(batch, games)
+        keys = policy.choose_key(batch)
+        game_not_over = batch.fill(keys)
+        for g, game in enumerate(games):
+            assert game.fill(CATEGORIES[keys[g]]) == game_not_over[g], g
+        check_same(batch, games)
+    assert batch.get_winner().tolist() == [game.get_winner() for game in games]
+    return batch.get_winner()
+
+
+def test_greedy_games(n_games=100):
+    play_both(n_games, GreedyPolicy(), seed=1)
+
+
+def test_random_games(n_games=100):
+    play_both(n_games, RandomPolicy(seed=2), seed=3)
+
+
+def main():
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    test_greedy_games(n_games)
+    test_random_games(n_games)
+    print('%d greedy and %d random batch games play the same on Game.' % (n_games, n_games))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+This code measures the latency of the players while many games against the bot are played
+on the same server: the load test of test/load_harness.py, first without bot games, then with
+them, each time on a new server. The moves of the bots are decided by the bot pool, so the
+roll and fill latency of the players should stay about the same.
+
+It needs the client extra of python-socketio: pip install "python-socketio[asyncio_client]"
+
+Usage (from src/server):
+    python test/bot_pool_benchmark.py [n_bot_games] [bot_level] [seconds] [n_players]
+"""
+
+import asyncio
+import sys
+
+from load_harness import parse_options, run_load
+from server_benchmark import get_free_port, start_server, percentile
+
+
+def run(n_players, n_bot_games, bot_level, seconds):
+    options = parse_options([
+        '--players', str(n_players), '--bot-games', str(n_bot_games), '--bot-level', bot_level,
+        '--duration', str(seconds), '--leave-rate', '0', '--reload-rate', '0'
+    ])
+    port = get_free_port()
+    process = start_server(options.mode, port)
+    try:
+        print('--- %d bot games' % n_bot_games)
+        return asyncio.run(run_load('http://127.0.0.1:%d' % port, options))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    n_bot_games = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    bot_level = sys.argv[2] if len(sys.argv) > 2 else 'montecarlo'
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+    n_players = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+    results = [(n, run(n_players, n, bot_level, seconds)) for n in (0, n_bot_games)]
+
+    print()
+    print('%d players, bot level %s' % (n_players, bot_level))
+    print('%-10s %10s %10s %10s %10s %12s' % ('bot games', 'roll p50', 'roll p99', 'fill p50', 'fill p99', 'bot moves/s'))
+    for n, stats in results:
+        roll, fill = stats.latencies['roll'], stats.latencies['fill']
+        print('%-10d %8.2fms %8.2fms %8.2fms %8.2fms %12.1f' % (
+            n, percentile(roll, 50) * 1000, percentile(roll, 99) * 1000,
+            percentile(fill, 50) * 1000, percentile(fill, 99) * 1000, stats.bot_moves / seconds
+        ))
+
+
+if __name__ == '__main__':
+    main()
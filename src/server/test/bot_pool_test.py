@@ -0,0 +1,132 @@
+"""
+This code checks that the bot of app.BotPool makes legal moves at every level, without worker
+processes and with a tiny time budget: a roll of distinct dice with rolls left, or an open
+scoring. Without workers, the pool makes the optimal move from the bot table when it has been
+built and the greedy move otherwise, and get_move falls back to the greedy move when the decision
+of a worker is late or has failed.
+
+Usage (from src/server):
+    python test/bot_pool_test.py
+or with pytest:
+    python -m pytest test/bot_pool_test.py
+"""
+
+import os
+import random
+import sys
+from concurrent.futures import Future
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import BotPool as bot_pool_module
+from app.Bot import BOT_LEVELS
+from app.BotPool import BotPool, choose_greedy, choose_montecarlo, choose_optimal, decide
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES
+
+
+# seconds of search of the Monte Carlo bot, it still makes its two passes
+BUDGET = 0.001
+
+
+def get_position(game):
+    player_idx = game.get_active_player()
+    return game.filled[player_idx], game.upper_sec_total[player_idx], game.get_i_roll(), game.get_dice()
+
+
+def assert_legal(game, move):
+    kind, arg = move
+    if kind == 'roll':
+        assert game.get_i_roll() < 3, move
+        assert arg and len(set(arg)) == len(arg) and all(0 <= i <= 4 for i in arg), move
+    else:
+        assert kind == 'fill', move
+        assert arg in CATEGORIES and game.get_key_score(game.get_active_player(), arg) == -1, move
+
+
+def play_game(rng, choose):
+    """
+    Play a game between two bots choosing their moves with choose(game), checking every move
+    """
+    game = Game(Player('bot-1', is_bot=True), Player('bot-2', is_bot=True), seed=rng.getrandbits(64))
+    while True:
+        game.roll([0, 1, 2, 3, 4])
+        while True:
+            move = choose(game)
+            assert_legal(game, move)
+            if move[0] == 'fill':
+                break
+            game.roll(move[1])
+        if not game.fill(move[1]):
+            return game
+
+
+def test_levels_without_workers(n_games=2):
+    rng = random.Random(1)
+    pool = BotPool(0, BUDGET)
+    assert pool.executor is None
+    for level in BOT_LEVELS:
+        def choose(game):
+            position = get_position(game)
+            future = pool.submit(level, *position)
+            # without workers the move is decided at once, on the calling thread
+            assert future.done()
+            move = pool.get_move(future, *position)
+            if level == 'optimal' and pool.table is not None:
+                assert move == choose_optimal(*position, pool.table)
+            else:
+                assert move == choose_greedy(*position)
+            return move
+        for _ in range(n_games):
+            play_game(rng, choose)
+    assert len(pool) == 0
+    pool.close()
+
+
+def test_decisions_of_a_worker():
+    # what decide returns in a worker, with the tiny budget
+    rng = random.Random(2)
+    for level in BOT_LEVELS:
+        play_game(rng, lambda game: decide(level, *get_position(game), BUDGET))
+    play_game(rng, lambda game: choose_montecarlo(*get_position(game), BUDGET, rng))
+    # a worker without the bot table plays greedy at the optimal level
+    assert bot_pool_module.worker_table is None
+    game = Game(Player('bot-1', is_bot=True), Player('bot-2', is_bot=True), seed=3)
+    game.roll([0, 1, 2, 3, 4])
+    assert decide('optimal', *get_position(game), BUDGET) == choose_greedy(*get_position(game))
+
+
+def test_get_move_fallback():
+    pool = BotPool(0, BUDGET)
+    game = Game(Player('bot-1', is_bot=True), Player('bot-2', is_bot=True), seed=4)
+    game.roll([0, 1, 2, 3, 4])
+    position = get_position(game)
+    greedy = choose_greedy(*position)
+    other = ('fill', 'chance') if greedy != ('fill', 'chance') else ('fill', 'yahtzee')
+
+    done = Future()
+    done.set_result(other)
+    assert pool.get_move(done, *position) == other
+    # the decision is later than its budget: the greedy move, and the decision is no longer wanted
+    late = Future()
+    assert pool.get_move(late, *position) == greedy
+    assert late.cancelled()
+    failed = Future()
+    failed.set_exception(RuntimeError('the worker has died'))
+    assert pool.get_move(failed, *position) == greedy
+    cancelled = Future()
+    cancelled.cancel()
+    assert pool.get_move(cancelled, *position) == greedy
+    pool.close()
+
+
+def main():
+    test_levels_without_workers()
+    test_decisions_of_a_worker()
+    test_get_move_fallback()
+    print('The bot makes legal moves at every level, and falls back to the greedy move.')
+
+
+if __name__ == '__main__':
+    main()
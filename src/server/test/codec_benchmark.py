@@ -0,0 +1,133 @@
+"""
+This code compares the JSON payloads of the hottest events to their MessagePack form of app.Codec:
+the size of the payload and of the Socket.IO frames, the time to encode the packet on the server
+and to decode it on the client, for the gameUpdate of rolls, scorings and snapshots of random
+games, enterNewGame, and getPlayersOnlineResponse for a lobby of n_players.
+
+Usage (from src/server):
+    python test/codec_benchmark.py [n_games] [n_players]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+from socketio import packet
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ['YAHTZEE_STATE_STORE'] = 'memory'
+
+from app import Codec
+from app.Game import Game
+from app.Handlers import get_fill_update, get_roll_update, get_snapshot
+from app.Player import Player
+from app.Scoring import CATEGORIES
+
+
+def play_game():
+    """
+    Play a game with random holds and scorings
+    return: the roll updates, the scoring updates and a snapshot after every move
+    """
+    game = Game(Player(str(uuid.uuid4())), Player(str(uuid.uuid4())))
+    rolls, fills, snapshots = [], [], []
+    for _ in range(2 * len(CATEGORIES)):
+        for _ in range(random.randint(1, 3)):
+            game.roll([i for i in range(5) if game.get_i_roll() == 0 or random.random() < 0.5])
+            rolls.append(get_roll_update(game))
+            snapshots.append(get_snapshot(game))
+        player_idx = game.get_active_player()
+        filled = game.filled[player_idx]
+        key = random.choice([key for i, key in enumerate(CATEGORIES) if not filled >> i & 1])
+        game.fill(key)
+        fills.append(get_fill_update(game, player_idx, key))
+        snapshots.append(get_snapshot(game))
+    return rolls, fills, snapshots
+
+
+def encode_packet(codec, event, data):
+    """
+    The Socket.IO frames of an event as the server sends them
+    """
+    return packet.Packet(packet.EVENT, data=[event, Codec.encode(codec, event, data)], namespace='/').encode()
+
+
+def decode_packet(event, frames):
+    """
+    The data of an event as the client reads it from its frames
+    """
+    if isinstance(frames, str):
+        return packet.Packet(encoded_packet=frames).data[1]
+    received = packet.Packet(encoded_packet=frames[0])
+    for attachment in frames[1:]:
+        received.add_attachment(attachment)
+    return Codec.decode(event, received.data[1])
+
+
+def measure(codec, event, payloads):
+    """
+    return: (payload bytes, frame bytes, frames, encode us, decode us), per message
+    """
+    start = time.perf_counter()
+    encoded = [encode_packet(codec, event, data) for data in payloads]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = [decode_packet(event, frames) for frames in encoded]
+    decode_time = time.perf_counter() - start
+    assert decoded == payloads, 'the payloads do not survive the codec'
+
+    payload_bytes = frame_bytes = n_frames = 0
+    for data, frames in zip(payloads, encoded):
+        if codec == Codec.JSON:
+            payload_bytes += len(json.dumps(data, separators=(',', ':')).encode())
+            frames = [frames]
+        else:
+            payload_bytes += len(Codec.encode(codec, event, data))
+        frame_bytes += sum(len(frame.encode() if isinstance(frame, str) else frame) for frame in frames)
+        n_frames += len(frames)
+    n = len(payloads)
+    return payload_bytes / n, frame_bytes / n, n_frames / n, encode_time / n * 1e6, decode_time / n * 1e6
+
+
+def main():
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_players = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    if Codec.negotiate(Codec.MSGPACK) != Codec.MSGPACK:
+        sys.exit('The msgpack package is not installed: pip install msgpack')
+    rolls, fills, snapshots = [], [], []
+    for _ in range(n_games):
+        game_rolls, game_fills, game_snapshots = play_game()
+        rolls += game_rolls
+        fills += game_fills
+        snapshots += game_snapshots
+    new_games = [
+        {'game_id': str(uuid.uuid4()), 'oppo_player': Player(str(uuid.uuid4())).to_dict()} for _ in range(1000)
+    ]
+    lobbies = []
+    for _ in range(100):
+        players = [Player(str(uuid.uuid4())).to_dict() for _ in range(n_players)]
+        lobbies.append({player['pid']: player for player in players})
+    cases = [
+        ('gameUpdate', 'roll', rolls),
+        ('gameUpdate', 'fill', fills),
+        ('gameUpdate', 'snapshot', snapshots),
+        ('enterNewGame', '', new_games),
+        ('getPlayersOnlineResponse', '%d players' % n_players, lobbies),
+    ]
+
+    print('%-36s %-8s %9s %9s %7s %10s %10s' % ('event', 'codec', 'payload', 'frames', 'count', 'encode', 'decode'))
+    for event, kind, payloads in cases:
+        name = '%s %s' % (event, kind)
+        for codec in Codec.CODECS:
+            payload_bytes, frame_bytes, n_frames, encode_us, decode_us = measure(codec, event, payloads)
+            print('%-36s %-8s %7.0f B %7.0f B %7.0f %7.2f us %7.2f us' % (
+                name, codec, payload_bytes, frame_bytes, n_frames, encode_us, decode_us
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+This code checks that the payloads of app.Codec come back the same from MessagePack: the
+gameUpdate of every roll, scoring and snapshot of seeded random games, enterNewGame, and
+getPlayersOnlineResponse of an empty and a full lobby, encoded as the server sends them and
+decoded as a client reads them. It needs the msgpack package, except for the check that a
+new player gets JSON.
+
+Usage (from src/server):
+    python test/codec_test.py
+or with pytest:
+    python -m pytest test/codec_test.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ['YAHTZEE_STATE_STORE'] = 'memory'
+
+from app import Codec
+from app.Game import Game
+from app.Handlers import get_fill_update, get_roll_update, get_snapshot
+from app.Player import Player
+from app.Scoring import CATEGORIES
+
+
+def round_trip(event, data):
+    payload = Codec.encode(Codec.MSGPACK, event, data)
+    assert isinstance(payload, bytes), event
+    assert Codec.encode(Codec.JSON, event, data) is data, event
+    return Codec.decode(event, payload)
+
+
+def play_game(rng):
+    """
+    Play a game with random holds and scorings
+    return: the gameUpdate of every roll and scoring, and a snapshot after every move
+    """
+    game = Game(Player('p1'), Player('p2'))
+    updates = [get_snapshot(game)]
+    for _ in range(2 * len(CATEGORIES)):
+        for _ in range(rng.randint(1, 3)):
+            game.roll([i for i in range(5) if game.get_i_roll() == 0 or rng.random() < 0.5])
+            updates += [get_roll_update(game), get_snapshot(game)]
+        player_idx = game.get_active_player()
+        key = rng.choice([key for i, key in enumerate(CATEGORIES) if not game.filled[player_idx] >> i & 1])
+        game.fill(key)
+        updates += [get_fill_update(game, player_idx, key), get_snapshot(game)]
+    return updates
+
+
+def test_game_updates(n_games=20):
+    assert Codec.negotiate(Codec.MSGPACK) == Codec.MSGPACK, 'the msgpack package is not installed'
+    rng = random.Random(1)
+    for _ in range(n_games):
+        for update in play_game(rng):
+            assert round_trip('gameUpdate', update) == update, update
+
+
+def test_enter_new_game():
+    data = {'game_id': 'game-1', 'oppo_player': Player('p2', username='Player2').to_dict()}
+    assert round_trip('enterNewGame', data) == data
+
+
+def test_players_online():
+    assert round_trip('getPlayersOnlineResponse', {}) == {}
+    players = [Player('p%d' % i, username='Player%d' % i).to_dict() for i in range(100)]
+    data = {player['pid']: player for player in players}
+    assert round_trip('getPlayersOnlineResponse', data) == data
+
+
+def test_new_player_codec():
+    # the player model names its codec without importing app.Codec
+    assert Player('p1').codec == Codec.JSON
+    assert Codec.negotiate(Player('p1').codec) == Codec.JSON
+
+
+def main():
+    test_new_player_codec()
+    test_game_updates()
+    test_enter_new_game()
+    test_players_online()
+    print('The MessagePack payloads decode to the JSON ones.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,22 @@
 """
 This code is for testing the Game.py file in the console.
+Both players type their moves, played by app.Tournament.play_game like the moves of the bots.
+With a seed, the game has the same dice every time it is played the same way,
+and it can be replayed with app.Game.replay_game from the seed and moves printed at the end.
+
+Usage (from src/server):
+    python test/console_test.py [seed]
 """
 
-from Game import Game, UPPER_KEYS, LOWER_KEYS
-from Player import Player
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Game import Game, UPPER_KEYS, LOWER_KEYS
+from app.Player import Player
+from app.Scoring import CATEGORY_INDEX
+from app.Tournament import play_game
 
 
 def input_roll():
@@ -26,16 +39,15 @@ def input_roll():
     return idx
 
 
-def fill_key(game):
+def input_key(game):
     while True:
         key = input('Type in scoring: ')
-        try:
-            game_continue = game.fill(key)
-            return game_continue
-        except KeyError as e:
-            print(e)
-        except ValueError as e:
-            print(e)
+        if key not in CATEGORY_INDEX:
+            print('Invalid input key encountered.')
+        elif game.get_key_score(game.get_active_player(), key) != -1:
+            print("This scoring has already been occupied. You must choose another scoring.")
+        else:
+            return key
 
 
 def number_to_string(num):
@@ -109,48 +121,53 @@ def game_over(game):
         print('Oh, Tie!')
 
 
-def main():
-    p1 = Player(cid='player1', ip='0.0.0.0')
-    p2 = Player(cid='player2', ip='0.0.0.0')
-    game = Game(p1, p2)
+def get_active_name(game):
+    return game.p1.username if game.get_active_player() == 0 else game.p2.username
 
-    game_continue = True
-    while game_continue:
-        print("Round %d / 13: Player %s's turn. Current scores: " % (game.get_round(), game.get_active_player().username))
-        print_all_scoring(game)
 
-        print("\nPlayer %s's First roll." % game.get_active_player().username)
-        game.roll([0, 1, 2, 3, 4])
-        print('Dice:', game.get_dice())
-
-        fill_score = False
-        while (game.get_i_roll() <= 2) and (not fill_score):
-            print("Player %s have %d toss left in this round. Player %s can choose to retoss by typing 'roll'." \
-                  % (game.get_active_player().username, 3 - game.get_i_roll(), game.get_active_player().username))
-            print("Or player %s can choose to fill a score, by typing 'fill'." % game.get_active_player().username)
-            command = input().strip()
-            if command == 'roll':
-                idx = input_roll()
-                game.roll(idx)
-                print('Dice:', game.get_dice())
-            elif command == 'fill':
-                print("Player %s choose to fill a scoring. Player %s can type in any one of the following scoring: " \
-                      % (game.get_active_player().username, game.get_active_player().username))
-                print(UPPER_KEYS)
-                print(LOWER_KEYS)
-                game_continue = fill_key(game)
-                fill_score = True
-            else:
-                print("Invalid input command. Player can only type in 'roll' or 'fill'. Please re-type your command.")
-
-        if not fill_score:
-            print("Player %s have to choose to fill a score, by typing in any one of the following keys: " % game.active_player)
+def console_move(game):
+    """
+    The next move of the active player, typed in the console: a strategy of app.Tournament.play_game
+    """
+    if game.get_i_roll() == 1:
+        print("Round %d / 13: Player %s's turn. Current scores: " % (game.get_round(), get_active_name(game)))
+        print_all_scoring(game)
+        print("\nPlayer %s's First roll." % get_active_name(game))
+    print('Dice:', game.get_dice())
+
+    while game.get_i_roll() <= 2:
+        print("Player %s have %d toss left in this round. Player %s can choose to retoss by typing 'roll'." \
+              % (get_active_name(game), 3 - game.get_i_roll(), get_active_name(game)))
+        print("Or player %s can choose to fill a score, by typing 'fill'." % get_active_name(game))
+        command = input().strip()
+        if command == 'roll':
+            return 'roll', input_roll()
+        elif command == 'fill':
+            print("Player %s choose to fill a scoring. Player %s can type in any one of the following scoring: " \
+                  % (get_active_name(game), get_active_name(game)))
             print(UPPER_KEYS)
             print(LOWER_KEYS)
-            game_continue = fill_key(game)
-            fill_score = True
+            return 'fill', input_key(game)
+        else:
+            print("Invalid input command. Player can only type in 'roll' or 'fill'. Please re-type your command.")
+
+    print("Player %s have to choose to fill a score, by typing in any one of the following keys: " % get_active_name(game))
+    print(UPPER_KEYS)
+    print(LOWER_KEYS)
+    return 'fill', input_key(game)
+
+
+def main():
+    p1 = Player('player1', ip='0.0.0.0', username='Player1')
+    p2 = Player('player2', ip='0.0.0.0', username='Player2')
+    game = Game(p1, p2, seed=int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    # the rolls and fills in order, to replay the game
+    moves = []
+    play_game(game, (console_move, console_move), moves)
 
     game_over(game)
+    print('Seed: %d' % game.get_seed())
+    print('Moves:', moves)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""
+This code checks the seeded dice of app.Dice: a seed always gives the same faces, every face
+comes up about as often, a stream rebuilt from its position, also after the store has encoded
+and decoded its game, draws the same faces as the original, and app.Game.replay_game plays a
+game with random moves again to the same dice and scores from its seed and moves.
+
+Usage (from src/server):
+    python test/dice_test.py
+or with pytest:
+    python -m pytest test/dice_test.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Dice import DiceStream
+from app.Game import Game, replay_game
+from app.Player import Player
+from app.Scoring import CATEGORIES
+from app.Store import decode_game, encode_game
+
+
+def test_same_seed_same_faces(n_faces=10000):
+    faces = DiceStream(12345).draw(n_faces)
+    assert DiceStream(12345).draw(n_faces) == faces
+    assert DiceStream(12346).draw(n_faces) != faces
+    counts = [faces.count(face) for face in range(1, 7)]
+    # each face is drawn with probability 1/6, the counts are within 5 standard deviations
+    assert all(abs(count - n_faces / 6) < 5 * (n_faces * 5 / 36) ** 0.5 for count in counts), counts
+
+
+def test_rebuild_from_position(n_draws=500):
+    rng = random.Random(1)
+    stream = DiceStream(rng.getrandbits(64))
+    for _ in range(n_draws):
+        rebuilt = DiceStream(stream.seed, *stream.get_position())
+        n = rng.randint(1, 5)
+        assert rebuilt.draw(n) == stream.draw(n)
+
+
+def play_random_game(game, rng):
+    """
+    Play the game to the end with random rolls and fills
+    return: the moves, as replay_game takes them
+    """
+    moves = []
+    while True:
+        idx = [0, 1, 2, 3, 4]
+        while True:
+            game.roll(idx)
+            moves.append(idx)
+            idx = [i for i in range(5) if rng.random() < 0.5]
+            if game.get_i_roll() == 3 or not idx:
+                break
+        player_idx = game.get_active_player()
+        key = rng.choice([key for key in CATEGORIES if game.get_key_score(player_idx, key) == -1])
+        moves.append(key)
+        if not game.fill(key):
+            return moves
+
+
+def test_replay_game(n_games=20):
+    rng = random.Random(2)
+    for _ in range(n_games):
+        seed = rng.getrandbits(64)
+        game = Game(Player('player-1'), Player('player-2'), seed=seed)
+        moves = play_random_game(game, rng)
+        replayed = replay_game(Player('player-1'), Player('player-2'), seed, moves)
+        assert replayed.get_dice() == game.get_dice()
+        for player_idx in (0, 1):
+            assert replayed.get_score(player_idx) == game.get_score(player_idx)
+            assert replayed.total[player_idx] == game.total[player_idx]
+        assert replayed.get_winner() == game.get_winner()
+
+
+def test_store_keeps_the_stream():
+    rng = random.Random(3)
+    game = Game(Player('player-1'), Player('player-2'), seed=rng.getrandbits(64))
+    for n_rolls in range(40):
+        stored = decode_game(encode_game(game))
+        assert stored.dice_stream.get_position() == game.dice_stream.get_position()
+        idx = [i for i in range(5) if rng.random() < 0.7] or [0]
+        game.roll(idx)
+        stored.roll(idx)
+        assert stored.get_dice() == game.get_dice()
+
+
+def main():
+    test_same_seed_same_faces()
+    test_rebuild_from_position()
+    test_replay_game()
+    test_store_keeps_the_stream()
+    print('The seeded dice are the same for a seed, from a stored position and in a replayed game.')
+
+
+if __name__ == '__main__':
+    main()
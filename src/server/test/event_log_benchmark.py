@@ -0,0 +1,103 @@
+"""
+This code measures the cost of the write-ahead event log: the time it adds to every
+move, and the time to rebuild the games at startup, from the log alone and from a snapshot.
+
+Usage (from src/server):
+    python test/event_log_benchmark.py [n_games] [n_moves]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.EventLog import EventLog
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES
+
+
+def play_moves(games, n_moves, event_log=None):
+    """
+    Make n_moves moves in every game, three rolls and a fill per turn, logged if event_log is given
+    return: seconds per move
+    """
+    start = time.perf_counter()
+    for i in range(n_moves):
+        turn, step = divmod(i, 4)
+        for game in games:
+            if step < 3:
+                game.roll([0, 1, 2, 3, 4])
+                if event_log is not None:
+                    event_log.log_roll(game, [0, 1, 2, 3, 4])
+            else:
+                # each player fills the scorings in order, both players are one turn apart
+                key = CATEGORIES[turn // 2 % len(CATEGORIES)]
+                game.fill(key)
+                if event_log is not None:
+                    event_log.log_fill(game, key)
+    return (time.perf_counter() - start) / (n_moves * len(games))
+
+
+def new_games(n_games, event_log=None):
+    games = []
+    for i in range(n_games):
+        game = Game(Player('player-%d' % i, username='Player'), Player('bot-%d' % i, username='YahtzeeBot', is_bot=True))
+        if event_log is not None:
+            event_log.log_create(game)
+        games.append(game)
+    return games
+
+
+def wait_for_compaction(event_log):
+    while event_log.compacting:
+        time.sleep(0.01)
+
+
+def main():
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    # at most the 13 rounds of both players
+    n_moves = min(int(sys.argv[2]) if len(sys.argv) > 2 else 40, 4 * 2 * len(CATEGORIES) - 1)
+    directory = tempfile.mkdtemp(prefix='event-log-')
+    try:
+        without_log = play_moves(new_games(n_games), n_moves)
+
+        # one segment, so that the first restart replays every record
+        event_log = EventLog(directory, segment_size=1 << 40)
+        event_log.open()
+        games = new_games(n_games, event_log)
+        with_log = play_moves(games, n_moves, event_log)
+        event_log.close()
+        n_records = n_games * (n_moves + 1)
+        log_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print('%d games, %d moves each: %d records, %.1f MB' % (n_games, n_moves, n_records, log_size / 1e6))
+        print('Move without the log:    %8.2f us' % (without_log * 1e6))
+        print('Move with the log:       %8.2f us' % (with_log * 1e6))
+        print('Records per fsync:       %8.1f' % (n_records / max(event_log.n_commits, 1)))
+
+        event_log = EventLog(directory)
+        start = time.perf_counter()
+        recovered = event_log.open()
+        from_log = time.perf_counter() - start
+        assert len(recovered) == n_games
+        wait_for_compaction(event_log)
+        event_log.close()
+        print('Recovery from the log:   %8.3f s' % from_log)
+
+        event_log = EventLog(directory)
+        start = time.perf_counter()
+        recovered = event_log.open()
+        from_snapshot = time.perf_counter() - start
+        assert len(recovered) == n_games
+        wait_for_compaction(event_log)
+        event_log.close()
+        print('Recovery from snapshot:  %8.3f s' % from_snapshot)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
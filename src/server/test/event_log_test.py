@@ -0,0 +1,185 @@
+"""
+This code checks the crash recovery of app.EventLog: games played with the log are rebuilt
+the same after a restart, a torn last record is dropped with the move it held, a snapshot
+plus the segment after it rebuilds the same games as the records alone, and a snapshot left
+half-written by a crash is deleted at startup.
+
+Usage (from src/server):
+    python test/event_log_test.py
+or with pytest:
+    python -m pytest test/event_log_test.py
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.EventLog import EventLog
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES
+from app.Store import encode_game
+
+
+def new_games(n_games, rng, event_log):
+    games = {}
+    for i in range(n_games):
+        game = Game(Player('player-%d' % i, username='Player'), Player('opponent-%d' % i, username='Opponent'),
+                    seed=rng.getrandbits(64))
+        event_log.log_create(game)
+        games[game.game_id] = game
+    return games
+
+
+def play_move(games, game, rng, event_log):
+    """
+    Make one random move in the game and log it, a game that is over is logged as ended
+    """
+    if game.get_i_roll() == 0 or (game.get_i_roll() < 3 and rng.random() < 0.6):
+        idx = [0, 1, 2, 3, 4] if game.get_i_roll() == 0 else [i for i in range(5) if rng.random() < 0.5] or [0]
+        game.roll(idx)
+        event_log.log_roll(game, idx)
+        return
+    player_idx = game.get_active_player()
+    key = rng.choice([key for key in CATEGORIES if game.get_key_score(player_idx, key) == -1])
+    event_log.log_fill(game, key)
+    if not game.fill(key):
+        event_log.log_end(game)
+        del games[game.game_id]
+
+
+def play_moves(games, rng, n_moves, event_log):
+    for _ in range(n_moves):
+        play_move(games, rng.choice(list(games.values())), rng, event_log)
+
+
+def assert_same_games(recovered, games):
+    assert sorted(recovered) == sorted(games)
+    for game_id, game in games.items():
+        assert encode_game(recovered[game_id]) == encode_game(game)
+
+
+def reopen(directory):
+    """
+    Restart the log on the directory and wait for the compaction that a restart starts
+    return: the log, the recovered games
+    """
+    event_log = EventLog(directory)
+    recovered = event_log.open()
+    while event_log.compacting:
+        time.sleep(0.01)
+    return event_log, recovered
+
+
+def test_restart_recovers_the_games():
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix='event-log-')
+    try:
+        event_log = EventLog(directory)
+        event_log.open()
+        games = new_games(10, rng, event_log)
+        # some games are played to the end, the others are left in the middle
+        for game in list(games.values())[:3]:
+            while game.game_id in games:
+                play_move(games, game, rng, event_log)
+        assert len(games) == 7
+        play_moves(games, rng, 200, event_log)
+        event_log.close()
+        event_log, recovered = reopen(directory)
+        event_log.close()
+        assert_same_games(recovered, games)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_torn_record_is_dropped():
+    rng = random.Random(2)
+    directory = tempfile.mkdtemp(prefix='event-log-')
+    try:
+        event_log = EventLog(directory)
+        event_log.open()
+        games = new_games(3, rng, event_log)
+        play_moves(games, rng, 50, event_log)
+        before_last = {game_id: encode_game(game) for game_id, game in games.items()}
+        # the last move is written, then cut by a crash in the middle of its record
+        game = games[sorted(games)[0]]
+        game.roll([0, 1, 2, 3, 4])
+        event_log.log_roll(game, [0, 1, 2, 3, 4])
+        event_log.close()
+        path = event_log.segment_path(event_log.segment)
+        os.truncate(path, os.path.getsize(path) - 2)
+
+        event_log, recovered = reopen(directory)
+        event_log.close()
+        assert sorted(recovered) == sorted(before_last)
+        for game_id, data in before_last.items():
+            assert encode_game(recovered[game_id]) == data
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_snapshot_and_tail():
+    rng = random.Random(3)
+    directory = tempfile.mkdtemp(prefix='event-log-')
+    try:
+        event_log = EventLog(directory)
+        event_log.open()
+        games = new_games(10, rng, event_log)
+        play_moves(games, rng, 300, event_log)
+        event_log.close()
+        # the restart folds the first segment into a snapshot, the moves after it go to the next segment
+        event_log, recovered = reopen(directory)
+        assert_same_games(recovered, games)
+        games = recovered
+        play_moves(games, rng, 300, event_log)
+        games.update(new_games(2, rng, event_log))
+        event_log.close()
+        snapshot, segments = event_log.list_files()
+        assert snapshot == event_log.segment
+        assert segments == [event_log.segment]
+
+        event_log, recovered = reopen(directory)
+        event_log.close()
+        assert_same_games(recovered, games)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_half_written_snapshot_is_deleted():
+    rng = random.Random(4)
+    directory = tempfile.mkdtemp(prefix='event-log-')
+    try:
+        event_log = EventLog(directory)
+        event_log.open()
+        games = new_games(5, rng, event_log)
+        play_moves(games, rng, 100, event_log)
+        event_log.close()
+        # a crash in the middle of writing the next snapshot
+        tmp_path = event_log.snapshot_path(event_log.segment + 1) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(os.urandom(100))
+
+        event_log, recovered = reopen(directory)
+        event_log.close()
+        assert not os.path.exists(tmp_path)
+        assert not any(name.endswith('.tmp') for name in os.listdir(directory))
+        assert_same_games(recovered, games)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    test_restart_recovers_the_games()
+    test_torn_record_is_dropped()
+    test_snapshot_and_tail()
+    test_half_written_snapshot_is_deleted()
+    print('The event log rebuilds the games after a restart, a torn record and from a snapshot.')
+
+
+if __name__ == '__main__':
+    main()
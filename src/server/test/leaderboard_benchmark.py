@@ -0,0 +1,82 @@
+"""
+This code measures the leaderboard with many rated players: the top of the leaderboard
+and the rank of a player, alone and while games end on several threads at once.
+
+Usage (from src/server):
+    python test/leaderboard_benchmark.py [n_players] [n_threads] [seconds]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Leaderboard import Leaderboard
+from app.Player import Player
+
+
+def per_call(f, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def load_players(leaderboard, n):
+    leaderboard.conn.execute('BEGIN')
+    leaderboard.conn.executemany(
+        'INSERT INTO ratings (pid, username, rating, games, wins) VALUES (?, ?, ?, ?, ?)',
+        (('player-%d' % i, 'Player%d' % i, random.gauss(1500, 300), 10, 5) for i in range(n))
+    )
+    leaderboard.conn.execute('COMMIT')
+    leaderboard.rebuild_tree()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    directory = tempfile.mkdtemp(prefix='leaderboard-')
+    try:
+        leaderboard = Leaderboard(os.path.join(directory, 'leaderboard.db'))
+        start = time.perf_counter()
+        load_players(leaderboard, n)
+        print('%d rated players loaded in %.1f s' % (leaderboard.count(), time.perf_counter() - start))
+
+        players = [Player('player-%d' % i, username='Player%d' % i) for i in range(n)]
+        print('Top 100:  %8.1f us' % per_call(lambda: leaderboard.top(100), 1000))
+        print('Rank:     %8.1f us' % per_call(lambda: leaderboard.rank(random.choice(players).pid), 10000))
+
+        # games end on every thread, like the handlers of concurrent games, while the writer flushes
+        stop = time.perf_counter() + seconds
+        n_games = [0] * n_threads
+
+        def play(i):
+            while time.perf_counter() < stop:
+                leaderboard.record_game(random.choice(players), random.choice(players), random.randint(0, 2))
+                n_games[i] += 1
+
+        threads = [threading.Thread(target=play, args=(i,)) for i in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        rank_under_load = per_call(lambda: leaderboard.rank(random.choice(players).pid), 1000)
+        for thread in threads:
+            thread.join()
+        print('Games:    %8.0f per second on %d threads' % (sum(n_games) / seconds, n_threads))
+        print('Rank:     %8.1f us during the games' % rank_under_load)
+
+        start = time.perf_counter()
+        leaderboard.flush()
+        print('Last flush of the queued ratings: %.1f ms' % ((time.perf_counter() - start) * 1e3))
+        assert leaderboard.count() == n
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
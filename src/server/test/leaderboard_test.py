@@ -0,0 +1,99 @@
+"""
+This code checks that workers sharing the leaderboard database keep the games of each other:
+two Leaderboard objects on one database record games of the same players, like two workers,
+and the ratings, games and wins written must be those of all the games played in order.
+It also checks that a game ends and the ratings are read while a write waits for the database.
+
+Usage (from src/server):
+    python test/leaderboard_test.py
+or with pytest:
+    python -m pytest test/leaderboard_test.py
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Leaderboard import Leaderboard, apply_game
+from app.Player import Player
+
+
+def test_workers_sharing_the_database(n_games=200):
+    directory = tempfile.mkdtemp(prefix='leaderboard-')
+    try:
+        path = os.path.join(directory, 'leaderboard.db')
+        # the writer threads wait, the games are written by the flushes below
+        workers = [Leaderboard(path, flush_interval=3600) for _ in range(2)]
+        players = [Player('player-%d' % i, username='Player%d' % i) for i in range(4)]
+        expected = {player.pid: None for player in players}
+        rng = random.Random(1)
+        for i in range(n_games):
+            player_1, player_2 = rng.sample(players, 2)
+            winner = rng.choice((0, 1, 2))
+            worker = workers[i % 2]
+            worker.record_game(player_1, player_2, winner)
+            apply_game(expected, (player_1.pid, player_1.username, player_2.pid, player_2.username, winner))
+            # each worker writes its games after the other has written its own
+            worker.flush()
+        for worker in workers:
+            for player in players:
+                username, rating, games, wins = worker.get(player.pid)
+                assert (username, games, wins) == expected[player.pid][:1] + expected[player.pid][2:], player.pid
+                assert abs(rating - expected[player.pid][1]) < 1e-6, player.pid
+            assert worker.count() == len(players)
+            assert sum(player['games'] for player in worker.top()) == 2 * n_games
+        for worker in workers:
+            worker.conn.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_record_game_during_a_write():
+    directory = tempfile.mkdtemp(prefix='leaderboard-')
+    try:
+        path = os.path.join(directory, 'leaderboard.db')
+        leaderboard = Leaderboard(path, flush_interval=3600)
+        players = [Player('player-%d' % i, username='Player%d' % i) for i in range(3)]
+        leaderboard.record_game(players[0], players[1], 1)
+        leaderboard.flush()
+        # another worker holds the database, the next write waits for it
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        rating_0, rating_1 = leaderboard.record_game(players[0], players[1], 1)
+        writer = threading.Thread(target=leaderboard.flush)
+        writer.start()
+        time.sleep(0.2)
+        assert writer.is_alive()
+        start = time.perf_counter()
+        leaderboard.record_game(players[1], players[2], 2)
+        # the ratings being written are still read
+        assert leaderboard.get(players[0].pid)[1:] == (rating_0, 2, 2)
+        assert leaderboard.get_rating(players[1].pid) < rating_1
+        assert time.perf_counter() - start < 0.1
+        other.execute('COMMIT')
+        other.close()
+        writer.join()
+        leaderboard.flush()
+        assert [leaderboard.get(player.pid)[2:] for player in players] == [(2, 2), (3, 0), (1, 1)]
+        assert leaderboard.count() == 3
+        leaderboard.conn.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    test_workers_sharing_the_database()
+    print('Two workers sharing the leaderboard keep all their games.')
+    test_record_game_during_a_write()
+    print('Games end while the ratings are written.')
+
+
+if __name__ == '__main__':
+    main()
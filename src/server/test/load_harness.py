@@ -0,0 +1,437 @@
+"""
+Headless load test: many simulated players play full games against the server.
+
+Players come in pairs. One invites the other, the other accepts, and they play all 13
+rounds with random holds, pausing for a think time before every move. Now and then a
+player reloads the page (a new session that resumes the game) or leaves for good
+(the pair starts over with new players). Spectators, if any, all follow the games of the
+first pair, to show that a crowd of spectators does not slow down the players. Bot
+games, if any, are played at the same time by more players against the bot of the server,
+to show that the moves of the bots do not slow down the other players either.
+
+Reported per event type: count, throughput and p50/p95/p99 latency of
+    register_player -> registerSuccessResponse
+    send_invite     -> receiveInvitation (at the invitee)
+    accept_invite   -> enterNewGame
+    roll            -> gameUpdate
+    fill            -> gameUpdate
+    resume          -> resumeGame (register_player from a new session during a game)
+    watch_game      -> watchSnapshot
+
+It needs the client extra of python-socketio: pip install "python-socketio[asyncio_client]"
+
+Usage (from src/server):
+    python test/load_harness.py --players 2000 --duration 60
+    python test/load_harness.py --url http://127.0.0.1:5000 --players 200 --games 5
+    python test/load_harness.py --players 200 --spectators 2000 --duration 60
+    python test/load_harness.py --players 200 --bot-games 300 --bot-level montecarlo --duration 60
+    python test/load_harness.py --players 2000 --duration 60 --codec msgpack
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import socketio
+
+from server_benchmark import get_free_port, start_server, percentile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import Codec
+
+
+KEYS = (
+    '1s', '2s', '3s', '4s', '5s', '6s', '3-of-a-kind', '4-of-a-kind', 'full-house',
+    'small-straight', 'large-straight', 'yahtzee', 'chance'
+)
+EVENTS = ('register_player', 'send_invite', 'accept_invite', 'roll', 'fill', 'resume', 'watch_game')
+N_ROUNDS = 13
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.errors = 0
+        self.games = 0
+        self.abandoned_games = 0
+        self.reconnects = 0
+        self.disconnects = 0
+        self.spectator_updates = 0
+        self.bot_games = 0
+        self.bot_moves = 0
+
+    def report(self, elapsed):
+        print('%d games finished, %d abandoned, %d reloads, %d players left, %d errors in %.1fs' % (
+            self.games, self.abandoned_games, self.reconnects, self.disconnects, self.errors, elapsed
+        ))
+        if self.spectator_updates:
+            print('%d updates received by the spectators' % self.spectator_updates)
+        if self.bot_moves:
+            print('%d games finished against the bot, %d moves of the bots' % (self.bot_games, self.bot_moves))
+        print('%-16s %8s %10s %9s %9s %9s %9s' % ('event', 'count', 'events/s', 'p50 ms', 'p95 ms', 'p99 ms', 'timeouts'))
+        for event in EVENTS:
+            latencies = self.latencies[event]
+            if not latencies and not self.timeouts[event]:
+                continue
+            print('%-16s %8d %10.1f %9.2f %9.2f %9.2f %9d' % (
+                event, len(latencies), len(latencies) / elapsed, percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000, self.timeouts[event]
+            ))
+
+
+class SimulatedClient:
+    """
+    One browser session: a Socket.IO client with one queue of received messages per event,
+    registering with the codec of the options, see app.Codec
+    """
+    def __init__(self, pid, codec=Codec.JSON):
+        self.pid = pid
+        self.codec = codec
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.queues = defaultdict(asyncio.Queue)
+        self.sio.on('*', self.receive)
+
+    def receive(self, event, *args):
+        if event == 'batch':
+            # the events of one tick of the outbox of the server, see app.Outbox
+            for batched_event, data in args[0]:
+                handler = self.sio.handlers['/'].get(batched_event)
+                if handler is None:
+                    self.receive(batched_event, data)
+                else:
+                    handler(data)
+            return
+        self.queues[event].put_nowait(Codec.decode(event, args[0]) if args else None)
+
+    def register_message(self):
+        return {'playerId': self.pid, 'codec': self.codec}
+
+    async def connect(self, url):
+        await self.sio.connect(url, transports=['websocket'])
+
+    async def disconnect(self):
+        await self.sio.disconnect()
+
+    def clear(self):
+        """
+        Forget the messages received so far
+        """
+        self.queues = defaultdict(asyncio.Queue)
+
+    async def wait(self, event, timeout, min_version=None):
+        """
+        Return the next message of the event, with at least min_version for gameUpdate
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            message = await asyncio.wait_for(self.queues[event].get(), remaining)
+            if min_version is None or message['version'] >= min_version:
+                return message
+
+
+class Table:
+    """
+    Two simulated players who invite each other and play games one after another
+    """
+    def __init__(self, url, options, stats):
+        self.url = url
+        self.options = options
+        self.stats = stats
+        self.clients = []
+        # the game being played, for the spectators
+        self.game_id = None
+
+    async def measure(self, event, client, send, reply, message, min_version=None, to=None):
+        """
+        Send an event and wait for the reply at the client to (the sender by default)
+        """
+        start = time.perf_counter()
+        await client.sio.emit(send, message)
+        try:
+            result = await (to or client).wait(reply, self.options.timeout, min_version)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[event] += 1
+            raise
+        self.stats.latencies[event].append(time.perf_counter() - start)
+        return result
+
+    async def think(self):
+        if self.options.think_time > 0:
+            await asyncio.sleep(random.expovariate(1 / self.options.think_time))
+
+    async def new_player(self):
+        client = SimulatedClient(str(uuid.uuid4()), self.options.codec)
+        await client.connect(self.url)
+        await self.measure('register_player', client, 'register_player', 'registerSuccessResponse', client.register_message())
+        return client
+
+    async def reload(self, i):
+        """
+        Player i opens a new session, resumes the game there and closes the old one
+        """
+        old = self.clients[i]
+        new = SimulatedClient(old.pid, self.options.codec)
+        await new.connect(self.url)
+        await self.measure('resume', new, 'register_player', 'resumeGame', new.register_message())
+        self.clients[i] = new
+        await old.disconnect()
+        self.stats.reconnects += 1
+
+    async def start_game(self):
+        inviter, invitee = self.clients
+        # the messages of the last game have all arrived with its gameOver
+        inviter.clear()
+        invitee.clear()
+        await self.measure(
+            'send_invite', inviter, 'send_invite', 'receiveInvitation',
+            {'inviter': inviter.pid, 'invitee': invitee.pid}, to=invitee
+        )
+        await self.think()
+        entered = await self.measure(
+            'accept_invite', invitee, 'accept_invite', 'enterNewGame', {'inviter': inviter.pid, 'invitee': invitee.pid}
+        )
+        await inviter.wait('enterNewGame', self.options.timeout)
+        return entered['game_id']
+
+    async def play_game(self, game_id):
+        """
+        Play the game to the end, return False if one player has left it
+        """
+        client = self.clients[0]
+        await client.sio.emit('game_initialize', {'game_id': game_id, 'player_id': client.pid})
+        state = await client.wait('gameUpdate', self.options.timeout)
+        while 'score_active' not in state:
+            state = await client.wait('gameUpdate', self.options.timeout)
+        version = state['version']
+        active = 0 if state['active_player'] == self.clients[0].pid else 1
+        sheets = [list(KEYS), list(KEYS)]
+        for _ in range(2 * N_ROUNDS):
+            index = [0, 1, 2, 3, 4]
+            for _ in range(random.randint(1, 3)):
+                await self.think()
+                if random.random() < self.options.reload_rate:
+                    await self.reload(active)
+                if random.random() < self.options.leave_rate:
+                    await self.leave(active)
+                    return False
+                client = self.clients[active]
+                message = {'game_id': game_id, 'player_id': client.pid, 'index': index}
+                await self.measure('roll', client, 'roll', 'gameUpdate', message, min_version=version + 1)
+                version += 1
+                index = [i for i in range(5) if random.random() < 0.5] or [0]
+            await self.think()
+            client = self.clients[active]
+            key = sheets[active].pop(random.randrange(len(sheets[active])))
+            message = {'game_id': game_id, 'player_id': client.pid, 'key': key}
+            update = await self.measure('fill', client, 'fill', 'gameUpdate', message, min_version=version + 1)
+            version += 1
+            active = 0 if update['active_player'] == self.clients[0].pid else 1
+        for client in self.clients:
+            await client.wait('gameOver', self.options.timeout)
+        return True
+
+    async def leave(self, i):
+        """
+        Player i closes the page and the opponent is told that the game waits for the player.
+        The game only ends after the reconnection grace period, so the pair starts over with
+        two new players.
+        """
+        await self.clients[i].disconnect()
+        await self.clients[1 - i].wait('opponentSuspended', self.options.timeout)
+        await self.clients[1 - i].disconnect()
+        self.stats.disconnects += 1
+        self.clients = [await self.new_player(), await self.new_player()]
+
+    async def run(self, deadline, n_games):
+        try:
+            self.clients = [await self.new_player(), await self.new_player()]
+            played = 0
+            while played < n_games and time.time() < deadline:
+                game_id = await self.start_game()
+                self.game_id = game_id
+                if await self.play_game(game_id):
+                    self.stats.games += 1
+                else:
+                    self.stats.abandoned_games += 1
+                played += 1
+        except Exception as e:
+            self.stats.errors += 1
+            if self.stats.errors <= 5:
+                print('ERROR: %r' % e)
+        finally:
+            for client in self.clients:
+                if client.sio.connected:
+                    await client.disconnect()
+
+
+class Spectator:
+    """
+    A client who follows the games of one table, from a snapshot and then the stream of moves
+    """
+    def __init__(self, url, options, stats, table):
+        self.url = url
+        self.options = options
+        self.stats = stats
+        self.table = table
+
+    async def run(self, deadline):
+        client = SimulatedClient(str(uuid.uuid4()))
+        client.sio.on('gameUpdate', self.count_update)
+        try:
+            await client.connect(self.url)
+            watched = None
+            while time.time() < deadline:
+                if self.table.game_id != watched:
+                    watched = self.table.game_id
+                    start = time.perf_counter()
+                    await client.sio.emit('watch_game', {'game_id': watched})
+                    try:
+                        await client.wait('watchSnapshot', self.options.timeout)
+                        self.stats.latencies['watch_game'].append(time.perf_counter() - start)
+                    except asyncio.TimeoutError:
+                        self.stats.timeouts['watch_game'] += 1
+                await asyncio.sleep(0.5)
+        except Exception as e:
+            self.stats.errors += 1
+            if self.stats.errors <= 5:
+                print('ERROR: %r' % e)
+        finally:
+            if client.sio.connected:
+                await client.disconnect()
+
+    def count_update(self, update):
+        self.stats.spectator_updates += 1
+
+
+class BotGame:
+    """
+    A player who plays against the bot one game after another, with the same think time
+    as the pairs. Only the moves of the bot are counted, the latencies are those of the pairs.
+    """
+    def __init__(self, url, options, stats):
+        self.url = url
+        self.options = options
+        self.stats = stats
+
+    async def run(self, deadline):
+        client = SimulatedClient(str(uuid.uuid4()), self.options.codec)
+        try:
+            await client.connect(self.url)
+            await client.sio.emit('register_player', client.register_message())
+            await client.wait('registerSuccessResponse', self.options.timeout)
+            while time.time() < deadline:
+                client.clear()
+                await client.sio.emit('play_bot', {'level': self.options.bot_level})
+                entered = await client.wait('enterNewGame', self.options.timeout)
+                await self.play_game(client, entered['game_id'])
+                self.stats.bot_games += 1
+        except Exception as e:
+            self.stats.errors += 1
+            if self.stats.errors <= 5:
+                print('ERROR: %r' % e)
+        finally:
+            if client.sio.connected:
+                await client.disconnect()
+
+    async def play_game(self, client, game_id):
+        await client.sio.emit('game_initialize', {'game_id': game_id, 'player_id': client.pid})
+        state = await client.wait('gameUpdate', self.options.timeout)
+        while 'score_active' not in state:
+            state = await client.wait('gameUpdate', self.options.timeout)
+        sheet = list(KEYS)
+        active = state['active_player']
+        version = state['version']
+        bot_fills = 0
+        while sheet or bot_fills < N_ROUNDS:
+            if active == client.pid and sheet:
+                await self.think()
+                await client.sio.emit('roll', {'game_id': game_id, 'player_id': client.pid, 'index': [0, 1, 2, 3, 4]})
+                await client.wait('gameUpdate', self.options.timeout, version + 1)
+                await self.think()
+                key = sheet.pop(random.randrange(len(sheet)))
+                await client.sio.emit('fill', {'game_id': game_id, 'player_id': client.pid, 'key': key})
+                update = await client.wait('gameUpdate', self.options.timeout, version + 2)
+            else:
+                # every roll and fill of the bot is sent as soon as the bot pool has decided it
+                update = await client.wait('gameUpdate', self.options.timeout, version + 1)
+                self.stats.bot_moves += 1
+                bot_fills += 'key' in update
+            version = update['version']
+            active = update.get('active_player', active)
+        await client.wait('gameOver', self.options.timeout)
+
+    async def think(self):
+        if self.options.think_time > 0:
+            await asyncio.sleep(random.expovariate(1 / self.options.think_time))
+
+
+async def run_load(url, options):
+    stats = Stats()
+    deadline = time.time() + options.duration
+    n_games = options.games or sys.maxsize
+    tables = [Table(url, options, stats) for _ in range(options.players // 2)]
+    start = time.perf_counter()
+    tasks = []
+    for table in tables:
+        tasks.append(asyncio.ensure_future(table.run(deadline, n_games)))
+        # ramp up the connections instead of opening all of them at once
+        await asyncio.sleep(options.ramp_up / len(tables))
+    if tables:
+        spectators = [Spectator(url, options, stats, tables[0]) for _ in range(options.spectators)]
+        for spectator in spectators:
+            tasks.append(asyncio.ensure_future(spectator.run(deadline)))
+            await asyncio.sleep(options.ramp_up / len(spectators))
+    bot_games = [BotGame(url, options, stats) for _ in range(options.bot_games)]
+    for bot_game in bot_games:
+        tasks.append(asyncio.ensure_future(bot_game.run(deadline)))
+        await asyncio.sleep(options.ramp_up / len(bot_games))
+    await asyncio.gather(*tasks)
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+def parse_options(args=None):
+    parser = argparse.ArgumentParser(description='Simulate many players playing full games.')
+    parser.add_argument('--players', type=int, default=200, help='number of simulated players, in pairs')
+    parser.add_argument('--games', type=int, default=0, help='games per pair, 0 for as many as fit in the duration')
+    parser.add_argument('--duration', type=float, default=60, help='seconds before the pairs stop starting games')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean pause before each move, in seconds')
+    parser.add_argument('--reload-rate', type=float, default=0.005, help='chance of a page reload before each roll')
+    parser.add_argument('--leave-rate', type=float, default=0.001, help='chance of leaving the game before each roll')
+    parser.add_argument('--spectators', type=int, default=0, help='number of spectators of the games of the first pair')
+    parser.add_argument('--bot-games', type=int, default=0, help='number of players playing against the bot at the same time')
+    parser.add_argument('--bot-level', default='optimal', help='level of the bot: greedy, montecarlo or optimal')
+    parser.add_argument('--codec', default=Codec.JSON, help='wire format of the players: json or msgpack')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which the players connect')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for a reply')
+    parser.add_argument('--url', help='server to test, by default server.py is started on a free port')
+    parser.add_argument('--mode', default='threading', help='server mode when server.py is started')
+    return parser.parse_args(args)
+
+
+def main():
+    options = parse_options()
+    if options.url:
+        asyncio.run(run_load(options.url, options))
+        return
+    port = get_free_port()
+    process = start_server(options.mode, port)
+    try:
+        asyncio.run(run_load('http://127.0.0.1:%d' % port, options))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+This code checks the presence feed of app.Lobby as the lobby page of the client follows it,
+like src/webpages/Lobby.js: the client reads the lobby page by page while players join, leave
+and start games, applies the lobbyUpdates newer than its snapshot, also those arriving after
+a later page, and ends up with the same players as a fresh snapshot. The pages list every
+player once in order, and a player who joins and leaves within one tick is not published.
+
+Usage (from src/server):
+    python test/lobby_test.py
+or with pytest:
+    python -m pytest test/lobby_test.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Lobby import LobbyFeed
+
+
+class Client:
+    """
+    The lobby of one client, updated like the handlers of lobbySnapshot and lobbyUpdate in Lobby.js
+    """
+    def __init__(self):
+        self.players = {}
+        # presence version of the snapshot, older changes are already in it
+        self.version = -1
+        # cursor of the next page to ask for, None when all pages have been read
+        self.next_cursor = None
+        # the lobbyUpdates on their way, a page may arrive before them
+        self.inbox = []
+
+    def on_snapshot(self, page):
+        if self.version == -1 or page['version'] < self.version:
+            self.version = page['version']
+        for player in page['players']:
+            self.players[player['pid']] = player
+        self.next_cursor = page['next_cursor']
+
+    def on_update(self, changes):
+        if changes['version'] <= self.version:
+            return
+        for player in changes['joined']:
+            self.players[player['pid']] = player
+        for pid in changes['left'] + changes['busy']:
+            self.players.pop(pid, None)
+
+
+def read_all(feed, limit):
+    """
+    return: the players of all pages of a fresh snapshot, key pid
+    """
+    client = Client()
+    client.on_snapshot(feed.snapshot(limit=limit))
+    while client.next_cursor is not None:
+        client.on_snapshot(feed.snapshot(cursor=client.next_cursor, limit=limit))
+    return client.players
+
+
+def change_lobby(feed, rng, n_pids):
+    pid = 'player-%03d' % rng.randrange(n_pids)
+    if pid in feed and rng.random() < 0.6:
+        feed.remove(pid, rng.choice(('left', 'busy')))
+    else:
+        # a new name when the player comes back
+        feed.add(pid, {'pid': pid, 'username': 'name-%d' % rng.randrange(1000)})
+
+
+def test_clients_follow_the_feed(n_steps=20000, n_pids=60, limit=7):
+    rng = random.Random(1)
+    feed = LobbyFeed()
+    for _ in range(n_pids // 2):
+        change_lobby(feed, rng, n_pids)
+    feed.drain()
+    # the subscribers of the lobby room
+    clients = []
+    for step in range(n_steps):
+        r = rng.random()
+        if r < 0.6:
+            change_lobby(feed, rng, n_pids)
+        elif r < 0.7:
+            # the tick of push_lobby_changes
+            changes = feed.drain()
+            if changes is not None:
+                for client in clients:
+                    client.inbox.append(changes)
+        elif r < 0.75:
+            # a client gets the oldest update on its way
+            waiting = [client for client in clients if client.inbox]
+            if waiting:
+                client = rng.choice(waiting)
+                client.on_update(client.inbox.pop(0))
+        elif r < 0.77:
+            # subscribe_lobby sends the first page
+            client = Client()
+            clients.append(client)
+            client.on_snapshot(feed.snapshot(limit=limit))
+        else:
+            # a client asks for its next page
+            reading = [client for client in clients if client.next_cursor is not None]
+            if reading:
+                client = rng.choice(reading)
+                client.on_snapshot(feed.snapshot(cursor=client.next_cursor, limit=limit))
+    changes = feed.drain()
+    for client in clients:
+        while client.next_cursor is not None:
+            client.on_snapshot(feed.snapshot(cursor=client.next_cursor, limit=limit))
+        if changes is not None:
+            client.inbox.append(changes)
+        for update in client.inbox:
+            client.on_update(update)
+    assert len(clients) > 100
+    fresh = read_all(feed, limit)
+    assert fresh == feed.players
+    for client in clients:
+        assert client.players == fresh
+
+
+def test_pages():
+    feed = LobbyFeed()
+    pids = ['player-%03d' % i for i in range(25)]
+    for pid in random.Random(2).sample(pids, len(pids)):
+        feed.add(pid, {'pid': pid, 'username': pid})
+    pages = [feed.snapshot(limit=10)]
+    while pages[-1]['next_cursor'] is not None:
+        pages.append(feed.snapshot(cursor=pages[-1]['next_cursor'], limit=10))
+    assert [len(page['players']) for page in pages] == [10, 10, 5]
+    assert [player['pid'] for page in pages for player in page['players']] == pids
+    # a last page that is exactly full
+    assert feed.snapshot(cursor=pids[14], limit=10)['next_cursor'] is None
+    # the cursor of a player who has left since
+    feed.remove(pids[9], 'left')
+    assert feed.snapshot(cursor=pids[9], limit=10)['players'][0]['pid'] == pids[10]
+
+
+def test_coalesced_changes():
+    feed = LobbyFeed()
+    feed.add('stays', {'pid': 'stays'})
+    feed.add('busy', {'pid': 'busy'})
+    feed.add('left', {'pid': 'left'})
+    assert feed.drain() == {
+        'version': 1, 'joined': [{'pid': 'stays'}, {'pid': 'busy'}, {'pid': 'left'}], 'left': [], 'busy': []
+    }
+    # joined and left within one tick
+    feed.add('passing', {'pid': 'passing'})
+    feed.remove('passing', 'left')
+    feed.remove('busy', 'busy')
+    feed.remove('left', 'left')
+    # left and came back within one tick, with a new name
+    feed.remove('stays', 'left')
+    feed.add('stays', {'pid': 'stays', 'username': 'new'})
+    assert feed.drain() == {'version': 2, 'joined': [{'pid': 'stays', 'username': 'new'}], 'left': ['left'], 'busy': ['busy']}
+    feed.add('passing', {'pid': 'passing'})
+    feed.remove('passing', 'busy')
+    assert feed.drain() is None
+    assert feed.snapshot()['version'] == 2
+
+
+def main():
+    test_clients_follow_the_feed()
+    test_pages()
+    test_coalesced_changes()
+    print('The clients following the lobby feed have the same players as a fresh snapshot.')
+
+
+if __name__ == '__main__':
+    main()
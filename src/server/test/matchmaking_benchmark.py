@@ -0,0 +1,47 @@
+"""
+This code measures the matchmaking queue at peak: many players join at once with
+random ratings, then they are paired tick after tick as their windows widen.
+
+Usage (from src/server):
+    python test/matchmaking_benchmark.py [n_players]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Matchmaking import MatchQueue
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queue = MatchQueue()
+    now = 0.0
+    ratings = [int(random.gauss(1500, 300)) for _ in range(n)]
+
+    start = time.perf_counter()
+    for i, rating in enumerate(ratings):
+        queue.join(i, rating, now)
+    elapsed = time.perf_counter() - start
+    print('%d players joined: %.2f us per join' % (n, elapsed / n * 1e6))
+
+    # then they are paired, the ones too far from everyone stay every tick of 0.5 seconds, like match_waiting_players
+    ticks = 0
+    while len(queue) > 1 and ticks < 100:
+        now += 0.5
+        ticks += 1
+        waiting = len(queue)
+        start = time.perf_counter()
+        for pid in queue.waiting():
+            if pid in queue:
+                queue.find_opponent(pid, now)
+        elapsed = time.perf_counter() - start
+        if waiting > len(queue):
+            print('Tick %3d: %6d waiting, %6d paired in %7.2f ms' % (ticks, waiting, waiting - len(queue), elapsed * 1e3))
+
+
+if __name__ == '__main__':
+    main()
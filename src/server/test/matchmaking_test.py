@@ -0,0 +1,80 @@
+"""
+This code checks the pairing of app.Matchmaking against a scan of all the waiting players:
+players join, leave and look for opponents at random, and every opponent found must be the
+one the scan finds: the longest waiting player of the same rating, else the nearest rating
+below or above that is within the window of either player.
+
+Usage (from src/server):
+    python test/matchmaking_test.py
+or with pytest:
+    python -m pytest test/matchmaking_test.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Matchmaking import MatchQueue, search_window
+
+
+def reference_opponent(players, pid, now):
+    """
+    players - key: pid, in the order of joining, value: (rating, time of joining)
+    """
+    rating, joined = players[pid]
+    others = [(other, entry) for other, entry in players.items() if other != pid]
+    same = [other for other, entry in others if entry[0] == rating]
+    if same:
+        return same[0]
+    candidates = []
+    below = [entry[0] for other, entry in others if entry[0] < rating]
+    if below:
+        candidates.append(next(other for other, entry in others if entry[0] == max(below)))
+    above = [entry[0] for other, entry in others if entry[0] > rating]
+    if above:
+        candidates.append(next(other for other, entry in others if entry[0] == min(above)))
+    best = None
+    for other in candidates:
+        distance = abs(players[other][0] - rating)
+        window = max(search_window(now - joined), search_window(now - players[other][1]))
+        if distance <= window and (best is None or distance < best[0]):
+            best = (distance, other)
+    return None if best is None else best[1]
+
+
+def test_pairing(n_steps=5000, seed=1):
+    rng = random.Random(seed)
+    queue = MatchQueue()
+    players = {}
+    now = 0.0
+    for step in range(n_steps):
+        now += rng.random()
+        action = rng.random()
+        pid = 'player-%d' % rng.randrange(200)
+        if action < 0.5:
+            rating = int(rng.gauss(1500, 200))
+            queue.join(pid, rating, now)
+            players.pop(pid, None)
+            players[pid] = (rating, now)
+        elif action < 0.7:
+            assert queue.leave(pid) == (pid in players)
+            players.pop(pid, None)
+        elif players:
+            pid = rng.choice(list(players))
+            expected = reference_opponent(players, pid, now)
+            assert queue.find_opponent(pid, now) == expected, step
+            if expected is not None:
+                del players[pid], players[expected]
+        assert len(queue) == len(players)
+        assert queue.waiting() == list(players)
+
+
+def main():
+    test_pairing()
+    print('The matchmaking queue pairs the players like a scan of the queue.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+This code measures the memory used by live games and online players.
+
+Usage (from src/server):
+    python test/memory_benchmark.py [n_games]
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Game import Game
+from app.Player import Player
+
+
+def measure(build, n):
+    """
+    Return the number of bytes allocated by build(n) and still alive, divided by n
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(n)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / n
+
+
+def build_players(n):
+    """
+    Online players as the server keeps them: the Player object and its entries
+    in online_players, sid_to_pid and available_players
+    """
+    online_players = {}
+    sid_to_pid = {}
+    available_players = {}
+    for _ in range(n):
+        pid = str(uuid.uuid4())
+        sid = uuid.uuid4().hex[:20]
+        player = Player(pid=pid, sid=sid, ip='127.0.0.1')
+        online_players[pid] = player
+        sid_to_pid[sid] = pid
+        available_players[pid] = player.to_dict()
+    return online_players, sid_to_pid, available_players
+
+
+def build_games(n):
+    """
+    Games in the middle of the match, without the players
+    """
+    p1 = Player(pid='player1')
+    p2 = Player(pid='player2')
+    games = {}
+    for _ in range(n):
+        game = Game(p1, p2)
+        for key in ('1s', '2s', 'chance'):
+            game.roll([0, 1, 2, 3, 4])
+            game.fill(key)
+        game.roll([0, 1, 2, 3, 4])
+        games[game.get_game_id()] = game
+    return games
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('Bytes per live game:     %8.1f' % measure(build_games, n))
+    print('Bytes per online player: %8.1f' % measure(build_players, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+This code measures what the outbox of app.Outbox trades: the load test of test/load_harness.py
+on a new server for each tick, from 0 (every emit sent at once) to the ticks given, with the
+frames the server has sent per game and the roll and fill latency of the players. A tick saves
+the frames of the messages to the same target that meet in it, like the last scoring and the end
+of a game, or a burst of moves, and adds up to one tick to the latency of every move.
+
+It needs the client extra of python-socketio: pip install "python-socketio[asyncio_client]"
+
+Usage (from src/server):
+    python test/outbox_benchmark.py [seconds] [n_players] [mode] [tick_ms ...]
+"""
+
+import asyncio
+import re
+import sys
+import urllib.request
+
+from load_harness import parse_options, run_load
+from server_benchmark import get_free_port, start_server, percentile
+
+
+def get_emits(url):
+    """
+    Return the number of frames sent by the server, from its metrics
+    """
+    text = urllib.request.urlopen(url + '/metrics').read().decode()
+    return int(re.search(r'^yahtzee_emits_total (\d+)', text, re.M).group(1))
+
+
+def run(n_players, seconds, mode, tick):
+    options = parse_options([
+        '--players', str(n_players), '--duration', str(seconds), '--think-time', '0.05',
+        '--leave-rate', '0', '--reload-rate', '0', '--mode', mode
+    ])
+    port = get_free_port()
+    url = 'http://127.0.0.1:%d' % port
+    process = start_server(options.mode, port, YAHTZEE_EMIT_TICK=str(tick))
+    try:
+        print('--- tick of %s ms' % tick)
+        stats = asyncio.run(run_load(url, options))
+        return stats, get_emits(url)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    n_players = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'threading'
+    ticks = [0] + ([float(tick) for tick in sys.argv[4:]] or [5, 20])
+    results = [(tick, run(n_players, seconds, mode, tick)) for tick in ticks]
+
+    print()
+    print('%d players, %s mode' % (n_players, mode))
+    print('%-8s %8s %12s %10s %10s %10s %10s' % ('tick', 'games', 'frames/game', 'roll p50', 'roll p99', 'fill p50', 'fill p99'))
+    for tick, (stats, emits) in results:
+        roll, fill = stats.latencies['roll'], stats.latencies['fill']
+        print('%-6gms %8d %12.1f %8.2fms %8.2fms %8.2fms %8.2fms' % (
+            tick, stats.games, emits / max(stats.games, 1), percentile(roll, 50) * 1000, percentile(roll, 99) * 1000,
+            percentile(fill, 50) * 1000, percentile(fill, 99) * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+This code checks the order of the messages sent by app.Outbox: the messages of the rooms and
+of the sessions leave in the order they were emitted, the runs of messages to one target are
+batched, a gameUpdate following another one to the same target is merged, and an urgent event
+goes after the messages waiting.
+
+Usage (from src/server):
+    python test/outbox_test.py
+or with pytest:
+    python -m pytest test/outbox_test.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Outbox import Outbox
+
+
+class RecordingTransport:
+    def __init__(self):
+        # the frames sent, as (target, event, data)
+        self.frames = []
+
+    def emit(self, event, data=None, to=None):
+        self.frames.append((to, event, data))
+
+    def enter_room(self, sid, room):
+        self.frames.append((room, 'enter', sid))
+
+
+def merge(event, earlier, later):
+    return earlier + later if event == 'gameUpdate' else None
+
+
+def test_order_of_targets():
+    transport = RecordingTransport()
+    outbox = Outbox(transport, 1, urgent=('enterNewGame',), merge=merge)
+    outbox.emit('rank', 1, to='sid')
+    outbox.emit('gameUpdate', [1], to='room')
+    outbox.emit('gameOver', 'a', to='room')
+    outbox.emit('ratingUpdate', 2, to='sid')
+    assert len(outbox) == 4
+    outbox.flush()
+    assert transport.frames == [
+        ('sid', 'rank', 1),
+        ('room', 'batch', [['gameUpdate', [1]], ['gameOver', 'a']]),
+        ('sid', 'ratingUpdate', 2),
+    ]
+    assert len(outbox) == 0
+
+
+def test_merge():
+    transport = RecordingTransport()
+    outbox = Outbox(transport, 1, merge=merge)
+    outbox.emit('gameUpdate', [1], to='room')
+    outbox.emit('gameUpdate', [2], to='room')
+    # not merged over a message to another target
+    outbox.emit('rank', 1, to='sid')
+    outbox.emit('gameUpdate', [3], to='room')
+    outbox.flush()
+    assert transport.frames == [('room', 'gameUpdate', [1, 2]), ('sid', 'rank', 1), ('room', 'gameUpdate', [3])]
+
+
+def test_urgent_after_waiting():
+    transport = RecordingTransport()
+    outbox = Outbox(transport, 1, urgent=('enterNewGame',))
+    outbox.emit('gameOver', 'a', to='room')
+    outbox.emit('enterNewGame', 'g', to='sid')
+    outbox.emit('gameUpdate', [1], to='room')
+    outbox.enter_room('sid', 'room')
+    assert transport.frames == [
+        ('room', 'gameOver', 'a'), ('sid', 'enterNewGame', 'g'), ('room', 'gameUpdate', [1]), ('room', 'enter', 'sid')
+    ]
+
+
+def main():
+    test_order_of_targets()
+    test_merge()
+    test_urgent_after_waiting()
+    print('The outbox sends the messages in the order of the emits.')
+
+
+if __name__ == '__main__':
+    main()
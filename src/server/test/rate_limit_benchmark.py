@@ -0,0 +1,106 @@
+"""
+This code measures the latency of the players while one abusive client floods the server:
+the load test of test/load_harness.py with a client sending lobby pages and invitations to
+itself at flood_rate messages per second, first without rate limits, then with them, each
+time on a new server. With the limits, the flood is dropped before it reaches the handlers,
+so the roll and fill latency of the players should stay about the same as without the flood.
+
+It needs the client extra of python-socketio: pip install "python-socketio[asyncio_client]"
+
+Usage (from src/server):
+    python test/rate_limit_benchmark.py [seconds] [n_players] [flood_rate]
+"""
+
+import asyncio
+import re
+import sys
+import time
+import urllib.request
+import uuid
+
+import socketio
+
+from load_harness import parse_options, run_load
+from server_benchmark import CONNECT_TIMEOUT, get_free_port, start_server, percentile
+
+
+async def flood(url, flood_rate, done):
+    """
+    Send flood_rate requests per second until done is set, without waiting for the replies
+    return: the number of requests sent
+    """
+    sio = socketio.AsyncClient(reconnection=False)
+    await sio.connect(url, transports=['websocket'], wait_timeout=CONNECT_TIMEOUT)
+    pid = str(uuid.uuid4())
+    await sio.emit('register_player', {'playerId': pid})
+    sent = 0
+    start = time.perf_counter()
+    while not done.is_set():
+        await sio.emit('get_lobby_page', {'cursor': None, 'limit': 100})
+        await sio.emit('send_invite', {'inviter': pid, 'invitee': pid})
+        sent += 2
+        await asyncio.sleep(max(0, start + sent / flood_rate - time.perf_counter()))
+    await sio.disconnect()
+    return sent
+
+
+async def run_with_flood(url, options, flood_rate):
+    done = asyncio.Event()
+    flooder = asyncio.ensure_future(flood(url, flood_rate, done))
+    try:
+        stats = await run_load(url, options)
+    finally:
+        done.set()
+    return stats, await flooder
+
+
+def get_dropped(url):
+    """
+    Return the number of events dropped by the rate limits, from the metrics of the server
+    """
+    text = urllib.request.urlopen(url + '/metrics').read().decode()
+    return sum(int(n) for n in re.findall(r'^yahtzee_events_dropped_total\{[^}]*reason="rate_limited"\} (\d+)', text, re.M))
+
+
+def run(n_players, flood_rate, seconds, rate_limit):
+    options = parse_options([
+        '--players', str(n_players), '--duration', str(seconds), '--leave-rate', '0', '--reload-rate', '0'
+    ])
+    port = get_free_port()
+    url = 'http://127.0.0.1:%d' % port
+    process = start_server(options.mode, port, YAHTZEE_RATE_LIMIT=rate_limit)
+    try:
+        print('--- flood of %d messages/s, rate limit %s' % (flood_rate, rate_limit))
+        if flood_rate:
+            stats, sent = asyncio.run(run_with_flood(url, options, flood_rate))
+        else:
+            stats, sent = asyncio.run(run_load(url, options)), 0
+        return stats, sent, get_dropped(url)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    n_players = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    flood_rate = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    results = [
+        ('no flood', run(n_players, 0, seconds, '1')),
+        ('no limits', run(n_players, flood_rate, seconds, '0')),
+        ('limits', run(n_players, flood_rate, seconds, '1')),
+    ]
+
+    print()
+    print('%d players, one client flooding %d messages/s' % (n_players, flood_rate))
+    print('%-10s %10s %10s %10s %10s %12s %10s' % ('', 'roll p50', 'roll p99', 'fill p50', 'fill p99', 'flood sent', 'dropped'))
+    for name, (stats, sent, dropped) in results:
+        roll, fill = stats.latencies['roll'], stats.latencies['fill']
+        print('%-10s %8.2fms %8.2fms %8.2fms %8.2fms %12d %10d' % (
+            name, percentile(roll, 50) * 1000, percentile(roll, 99) * 1000,
+            percentile(fill, 50) * 1000, percentile(fill, 99) * 1000, sent, dropped
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+This code checks the events dropped before they reach a game. The token buckets of
+app.RateLimit allow a burst, then refill at their rate up to the burst, share the default
+bucket between the events not listed, and forget the sessions that left. check_move of
+app.Handlers drops a move off turn, a fourth roll, a roll of bad dice indexes, and a scoring
+before the roll, of an unknown key or of a key already filled, and leaves the game as it was.
+The hints of get_advice only go to the active player of the game.
+
+Usage (from src/server):
+    python test/rate_limit_test.py
+or with pytest:
+    python -m pytest test/rate_limit_test.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from state_stress_test import Handlers, call, errors, register, use_recording_transport
+from app.RateLimit import RateLimiter
+
+
+LIMITS = {'disconnect': None, 'roll': (4, 8), 'default': (10, 30)}
+
+
+def take(limiter, sid, event, n, now):
+    """
+    return: how many of n events at the same time are allowed
+    """
+    return sum(limiter.allow(sid, event, now=now) for _ in range(n))
+
+
+def test_burst_and_refill():
+    limiter = RateLimiter(LIMITS)
+    now = 100.0
+    assert take(limiter, 'sid', 'roll', 20, now) == 8
+    # 4 tokens per second
+    assert take(limiter, 'sid', 'roll', 20, now + 0.5) == 2
+    assert take(limiter, 'sid', 'roll', 20, now + 1.5) == 4
+    # the bucket is never fuller than the burst
+    assert take(limiter, 'sid', 'roll', 20, now + 100) == 8
+    # an event dropped takes no token
+    assert not limiter.allow('sid', 'roll', now=now + 100.1)
+    assert not limiter.allow('sid', 'roll', now=now + 100.2)
+    assert limiter.allow('sid', 'roll', now=now + 100.25)
+    # the sessions have buckets of their own
+    assert take(limiter, 'other', 'roll', 20, now + 100.25) == 8
+
+
+def test_default_and_unlimited():
+    limiter = RateLimiter(LIMITS)
+    now = 100.0
+    # the events not listed share the default bucket
+    assert take(limiter, 'sid', 'get_rank', 20, now) + take(limiter, 'sid', 'lobby_page', 20, now) == 30
+    assert take(limiter, 'sid', 'disconnect', 1000, now) == 1000
+    # half the rates and bursts, and no limits at all
+    assert take(RateLimiter(LIMITS, 0.5), 'sid', 'roll', 20, now) == 4
+    assert take(RateLimiter(LIMITS, 0), 'sid', 'roll', 1000, now) == 1000
+
+
+def test_forget_and_sweep():
+    limiter = RateLimiter(LIMITS)
+    now = 100.0
+    take(limiter, 'gone', 'roll', 20, now)
+    take(limiter, 'gone', 'get_rank', 20, now)
+    limiter.forget('gone')
+    assert limiter.buckets == {}
+    assert take(limiter, 'gone', 'roll', 20, now) == 8
+
+    take(limiter, 'quiet', 'roll', 1, now)
+    take(limiter, 'busy', 'roll', 8, now + 1.9)
+    # the buckets of gone and quiet have refilled, the busy one is still almost empty
+    assert limiter.sweep(now=now + 2) == 2
+    assert list(limiter.buckets) == [('busy', 'roll')]
+
+
+def start_game(a, b):
+    use_recording_transport()
+    register(a)
+    register(b)
+    call('accept_invite', 'sid-' + b, {'inviter': a, 'invitee': b})
+    return Handlers.ongoing_games[Handlers.online_players[a].game_id]
+
+
+def check(sid, game, event, **message):
+    return Handlers.check_move(sid, game, event, dict(message, game_id=game.get_game_id()))
+
+
+def sids(game):
+    """
+    return: the sids of the active player and of the opponent
+    """
+    active = Handlers.get_active_player_object(game)
+    opponent = Handlers.get_opponent(game, active.pid)
+    return 'sid-' + active.pid, 'sid-' + opponent.pid
+
+
+def test_check_move():
+    del errors[:]
+    game = start_game('check-a', 'check-b')
+    active, opponent = sids(game)
+    assert check(opponent, game, 'roll', index=[0, 1, 2, 3, 4]) == 'not_your_turn'
+    assert check('sid-unknown', game, 'roll', index=[0, 1, 2, 3, 4]) == 'not_your_turn'
+    assert check(active, game, 'fill', key='1s') == 'not_rolled'
+    for index in ([0, 1, 2], [0, 1, 2, 3, 5], [-1, 1, 2, 3, 4], [0, 0, 1, 2, 3], '01234', None, [0, 1, 2, 3, 4.0]):
+        assert check(active, game, 'roll', index=index) == 'invalid_index', index
+    assert check(active, game, 'roll', index=[0, 1, 2, 3, 4]) is None
+
+    for i_roll in range(3):
+        index = [0, 1, 2, 3, 4] if i_roll == 0 else [1, 3]
+        call('roll', active, {'game_id': game.get_game_id(), 'index': index})
+        assert game.get_i_roll() == i_roll + 1
+        if i_roll == 0:
+            assert check(active, game, 'roll', index=[]) == 'invalid_index'
+            assert check(active, game, 'roll', index=[4]) is None
+    version, dice = game.get_version(), game.get_dice()
+    assert check(active, game, 'roll', index=[0]) == 'no_rolls_left'
+    # the handler drops the fourth roll without touching the game
+    call('roll', active, {'game_id': game.get_game_id(), 'index': [0]})
+    assert (game.get_version(), game.get_dice()) == (version, dice)
+
+    assert check(active, game, 'fill', key='sixes_and_sevens') == 'invalid_key'
+    assert check(active, game, 'fill', key=None) == 'invalid_key'
+    assert check(opponent, game, 'fill', key='1s') == 'not_your_turn'
+    assert check(active, game, 'fill', key='1s') is None
+    call('fill', active, {'game_id': game.get_game_id(), 'key': '1s'})
+
+    # the opponent plays a turn, then the first player has filled 1s already
+    call('roll', opponent, {'game_id': game.get_game_id(), 'index': [0, 1, 2, 3, 4]})
+    call('fill', opponent, {'game_id': game.get_game_id(), 'key': '1s'})
+    call('roll', active, {'game_id': game.get_game_id(), 'index': [0, 1, 2, 3, 4]})
+    assert sids(game) == (active, opponent)
+    assert check(active, game, 'fill', key='1s') == 'filled_key'
+    version = game.get_version()
+    score = game.get_score(game.get_active_player())
+    call('fill', active, {'game_id': game.get_game_id(), 'key': '1s'})
+    assert game.get_version() == version
+    assert game.get_score(game.get_active_player()) == score
+    assert check(active, game, 'fill', key='2s') is None
+
+    for sid in (active, opponent):
+        call('disconnect', sid)
+        Handlers.expire_suspension(sid[4:], sid)
+    assert game.get_game_id() not in Handlers.ongoing_games
+    assert errors == []
+
+
+def test_advice_only_for_the_active_player():
+    del errors[:]
+    game = start_game('advice-a', 'advice-b')
+    active, opponent = sids(game)
+    call('roll', active, {'game_id': game.get_game_id(), 'index': [0, 1, 2, 3, 4]})
+    for sid in (opponent, 'spectator', active):
+        call('get_advice', sid, {'game_id': game.get_game_id()})
+    assert not any(event == 'advice' for event, data in Handlers.transport.received.get(opponent, []))
+    assert 'spectator' not in Handlers.transport.received
+    advice = [data for event, data in Handlers.transport.received.get(active, []) if event == 'advice']
+    assert len(advice) == 1 and advice[0]['version'] == game.get_version() and len(advice[0]['holds']) == 32
+
+    for sid in (active, opponent):
+        call('disconnect', sid)
+        Handlers.expire_suspension(sid[4:], sid)
+    assert errors == []
+
+
+def main():
+    test_burst_and_refill()
+    test_default_and_unlimited()
+    test_forget_and_sweep()
+    test_check_move()
+    test_advice_only_for_the_active_player()
+    print('The rate limits and the checks of the moves drop the events they should.')
+
+
+if __name__ == '__main__':
+    main()
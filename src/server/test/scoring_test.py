@@ -0,0 +1,123 @@
+"""
+This code checks the scoring table of app.Scoring against a straightforward scoring of each
+category, for all 7776 ordered rolls of 5 dice, and that every roll maps to the dice id of its
+sorted dice. In played games, the preview of app.Game.get_preview is what filling each open
+scoring would score, and the total grows by it plus the upper bonus when it is reached.
+
+Usage (from src/server):
+    python test/scoring_test.py
+or with pytest:
+    python -m pytest test/scoring_test.py
+"""
+
+import copy
+import os
+import random
+import sys
+from itertools import product
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import (
+    CATEGORIES, CATEGORY_INDEX, DICE_MULTISETS, N_DICE_MULTISETS, N_UPPER, UPPER_BONUS, UPPER_BONUS_THRESHOLD,
+    get_dice_id, get_scores
+)
+
+
+def reference_score(dice, key):
+    """
+    The score of one scoring, counted from the dice the way a player would
+    """
+    counts = [dice.count(face) for face in range(1, 7)]
+    faces = set(dice)
+    if key in ('1s', '2s', '3s', '4s', '5s', '6s'):
+        face = int(key[0])
+        return face * dice.count(face)
+    if key == '3-of-a-kind':
+        return sum(dice) if max(counts) >= 3 else 0
+    if key == '4-of-a-kind':
+        return sum(dice) if max(counts) >= 4 else 0
+    if key == 'full-house':
+        return 25 if sorted(n for n in counts if n) == [2, 3] else 0
+    if key == 'small-straight':
+        straights = ({1, 2, 3, 4}, {2, 3, 4, 5}, {3, 4, 5, 6})
+        return 30 if any(straight <= faces for straight in straights) else 0
+    if key == 'large-straight':
+        return 40 if faces in ({1, 2, 3, 4, 5}, {2, 3, 4, 5, 6}) else 0
+    if key == 'yahtzee':
+        return 50 if len(faces) == 1 else 0
+    if key == 'chance':
+        return sum(dice)
+    raise KeyError(key)
+
+
+def test_scores_of_all_rolls():
+    for dice in product(range(1, 7), repeat=5):
+        expected = tuple(reference_score(dice, key) for key in CATEGORIES)
+        assert tuple(get_scores(dice)) == expected, dice
+
+
+def test_dice_ids():
+    assert N_DICE_MULTISETS == 252
+    for dice in product(range(1, 7), repeat=5):
+        assert DICE_MULTISETS[get_dice_id(dice)] == tuple(sorted(dice)), dice
+
+
+def choose_move(game, rng):
+    """
+    Keep the most common face and score it in the upper section when there are three of it,
+    so that the upper bonus is reached in many games
+    return: the dice to roll again, or the key to fill
+    """
+    dice = game.get_dice()
+    face = max(range(6, 0, -1), key=dice.count)
+    preview = game.get_preview()
+    upper_key = CATEGORIES[face - 1]
+    if game.get_i_roll() < 3 and dice.count(face) < 5 and rng.random() < 0.9:
+        return [i for i in range(5) if dice[i] != face]
+    if upper_key in preview and dice.count(face) >= 3:
+        return upper_key
+    return max(preview, key=lambda key: preview[key] + rng.random())
+
+
+def test_preview_matches_fill(n_games=100):
+    rng = random.Random(1)
+    n_bonus = 0
+    for _ in range(n_games):
+        game = Game(Player('player-1'), Player('player-2'), seed=rng.getrandbits(64))
+        assert game.get_preview() == {}
+        while True:
+            game.roll([0, 1, 2, 3, 4])
+            move = choose_move(game, rng)
+            while isinstance(move, list):
+                game.roll(move)
+                move = choose_move(game, rng)
+            player_idx = game.get_active_player()
+            preview = game.get_preview()
+            assert sorted(preview) == sorted(key for key in CATEGORIES if game.get_key_score(player_idx, key) == -1)
+            for key, score in preview.items():
+                filled = copy.deepcopy(game)
+                filled.fill(key)
+                assert filled.get_key_score(player_idx, key) == score
+                upper = game.upper_sec_total[player_idx] + (score if CATEGORY_INDEX[key] < N_UPPER else 0)
+                reaches_bonus = game.bonus[player_idx] == 0 and upper >= UPPER_BONUS_THRESHOLD
+                n_bonus += reaches_bonus
+                assert filled.total[player_idx] == game.total[player_idx] + score + UPPER_BONUS * reaches_bonus
+                assert filled.bonus[player_idx] == (UPPER_BONUS if reaches_bonus else game.bonus[player_idx])
+            if not game.fill(move):
+                break
+            assert game.get_preview() == {}
+    assert n_bonus > 0
+
+
+def main():
+    test_scores_of_all_rolls()
+    test_dice_ids()
+    test_preview_matches_fill()
+    print('The scoring table matches all 7776 rolls, and the preview matches the scorings filled.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+This code compares the threaded (server.py) and the asyncio (server_async.py) server modes.
+For each mode it starts the server, opens many concurrent websocket clients, registers
+them and measures the round trip of get_lobby_page -> lobbySnapshot under load.
+
+It needs the client extra of python-socketio: pip install "python-socketio[asyncio_client]"
+
+Usage (from src/server):
+    python test/server_benchmark.py [n_clients] [n_requests_per_client] [threading|asyncio|both]
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import socketio
+
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONNECT_TIMEOUT = 30
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, **settings):
+    """
+    Start server.py in a subprocess in the given mode and wait until it accepts connections.
+    The simulated clients send as fast as they can, so the rate limits are off unless
+    YAHTZEE_RATE_LIMIT is set; settings are more environment variables of the server.
+    """
+    env = dict(os.environ, YAHTZEE_SERVER_MODE=mode, YAHTZEE_HOST='127.0.0.1', YAHTZEE_PORT=str(port))
+    env.setdefault('YAHTZEE_RATE_LIMIT', '0')
+    env.update(settings)
+    process = subprocess.Popen(
+        [sys.executable, 'server.py'], cwd=SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + CONNECT_TIMEOUT
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('The %s server did not start.' % mode)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+class BenchmarkClient:
+    """
+    One player: wait for each reply before sending the next request
+    """
+    def __init__(self):
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.replies = asyncio.Queue()
+        for event in ('registerSuccessResponse', 'lobbySnapshot'):
+            self.sio.on(event, self.replies.put_nowait)
+
+    async def request(self, event, message):
+        start = time.perf_counter()
+        await self.sio.emit(event, message)
+        await self.replies.get()
+        return time.perf_counter() - start
+
+    async def run(self, url, n_requests, all_connected, latencies):
+        try:
+            await self.sio.connect(url, transports=['websocket'], wait_timeout=CONNECT_TIMEOUT)
+        except Exception:
+            all_connected.append(False)
+            return
+        all_connected.append(True)
+        try:
+            await self.request('register_player', {'playerId': str(uuid.uuid4())})
+            for _ in range(n_requests):
+                latencies.append(await self.request('get_lobby_page', {'cursor': None, 'limit': 1}))
+        finally:
+            await self.sio.disconnect()
+
+
+async def run_clients(url, n_clients, n_requests):
+    connected = []
+    latencies = []
+    clients = [BenchmarkClient() for _ in range(n_clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*[client.run(url, n_requests, connected, latencies) for client in clients])
+    return sum(connected), latencies, time.perf_counter() - start
+
+
+def benchmark(mode, n_clients, n_requests):
+    port = get_free_port()
+    process = start_server(mode, port)
+    try:
+        n_connected, latencies, elapsed = asyncio.run(
+            run_clients('http://127.0.0.1:%d' % port, n_clients, n_requests)
+        )
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'mode': mode,
+        'connected': n_connected,
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    modes = ['threading', 'asyncio'] if len(sys.argv) <= 3 or sys.argv[3] == 'both' else [sys.argv[3]]
+    print('%d clients, %d requests each' % (n_clients, n_requests))
+    print('%-10s %10s %10s %12s %9s %9s' % ('mode', 'connected', 'requests', 'requests/s', 'p50 ms', 'p99 ms'))
+    for mode in modes:
+        result = benchmark(mode, n_clients, n_requests)
+        print('%-10s %10d %10d %12.0f %9.2f %9.2f' % (
+            result['mode'], result['connected'], result['requests'], result['throughput'], result['p50'], result['p99']
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+This code checks the spectators of app.Handlers: a game takes at most MAX_SPECTATORS of them and
+rejects the others until one leaves, and a spectator gets the watchSnapshot of the game, then
+gameUpdates of later versions only, however the moves, the ticks of push_spectator_updates and
+the arrival of other spectators interleave, up to the last move, gameOver and watchEnded.
+
+Usage (from src/server):
+    python test/spectator_test.py
+or with pytest:
+    python -m pytest test/spectator_test.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from state_stress_test import Handlers, RecordingTransport, call, errors, register, use_recording_transport
+from app import Config
+from app.Scoring import CATEGORIES
+
+
+class RoomTransport(RecordingTransport):
+    """
+    RecordingTransport that also delivers the events of a room to the sessions in it
+    """
+    def __init__(self):
+        super().__init__()
+        # key: room, value: set of sids
+        self.rooms = {}
+
+    def emit(self, event, data=None, to=None):
+        with self.lock:
+            for sid in [to] + sorted(self.rooms.get(to, ())):
+                self.received.setdefault(sid, []).append((event, data))
+
+    def enter_room(self, sid, room):
+        with self.lock:
+            self.rooms.setdefault(room, set()).add(sid)
+
+    def leave_room(self, sid, room):
+        with self.lock:
+            self.rooms.get(room, set()).discard(sid)
+
+    def close_room(self, room):
+        with self.lock:
+            self.rooms.pop(room, None)
+
+
+def with_room_transport(test):
+    """
+    Run a test of the handlers on a RoomTransport, the test moves push_spectator_updates on by itself
+    """
+    def run():
+        use_recording_transport()
+        del errors[:]
+        transport, ticker_started = Handlers.transport, Handlers.spectator_ticker_started
+        Handlers.transport = RoomTransport()
+        Handlers.spectator_ticker_started = True
+        try:
+            test()
+        finally:
+            Handlers.transport, Handlers.spectator_ticker_started = transport, ticker_started
+        assert errors == []
+    run.__name__ = test.__name__
+    return run
+
+
+def start_game(a, b):
+    register(a)
+    register(b)
+    call('accept_invite', 'sid-' + b, {'inviter': a, 'invitee': b})
+    return Handlers.online_players[a].game_id
+
+
+def received(sid):
+    return Handlers.transport.received.get(sid, [])
+
+
+def play_move(game_id, rng):
+    """
+    Roll, or fill an open scoring after a roll
+    return: whether the game goes on
+    """
+    game = Handlers.ongoing_games[game_id]
+    player_idx = game.get_active_player()
+    player = game.p1 if player_idx == 0 else game.p2
+    message = {'game_id': game_id, 'player_id': player.pid}
+    if game.get_i_roll() == 0 or (game.get_i_roll() < 3 and rng.random() < 0.5):
+        call('roll', 'sid-' + player.pid, dict(message, index=[0, 1, 2, 3, 4]))
+        return True
+    key = rng.choice([key for key in CATEGORIES if game.get_key_score(player_idx, key) == -1])
+    call('fill', 'sid-' + player.pid, dict(message, key=key))
+    return game_id in Handlers.ongoing_games
+
+
+@with_room_transport
+def test_spectator_cap():
+    max_spectators = Config.MAX_SPECTATORS
+    Config.MAX_SPECTATORS = 2
+    try:
+        game_id = start_game('cap-a', 'cap-b')
+        call('watch_game', 'cap-spectator-0', {'game_id': 'no-such-game'})
+        assert received('cap-spectator-0')[-1] == ('watchRejected', {'game_id': 'no-such-game', 'reason': 'not found'})
+        for i in range(3):
+            call('watch_game', 'cap-spectator-%d' % i, {'game_id': game_id})
+        assert received('cap-spectator-0')[-1][0] == 'watchSnapshot'
+        assert received('cap-spectator-1')[-1][0] == 'watchSnapshot'
+        assert received('cap-spectator-2')[-1] == ('watchRejected', {'game_id': game_id, 'reason': 'full'})
+        assert Handlers.spectators[game_id] == 2
+        # watching the same game again does not take another seat
+        call('watch_game', 'cap-spectator-1', {'game_id': game_id})
+        assert Handlers.spectators[game_id] == 2
+        call('unwatch_game', 'cap-spectator-0')
+        call('watch_game', 'cap-spectator-2', {'game_id': game_id})
+        assert received('cap-spectator-2')[-1][0] == 'watchSnapshot'
+        assert Handlers.spectators[game_id] == 2
+        # a spectator who disconnects leaves the seat
+        call('disconnect', 'cap-spectator-1')
+        assert Handlers.spectators[game_id] == 1
+    finally:
+        Config.MAX_SPECTATORS = max_spectators
+    call('disconnect', 'cap-spectator-2')
+    for pid in ('cap-a', 'cap-b'):
+        call('disconnect', 'sid-' + pid)
+        Handlers.expire_suspension(pid, 'sid-' + pid)
+    assert game_id not in Handlers.spectators
+
+
+@with_room_transport
+def test_spectators_get_later_versions(n_games=5):
+    rng = random.Random(1)
+    ticker = Handlers.push_spectator_updates()
+    next(ticker)
+    for i in range(n_games):
+        game_id = start_game('watched-%d-a' % i, 'watched-%d-b' % i)
+        sids = []
+        going_on = True
+        while going_on:
+            r = rng.random()
+            if r < 0.1:
+                sid = 'spectator-%d-%d' % (i, len(sids))
+                sids.append(sid)
+                call('watch_game', sid, {'game_id': game_id})
+            elif r < 0.35:
+                next(ticker)
+            else:
+                # every move makes a new version
+                last_version = Handlers.ongoing_games[game_id].get_version() + 1
+                going_on = play_move(game_id, rng)
+        next(ticker)
+        assert len(sids) > 2
+        assert game_id not in Handlers.spectators
+        for sid in sids:
+            events = received(sid)
+            assert events[0][0] == 'watchSnapshot'
+            version = events[0][1]['state']['version']
+            for event, data in events[1:]:
+                if event == 'gameUpdate':
+                    assert data['version'] > version, (sid, data['version'], version)
+                    version = data['version']
+            # up to the last scoring of the game
+            assert version == last_version
+            assert [event for event, data in events[-2:]] == ['gameOver', 'watchEnded']
+            assert sid not in Handlers.watching
+
+
+def main():
+    test_spectator_cap()
+    test_spectators_get_later_versions()
+    print('The spectators are capped, and get the snapshot of a game then only its later versions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+This code hammers the races between the handlers of the in-memory store from many threads
+at once, and checks the state after every round:
+    - many invitees accept the invitation of the same inviter: one game only
+    - the last scoring of a game against the disconnect and the expiry of the players
+    - one player registering from many sessions at once
+    - the opponent inviting the winner again as soon as the game is over
+Every player is in at most one game, the lobby only has players without a game, and no
+handler raises. With --unlocked, the locks of the store are skipped to show the races.
+With --sqlite, the handlers run on the SQLite store in a temporary file, each event in its
+BEGIN IMMEDIATE transaction, as between the workers of the asyncio server.
+
+Usage (from src/server):
+    python test/state_stress_test.py [n_rounds] [n_threads] [--unlocked | --sqlite]
+or a few rounds with pytest:
+    python -m pytest test/state_stress_test.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import nullcontext
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if '--sqlite' in sys.argv:
+    os.environ['YAHTZEE_STATE_STORE'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'state.db')
+else:
+    os.environ['YAHTZEE_STATE_STORE'] = 'memory'
+os.environ['YAHTZEE_EVENT_LOG'] = ''
+
+from app import Handlers
+from app.Scoring import CATEGORIES
+
+
+class RecordingTransport:
+    """
+    Runs the handlers without a Socket.IO server, the sessions of the test are always connected
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: sid, value: list of (event, data)
+        self.received = {}
+
+    def emit(self, event, data=None, to=None):
+        with self.lock:
+            self.received.setdefault(to, []).append((event, data))
+
+    def enter_room(self, sid, room):
+        pass
+
+    def leave_room(self, sid, room):
+        pass
+
+    def close_room(self, room):
+        pass
+
+    def get_remote_addr(self, sid):
+        return '127.0.0.1'
+
+    def is_connected(self, sid):
+        return True
+
+    def start_task(self, task, *args):
+        def run():
+            for delay in task(*args):
+                time.sleep(delay)
+        threading.Thread(target=run, daemon=True).start()
+
+    def register(self, handlers):
+        pass
+
+
+errors = []
+
+
+def call(event, sid, *args):
+    """
+    Run the handler of an event in its transaction of the store, as the transport does
+    """
+    try:
+        Handlers.in_transaction(Handlers.EVENT_HANDLERS[event])(sid, *args)
+    except Exception:
+        errors.append(traceback.format_exc())
+
+
+def run_at_once(calls):
+    """
+    Start every call on its own thread, released together
+    """
+    barrier = threading.Barrier(len(calls))
+
+    def run(f, args):
+        barrier.wait()
+        f(*args)
+
+    threads = [threading.Thread(target=run, args=call_args) for call_args in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def register(pid):
+    sid = 'sid-' + pid
+    call('register_player', sid, {'playerId': pid})
+    return sid
+
+
+def check_state():
+    """
+    Return the broken invariants of the state shared by the handlers
+    """
+    problems = []
+    seats = {}
+    for game_id, game in list(Handlers.ongoing_games.items()):
+        for player in (game.p1, game.p2):
+            seats.setdefault(player.pid, []).append(game_id)
+            online = Handlers.online_players.get(player.pid)
+            if online is not None and online.game_id != game_id:
+                problems.append('%s plays %s but has game %s' % (player.pid, game_id, online.game_id))
+    for pid, game_ids in seats.items():
+        if len(game_ids) > 1:
+            problems.append('%s is in %d games' % (pid, len(game_ids)))
+    for pid, player in list(Handlers.online_players.items()):
+        if player.game_id != '-1' and player.game_id not in Handlers.ongoing_games:
+            problems.append('%s has the ended game %s' % (pid, player.game_id))
+    for pid in list(Handlers.lobby.players):
+        player = Handlers.online_players.get(pid)
+        if player is None or player.game_id != '-1':
+            problems.append('%s is in the lobby but %s' % (pid, 'offline' if player is None else 'in a game'))
+    return problems
+
+
+def race_invites(prefix, n_threads):
+    """
+    Every invitee accepts the invitation of the same inviter at the same time
+    return: the number of games the inviter has been seated in
+    """
+    inviter = prefix + 'inviter'
+    register(inviter)
+    invitees = [prefix + 'invitee-%d' % i for i in range(n_threads)]
+    calls = [(call, ('accept_invite', register(pid), {'inviter': inviter, 'invitee': pid})) for pid in invitees]
+    run_at_once(calls)
+    return sum(inviter in (game.p1.pid, game.p2.pid) for _, game in list(Handlers.ongoing_games.items()))
+
+
+def play_until_last_fill(game_id):
+    """
+    Play both sheets up to the last scoring of the second player, who has rolled
+    """
+    for i in range(2 * len(CATEGORIES) - 1):
+        # the SQLite store gives a copy of the game
+        game = Handlers.ongoing_games[game_id]
+        player = game.p1 if game.get_active_player() == 0 else game.p2
+        call('roll', 'sid-' + player.pid, {'game_id': game_id, 'player_id': player.pid, 'index': [0, 1, 2, 3, 4]})
+        call('fill', 'sid-' + player.pid, {'game_id': game_id, 'player_id': player.pid, 'key': CATEGORIES[i // 2]})
+    game = Handlers.ongoing_games[game_id]
+    player = game.p1 if game.get_active_player() == 0 else game.p2
+    call('roll', 'sid-' + player.pid, {'game_id': game_id, 'player_id': player.pid, 'index': [0, 1, 2, 3, 4]})
+    return player.pid
+
+
+def race_fill_and_leave(prefix):
+    """
+    The last scoring of a game against the disconnect of the player and the expiry of the opponent
+    """
+    a, b = prefix + 'a', prefix + 'b'
+    register(a)
+    register(b)
+    call('accept_invite', 'sid-' + b, {'inviter': a, 'invitee': b})
+    game_id = Handlers.online_players[a].game_id
+    if game_id == '-1':
+        return
+    last = play_until_last_fill(game_id)
+    other = a if last == b else b
+    # the opponent has lost the connection and is about to be removed
+    call('disconnect', 'sid-' + other)
+    run_at_once([
+        (call, ('fill', 'sid-' + last, {'game_id': game_id, 'player_id': last, 'key': CATEGORIES[-1]})),
+        (call, ('disconnect', 'sid-' + last)),
+        (Handlers.in_transaction(Handlers.expire_suspension), (other, 'sid-' + other)),
+        (call, ('game_initialize', 'sid-' + last, {'game_id': game_id, 'player_id': last})),
+    ])
+
+
+def race_reinvite(prefix):
+    """
+    The opponent invites the player again as soon as gameOver is sent, while the last scoring is handled
+    return: the broken invariants of the invitation
+    """
+    a, b = prefix + 'again-a', prefix + 'again-b'
+    register(a)
+    register(b)
+    call('accept_invite', 'sid-' + b, {'inviter': a, 'invitee': b})
+    game_id = Handlers.online_players[a].game_id
+    if game_id == '-1':
+        return ['%s and %s could not start a game' % (a, b)]
+    last = play_until_last_fill(game_id)
+    other = a if last == b else b
+    transport = Handlers.transport
+    invites = []
+
+    def emit(event, data=None, to=None):
+        RecordingTransport.emit(transport, event, data, to)
+        if event == 'gameOver' and to == game_id:
+            # the opponent answers the gameOver, the handler of the last scoring goes on after a while
+            invite = threading.Thread(
+                target=call, args=('send_invite', 'sid-' + other, {'inviter': other, 'invitee': last})
+            )
+            invite.start()
+            invite.join(0.01)
+            invites.append(invite)
+
+    transport.emit = emit
+    try:
+        call('fill', 'sid-' + last, {'game_id': game_id, 'player_id': last, 'key': CATEGORIES[-1]})
+    finally:
+        del transport.emit
+    for invite in invites:
+        invite.join()
+    problems = []
+    if not invites:
+        problems.append('%s got no gameOver' % game_id)
+    if any(event == 'playerNoLongerAvailable' for event, data in Handlers.transport.received.get('sid-' + other, [])):
+        problems.append('%s was not available to %s after the game' % (last, other))
+    if not any(event == 'receiveInvitation' for event, data in Handlers.transport.received.get('sid-' + last, [])):
+        problems.append('%s did not get the invitation of %s' % (last, other))
+    return problems
+
+
+def race_register(prefix, n_threads):
+    """
+    One player registers from many sessions at once
+    return: the broken invariants of the sessions
+    """
+    pid = prefix + 'many'
+    sids = ['sid-%s-%d' % (pid, i) for i in range(n_threads)]
+    run_at_once([(call, ('register_player', sid, {'playerId': pid})) for sid in sids])
+    player = Handlers.online_players.get(pid)
+    problems = []
+    if player is None or player.sid not in sids:
+        problems.append('%s lost its session' % pid)
+    for sid in sids:
+        if Handlers.sid_to_pid.get(sid) != pid:
+            problems.append('%s lost the session %s' % (pid, sid))
+    return problems
+
+
+def use_recording_transport():
+    """
+    Run the handlers of this process on a RecordingTransport, with a leaderboard in a temporary file
+    return: the transport
+    """
+    if not isinstance(Handlers.transport, RecordingTransport):
+        Handlers.set_transport(RecordingTransport())
+        Handlers.open_leaderboard(os.path.join(tempfile.mkdtemp(), 'leaderboard.db'))
+    return Handlers.transport
+
+
+def run_rounds(n_rounds, n_threads):
+    """
+    return: the number of double-booked inviters and the broken invariants, the handler errors are in errors
+    """
+    use_recording_transport()
+    # switch between the threads as often as possible
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    problems = []
+    double_booked = 0
+    try:
+        for i in range(n_rounds):
+            prefix = 'r%d-' % i
+            if race_invites(prefix, n_threads) > 1:
+                double_booked += 1
+            race_fill_and_leave(prefix)
+            problems.extend(race_reinvite(prefix))
+            problems.extend(race_register(prefix, n_threads))
+            problems.extend(check_state())
+    finally:
+        sys.setswitchinterval(switch_interval)
+    return double_booked, problems
+
+
+def test_races():
+    del errors[:]
+    double_booked, problems = run_rounds(10, 8)
+    assert double_booked == 0
+    assert problems == []
+    assert errors == []
+
+
+def test_races_sqlite():
+    # the store is chosen when app.Config is imported, the SQLite store runs in a process of its own
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '5', '8', '--sqlite'], capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    n_rounds = int(args[0]) if len(args) > 0 else 200
+    n_threads = int(args[1]) if len(args) > 1 else 16
+    if '--unlocked' in sys.argv:
+        Handlers.store.lock = lambda *keys: nullcontext()
+
+    start = time.perf_counter()
+    double_booked, problems = run_rounds(n_rounds, n_threads)
+    elapsed = time.perf_counter() - start
+
+    print('%d rounds of %d threads in %.1fs' % (n_rounds, n_threads, elapsed))
+    print('Double-booked inviters: %d' % double_booked)
+    print('Broken invariants:      %d' % len(problems))
+    print('Handler errors:         %d' % len(errors))
+    for problem in problems[:5]:
+        print('  ' + problem)
+    for error in errors[:3]:
+        print(error)
+    if double_booked or problems or errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+This code checks the state kept by app.Store. A game in the middle of a turn, between two
+players or against a bot, comes back from encode_game / decode_game the same and goes on with
+the same dice and scores, and a player comes back with its flags. SQLite stores on one
+database, like two workers, race claim_players and end_game in their BEGIN IMMEDIATE
+transactions: only one of them gets the players and only one ends the game.
+
+Usage (from src/server):
+    python test/store_test.py
+or with pytest:
+    python -m pytest test/store_test.py
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Bot import BOT_LEVELS
+from app.Codec import CODECS
+from app.Game import Game
+from app.Player import Player
+from app.Scoring import CATEGORIES
+from app.Store import SQLiteStore, decode_game, decode_player, encode_game, encode_player
+
+
+GAME_FIELDS = (
+    'game_id', 'bot_level', 'scores', 'filled', 'upper_sec_total', 'bonus', 'total', 'dice', 'dice_id',
+    'round', 'active_player', 'i_roll', 'version', 'seed'
+)
+
+
+def assert_same_game(decoded, game):
+    for name in GAME_FIELDS:
+        assert getattr(decoded, name) == getattr(game, name), name
+    assert decoded.dice_stream.get_position() == game.dice_stream.get_position()
+    for decoded_player, player in ((decoded.p1, game.p1), (decoded.p2, game.p2)):
+        assert (decoded_player.pid, decoded_player.username, decoded_player.is_bot) == \
+            (player.pid, player.username, player.is_bot)
+        assert decoded_player.game_id == game.game_id
+
+
+def play_move(game, rng):
+    """
+    Make the same random move in a game, with rng in the same state
+    return: whether the game goes on
+    """
+    if game.get_i_roll() == 0 or (game.get_i_roll() < 3 and rng.random() < 0.6):
+        game.roll([0, 1, 2, 3, 4] if game.get_i_roll() == 0 else [i for i in range(5) if rng.random() < 0.5] or [0])
+        return True
+    player_idx = game.get_active_player()
+    return game.fill(rng.choice([key for key in CATEGORIES if game.get_key_score(player_idx, key) == -1]))
+
+
+def test_game_round_trip():
+    rng = random.Random(1)
+    for bot_level in (None,) + BOT_LEVELS:
+        player_2 = Player('player-2', username='Opponent') if bot_level is None else \
+            Player('bot', username='YahtzeeBot', is_bot=True)
+        game = Game(Player('player-1', username='Player'), player_2, seed=rng.getrandbits(64), bot_level=bot_level)
+        game.p1.game_id = game.p2.game_id = game.game_id
+        going_on = True
+        while going_on:
+            decoded = decode_game(encode_game(game))
+            assert_same_game(decoded, game)
+            # both go on the same
+            state = rng.getstate()
+            going_on = play_move(game, rng)
+            rng.setstate(state)
+            assert play_move(decoded, rng) == going_on
+            assert_same_game(decoded, game)
+        assert decoded.get_winner() == game.get_winner()
+
+
+def test_player_round_trip():
+    for codec in CODECS:
+        for is_bot in (False, True):
+            player = Player('pid', sid='sid', ip='127.0.0.1', username='Ünïcode name', is_bot=is_bot, rating=1723)
+            player.game_id = 'game'
+            player.codec = codec
+            decoded = decode_player(encode_player(player))
+            for name in Player.__slots__:
+                assert getattr(decoded, name) == getattr(player, name), name
+    player = Player('pid', username='Player')
+    decoded = decode_player(encode_player(player))
+    assert (decoded.sid, decoded.ip, decoded.game_id) == (None, None, '-1')
+
+
+def race(stores, operation):
+    """
+    Run the operation on every store at once, each in its transaction
+    return: the results in the order of the stores
+    """
+    barrier = threading.Barrier(len(stores))
+    results = [None] * len(stores)
+
+    def run(i):
+        barrier.wait()
+        with stores[i].transaction():
+            results[i] = operation(stores[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_sqlite_workers_race(n_rounds=20, n_workers=4):
+    directory = tempfile.mkdtemp(prefix='store-')
+    try:
+        path = os.path.join(directory, 'state.db')
+        stores = [SQLiteStore(path) for _ in range(n_workers)]
+        for i in range(n_rounds):
+            a, b = 'a-%d' % i, 'b-%d' % i
+            with stores[0].transaction():
+                for pid in (a, b):
+                    stores[0].lobby.add(pid, {'pid': pid, 'username': pid})
+                    stores[0].match_queue.join(pid, 1500, 0)
+            assert sorted(race(stores, lambda store: store.claim_players(a, b))) == [False] * (n_workers - 1) + [True]
+            for store in stores:
+                assert a not in store.lobby and b not in store.lobby
+                assert a not in store.match_queue and b not in store.match_queue
+
+            game = Game(Player(a), Player(b))
+            with stores[0].transaction():
+                stores[0].save_game(game)
+                stores[0].spectators[game.game_id] = 2
+            assert sorted(race(stores, lambda store: store.end_game(game.game_id))) == [False] * (n_workers - 1) + [True]
+            for store in stores:
+                assert game.game_id not in store.ongoing_games
+                assert game.game_id not in store.spectators
+        for store in stores:
+            store.conn.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    test_game_round_trip()
+    test_player_round_trip()
+    test_sqlite_workers_race()
+    print('The store keeps the games and players as they were, and the SQLite workers do not race.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+This code measures the timer wheel with many pending timeouts: scheduling, rescheduling,
+cancelling and the work of each tick, in simulated time.
+
+Usage (from src/server):
+    python test/timer_benchmark.py [n_timers]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Timers import TimerWheel
+
+
+def per_call(f, n):
+    start = time.perf_counter()
+    f()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    now = 1000000.0
+    wheel = TimerWheel()
+    wheel.current = int(now)
+    # grace periods of 30 seconds and idle games of 30 minutes
+    delays = [30 if random.random() < 0.5 else 1800 for _ in range(n)]
+
+    def schedule():
+        for i in range(n):
+            wheel.schedule(('suspended', i), delays[i], i, now=now)
+
+    def reschedule():
+        for i in range(n):
+            wheel.schedule(('suspended', i), delays[i], i, now=now + 1)
+
+    def cancel():
+        for i in range(0, n, 2):
+            wheel.cancel(('suspended', i))
+
+    print('%d pending timers' % n)
+    print('Schedule:   %6.2f us' % per_call(schedule, n))
+    print('Reschedule: %6.2f us' % per_call(reschedule, n))
+    print('Cancel:     %6.2f us' % per_call(cancel, n // 2))
+
+    n_ticks = 1900
+    expired = 0
+    start = time.perf_counter()
+    for t in range(1, n_ticks + 1):
+        expired += len(wheel.expire(now=now + t))
+    elapsed = time.perf_counter() - start
+    print('Tick:       %6.2f us for %d expired timers over %d ticks' % (elapsed / n_ticks * 1e6, expired, n_ticks))
+    assert expired == n - n // 2 and len(wheel) == 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+This code checks the timer wheel of app.Timers and the grace period of a suspended player:
+timers expire in the order they are due, also further than one turn of the ring, a cancelled
+timer never expires and a timer scheduled again is due at its new time only. A player who
+loses the connection during a game keeps it while coming back within the grace period, and
+loses it after; a suspended player is not put in the lobby when the game ends.
+
+Usage (from src/server):
+    python test/timers_test.py
+or with pytest:
+    python -m pytest test/timers_test.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from state_stress_test import Handlers, call, errors, play_until_last_fill, register, use_recording_transport
+from app import Config
+from app.Scoring import CATEGORIES
+from app.Timers import TimerWheel
+
+
+def new_wheel(now, n_slots=16):
+    wheel = TimerWheel(tick=1.0, n_slots=n_slots)
+    wheel.current = int(now)
+    return wheel
+
+
+def test_expiry_order():
+    now = 1000.0
+    wheel = new_wheel(now)
+    # further than one turn of the ring too
+    delays = {'a': 5, 'b': 1, 'c': 40, 'd': 5.5, 'e': 17}
+    for key, delay in delays.items():
+        wheel.schedule(key, delay, 'value-' + key, now=now)
+    assert len(wheel) == 5
+    expired = []
+    for t in range(1, 60):
+        due = wheel.expire(now=now + t)
+        # a timer is due on the first tick after its deadline, never before
+        assert all(delays[key] < t <= delays[key] + 1 for key, value in due)
+        expired.extend(due)
+    assert expired == [('b', 'value-b'), ('a', 'value-a'), ('d', 'value-d'), ('e', 'value-e'), ('c', 'value-c')]
+    assert len(wheel) == 0
+
+
+def test_late_expiry():
+    # the server was paused for several turns of the ring
+    now = 1000.0
+    wheel = new_wheel(now)
+    for i in range(40):
+        wheel.schedule(i, i, now=now)
+    assert sorted(key for key, value in wheel.expire(now=now + 100)) == list(range(40))
+    assert wheel.expire(now=now + 200) == []
+
+
+def test_cancel_and_rearm():
+    now = 1000.0
+    wheel = new_wheel(now)
+    wheel.schedule('cancelled', 3, now=now)
+    wheel.schedule('sooner', 10, 'old', now=now)
+    wheel.schedule('later', 3, 'old', now=now)
+    wheel.cancel('cancelled')
+    wheel.cancel('unknown')
+    assert 'cancelled' not in wheel
+    # scheduling a key again replaces its timer
+    wheel.schedule('sooner', 2, 'new', now=now)
+    wheel.schedule('later', 20, 'new', now=now)
+    assert len(wheel) == 2
+    assert wheel.expire(now=now + 5) == [('sooner', 'new')]
+    assert wheel.expire(now=now + 15) == []
+    assert wheel.expire(now=now + 25) == [('later', 'new')]
+    assert len(wheel) == 0
+
+
+class SimulatedWheel(TimerWheel):
+    """
+    A timer wheel on a clock of its own, moved on by the test
+    """
+    def __init__(self):
+        super().__init__()
+        self.now = time.time()
+
+    def schedule(self, key, delay, value=None, now=None):
+        super().schedule(key, delay, value, now=self.now if now is None else now)
+
+    def expire(self, now=None):
+        return super().expire(now=self.now if now is None else now)
+
+
+def run_timers(seconds):
+    """
+    Move the timers of the handlers on by some seconds and handle the suspended players that are due
+    return: the keys of the expired timers
+    """
+    Handlers.timers.now += seconds
+    expired = Handlers.timers.expire()
+    for (kind, key), value in expired:
+        if kind == 'suspended':
+            Handlers.expire_suspension(key, value)
+    return [key for key, value in expired]
+
+
+def start_game(a, b):
+    register(a)
+    register(b)
+    call('accept_invite', 'sid-' + b, {'inviter': a, 'invitee': b})
+    game_id = Handlers.online_players[a].game_id
+    assert game_id != '-1'
+    return game_id
+
+
+def received(sid):
+    return [event for event, data in Handlers.transport.received.get(sid, [])]
+
+
+def with_timers(test):
+    """
+    Run a test of the handlers on a simulated wheel of its own
+    """
+    def run():
+        use_recording_transport()
+        del errors[:]
+        timers = Handlers.timers
+        Handlers.timers = SimulatedWheel()
+        try:
+            test()
+        finally:
+            Handlers.timers = timers
+        assert errors == []
+    run.__name__ = test.__name__
+    return run
+
+
+@with_timers
+def test_resume_within_grace():
+    a, b = 'grace-resume-a', 'grace-resume-b'
+    game_id = start_game(a, b)
+    call('disconnect', 'sid-' + a)
+    assert ('suspended', a) in Handlers.timers
+    assert 'opponentSuspended' in received('sid-' + b)
+    assert run_timers(Config.RECONNECT_GRACE - 2) == []
+
+    call('register_player', 'sid-' + a + '-again', {'playerId': a})
+    assert ('suspended', a) not in Handlers.timers
+    assert 'opponentReconnected' in received('sid-' + b)
+    assert 'resumeGame' in received('sid-' + a + '-again')
+    assert run_timers(Config.RECONNECT_GRACE + 2) == []
+    assert game_id in Handlers.ongoing_games
+    assert Handlers.online_players[a].game_id == game_id
+    call('disconnect', 'sid-' + b)
+    call('disconnect', 'sid-' + a + '-again')
+    run_timers(Config.RECONNECT_GRACE + 2)
+    assert a not in Handlers.online_players and b not in Handlers.online_players
+
+
+@with_timers
+def test_expire_after_grace():
+    a, b = 'grace-expire-a', 'grace-expire-b'
+    game_id = start_game(a, b)
+    call('disconnect', 'sid-' + a)
+    assert run_timers(Config.RECONNECT_GRACE + 2) == [('suspended', a)]
+    assert game_id not in Handlers.ongoing_games
+    assert a not in Handlers.online_players
+    assert 'opponentDisconnect' in received('sid-' + b)
+    assert Handlers.online_players[b].game_id == '-1'
+    assert b in Handlers.lobby.players
+    call('disconnect', 'sid-' + b)
+
+
+@with_timers
+def test_suspended_player_not_in_lobby_at_game_end():
+    a, b = 'grace-end-a', 'grace-end-b'
+    game_id = start_game(a, b)
+    last = play_until_last_fill(game_id)
+    other = a if last == b else b
+    call('disconnect', 'sid-' + other)
+    call('fill', 'sid-' + last, {'game_id': game_id, 'player_id': last, 'key': CATEGORIES[-1]})
+    assert game_id not in Handlers.ongoing_games
+    assert last in Handlers.lobby.players
+    assert other not in Handlers.lobby.players
+    assert Handlers.online_players[other].game_id == '-1'
+
+    # back in the lobby when registering again within the grace period
+    call('register_player', 'sid-' + other + '-again', {'playerId': other})
+    assert other in Handlers.lobby.players
+    # the timer of the lost session expires, the player has a new one and stays
+    assert run_timers(Config.RECONNECT_GRACE + 2) == [('suspended', other)]
+    assert other in Handlers.online_players
+    assert other in Handlers.lobby.players
+    call('disconnect', 'sid-' + last)
+    call('disconnect', 'sid-' + other + '-again')
+
+
+def main():
+    test_expiry_order()
+    test_late_expiry()
+    test_cancel_and_rearm()
+    test_resume_within_grace()
+    test_expire_after_grace()
+    test_suspended_player_not_in_lobby_at_game_end()
+    print('The timers expire in order, and a suspended player keeps the game only within the grace period.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+This code checks the parts of app.Tournament that do not play: the pairs of a swiss round,
+the statistics added from the packed results of the games and the confidence intervals,
+then plays a small tournament on a pool of two processes.
+
+Usage (from src/server):
+    python test/tournament_test.py
+or with pytest:
+    python -m pytest test/tournament_test.py
+"""
+
+import os
+import struct
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Scoring import CATEGORY_INDEX, N_CATEGORIES
+from app.Tournament import RESULT_FORMAT, TournamentStats, get_swiss_pairs, run_tournament, wilson_interval
+
+
+def test_swiss_pairs():
+    # the closest standings meet
+    assert get_swiss_pairs([3, 1, 0, 2], set(), set()) == ([(1, 3), (0, 2)], None)
+    # unless they have met already
+    assert get_swiss_pairs([3, 1, 0, 2], {(1, 3)}, set()) == ([(0, 3), (1, 2)], None)
+    # when everyone has met, the closest standings meet again
+    assert get_swiss_pairs([0, 1], {(0, 1)}, set()) == ([(0, 1)], None)
+    # the last entrant without a bye yet sits out
+    assert get_swiss_pairs([0, 1, 2], set(), set()) == ([(0, 1)], 2)
+    assert get_swiss_pairs([0, 1, 2], {(0, 1)}, {2}) == ([(0, 2)], 1)
+    assert get_swiss_pairs([0, 1, 2], set(), {0, 1, 2}) == ([(0, 1)], 2)
+
+
+def pack_result(p1, p2, scores_1, scores_2):
+    """
+    A packed result, the scorings not given are 0
+    """
+    sheets = []
+    for scores in (scores_1, scores_2):
+        sheet = [0] * N_CATEGORIES
+        for key, score in scores.items():
+            sheet[CATEGORY_INDEX[key]] = score
+        sheets.extend(sheet)
+    return struct.pack(RESULT_FORMAT, p1, p2, *sheets)
+
+
+def test_add_results():
+    stats = TournamentStats(['a', 'b', 'c'])
+    bonus = {'4s': 16, '5s': 20, '6s': 24, '3s': 3}
+    stats.add_results(b''.join([
+        # a: 63 in the upper section with the bonus of 35, b: a yahtzee
+        pack_result(0, 1, bonus, {'yahtzee': 50}),
+        # the same seed in the other seat, a tie
+        pack_result(1, 0, {'chance': 20}, {'chance': 20}),
+        pack_result(2, 0, {'chance': 30}, {}),
+    ]))
+    assert stats.games == [3, 2, 1]
+    assert stats.points == [1.5, 0.5, 1.0]
+    assert stats.pair_games[0][1] == stats.pair_games[1][0] == 2
+    assert stats.pair_points[0][1] == 1.5 and stats.pair_points[1][0] == 0.5
+    assert stats.get_match_points(2, 0) == 1.0 and stats.get_match_points(0, 2) == 0.0
+    assert stats.histograms[0][98] == stats.histograms[0][20] == stats.histograms[0][0] == 1
+    assert stats.histograms[1][50] == stats.histograms[1][20] == 1
+    assert stats.hits[1][CATEGORY_INDEX['yahtzee']] == 1 and stats.hits[0][CATEGORY_INDEX['yahtzee']] == 0
+    assert stats.category_totals[0][CATEGORY_INDEX['chance']] == 20
+    mean, half, std, p10, p50, p90 = stats.get_score_summary(1)
+    assert (mean, std, p10, p50, p90) == (35, 15, 20, 20, 50)
+
+
+def test_wilson_interval():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = wilson_interval(50, 100)
+    assert abs(low - 0.4038) < 1e-3 and abs(high - 0.5962) < 1e-3
+    # the interval narrows with more games
+    more_low, more_high = wilson_interval(500, 1000)
+    assert low < more_low < 0.5 < more_high < high
+    low, high = wilson_interval(0, 10)
+    assert low == 0.0 and 0 < high < 0.35
+    low, high = wilson_interval(10, 10)
+    assert 0.65 < low < 1 and high == 1.0
+
+
+def test_small_tournament():
+    stats, standings = run_tournament(['random', 'greedy'], 10, n_workers=2, seed=1)
+    assert stats.games == [10, 10]
+    assert sum(stats.points) == 10
+    assert sorted(i for points, i in standings) == [0, 1]
+    # the greedy bot beats random moves
+    assert standings[0] == (1.0, 1)
+
+
+def main():
+    test_swiss_pairs()
+    test_add_results()
+    test_wilson_interval()
+    test_small_tournament()
+    print('The swiss pairs, the statistics and a small tournament are right.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import './Game.css';
 
@@ -17,6 +17,7 @@ function GamePage(props) {
 
   // post-game logic: show result / play again
   const [opponentConnected, setOpponentConnected] = useState(true);
+  const [opponentSuspended, setOpponentSuspended] = useState(false);
   const [gameIsOver, setGameIsOver] = useState(false);
   const [gameResult, setGameResult] = useState('ongoing');
 
@@ -25,9 +26,21 @@ function GamePage(props) {
 
   useEffect(() => {
     props.socket.on('gameOver', (message) => {
-      // message : {'status' : 'tie'/'win'/'lost'}
+      // message : {'winner' : pid, null for a tie}
       setGameIsOver(true);
-      setGameResult(message['status']);
+      if (message['winner'] === null) {
+        setGameResult('tie');
+      } else if (message['winner'] === sessionStorage.getItem('playerId')) {
+        setGameResult('win');
+      } else {
+        setGameResult('lose');
+      }
+    });
+
+    // the game against another player changed the rating
+    props.socket.on('ratingUpdate', (message) => {
+      // message: {'rating': int, 'change': int}
+      console.log('New rating: ' + message['rating'] + ' (' + (message['change'] >= 0 ? '+' : '') + message['change'] + ')');
     });
 
     // navigate back to the lobby is the opponent disconnect
@@ -37,12 +50,33 @@ function GamePage(props) {
       console.log('Opponent pid: ' + oppoId);
       setGameIsOver(true);
       setOpponentConnected(false);
+      setOpponentSuspended(false);
       setGameResult('The internet connection of the other player has been lost.')
     });
 
+    // the opponent has lost the connection, the server keeps the game for a while
+    props.socket.on('opponentSuspended', (message) => {
+      // message: {'pid': pid, 'grace': seconds}
+      setOpponentSuspended(true);
+    });
+
+    props.socket.on('opponentReconnected', (oppoId) => {
+      setOpponentSuspended(false);
+    });
+
+    // nobody has played for too long, the server has ended the game
+    props.socket.on('gameExpired', (gameId) => {
+      setGameIsOver(true);
+      setGameResult('The game has ended after a long time without any move.')
+    });
+
     return () => {
       props.socket.off('gameOver');
+      props.socket.off('ratingUpdate');
       props.socket.off('opponentDisconnect');
+      props.socket.off('opponentSuspended');
+      props.socket.off('opponentReconnected');
+      props.socket.off('gameExpired');
     }
   }, []);
 
@@ -103,6 +137,7 @@ function GamePage(props) {
   return (
     <div>
       <Game key={gameid} gameId={gameid} selfName={props.selfName} oppoName={oppoName} socket={props.socket}/>
+      {opponentSuspended && <div>Waiting for {oppoName} to reconnect...</div>}
       {
         gameIsOver && (
           <div>
@@ -154,89 +189,6 @@ function Game(props) {
     }
   };
 
-  const calculator = () => {
-    // calculate all the scores using 5 dice
-    let diceCount = {
-      '1': 0,
-      '2': 0,
-      '3': 0,
-      '4': 0,
-      '5': 0,
-      '6': 0
-    };
-    for (let i = 0; i < dice.length; i++) {
-      diceCount[dice[i].toString()] += 1;
-    }
-    let diceSum = dice.reduce((acc, val) => {
-      return acc + val;
-    }, 0);
-
-    let scoreUpperSec = {
-      '1s': 0,
-      '2s': 0,
-      '3s': 0,
-      '4s': 0,
-      '5s': 0,
-      '6s': 0
-    };
-    for (let num = 1; num < 7; num++) {
-      scoreUpperSec[num.toString() + "s"] = num * diceCount[num.toString()];
-    }
-
-    let scoreLowerSec = {
-      '3-of-a-kind': 0,
-      '4-of-a-kind': 0,
-      'full-house': 0,
-      'small-straight': 0,
-      'large-straight': 0,
-      'yahtzee': 0,
-      'chance': 0
-    };
-
-    // 3-of-a-kind, 4-of-a-kind, full-house, yahtzee
-    for (let k in diceCount) {
-      if (diceCount[k] === 3) {
-        scoreLowerSec['3-of-a-kind'] = diceSum;
-        for (let kPair in diceCount) {
-          if (diceCount[kPair] === 2) {
-            scoreLowerSec['full-house'] = 25;
-          }
-        }
-      }
-      else if (diceCount[k] === 4) {
-        scoreLowerSec['3-of-a-kind'] = diceSum;
-        scoreLowerSec['4-of-a-kind'] = diceSum;
-      }
-      else if (diceCount[k] === 5) {
-        scoreLowerSec['3-of-a-kind'] = diceSum;
-        scoreLowerSec['4-of-a-kind'] = diceSum;
-        scoreLowerSec['yahtzee'] = 50;
-      }
-    }
-
-    // small straight, large straight
-    if ((diceCount['1'] >= 1) && (diceCount['2'] >= 1) && (diceCount['3'] >= 1) && (diceCount['4'] >= 1)) {
-      scoreLowerSec['small-straight'] = 30;
-    }
-    if ((diceCount['2'] >= 1) && (diceCount['3'] >= 1) && (diceCount['4'] >= 1) && (diceCount['5'] >= 1)) {
-      scoreLowerSec['small-straight'] = 30;
-    }
-    if ((diceCount['3'] >= 1) && (diceCount['4'] >= 1) && (diceCount['5'] >= 1) && (diceCount['6'] >= 1)) {
-      scoreLowerSec['small-straight'] = 30;
-    }
-    if ((diceCount['1'] >= 1) && (diceCount['2'] >= 1) && (diceCount['3'] >= 1) && (diceCount['4'] >= 1) && (diceCount['5'] >= 1)) {
-      scoreLowerSec['large-straight'] = 40;
-    }
-    if ((diceCount['2'] >= 1) && (diceCount['3'] >= 1) && (diceCount['4'] >= 1) && (diceCount['5'] >= 1) && (diceCount['6'] >= 1)) {
-      scoreLowerSec['large-straight'] = 40;
-    }
-
-    // chance
-    scoreLowerSec['chance'] = diceSum;
-
-    return { ...scoreUpperSec, ...scoreLowerSec };
-  }
-
   const [scoreSelf, setScoreSelf] = useState({
     '1s': -1,
     '2s': -1,
@@ -376,20 +328,46 @@ function Game(props) {
   }, [])
 
 
-  // calculator to help decision
+  // scores of the open scorings of the active player for the current dice, sent by the server with every roll
   const [calculatorHelper, setCalculatorHelper] = useState({});
+
+  const styleOfCalculator = {
+    'color': 'lightgray'
+  }
+
+
+  // hints from the server: the best dice to keep for each open scoring
+  const [advice, setAdvice] = useState({});
   useEffect(() => {
-    if (iRoll !== 0) {
-      setCalculatorHelper(calculator());
-    } else {
-      setCalculatorHelper({});
+    props.socket.on('advice', (message) => {
+      // message: {'version': int, 'holds': [{'index': [int, ], 'scores': {key: expected score}}, ]}
+      // index is the list of dice to roll for this hold, as sent with the roll event
+      let best = {};
+      for (let hold of message['holds']) {
+        for (let key in hold['scores']) {
+          if (!(key in best) || hold['scores'][key] > best[key]['score']) {
+            best[key] = {'index': hold['index'], 'score': hold['scores'][key]};
+          }
+        }
+      }
+      setAdvice(best);
+    });
+    return () => {
+      props.socket.off('advice');
     }
+  }, []);
+
+  useEffect(() => {
+    setAdvice({});
   }, [iRoll]);
 
-  const styleOfCalculator = {
-    'color': 'lightgray'
+  const getAdvice = () => {
+    props.socket.emit('get_advice', {'game_id': props.gameId});
   }
 
+  const followAdvice = (key) => {
+    setDiceToRoll([0, 1, 2, 3, 4].map(i => advice[key]['index'].includes(i)));
+  }
 
   const [showAvailableKeys, setShowAvailableKeys] = useState(false);
   const fill = (key) => {
@@ -407,36 +385,81 @@ function Game(props) {
     updateBonusOppo();
   }, [scoreOppo])
 
+  // version of the game state from the server, -1 before the first snapshot
+  const version = useRef(-1);
+
   useEffect(() => {
     props.socket.emit('game_initialize', {'game_id': props.gameId, 'player_id': sessionStorage.getItem('playerId')});
     props.socket.on('gameUpdate', (update) => {
-      // Update for initialization, resume game states, or after a fill
+      // Full snapshot for initialization, resume game states, or after a missed update
       // {
+      //   'version': int,
+      //   'dice': [int, ],
       //   'i_roll': int,
       //   'round': int,
       //   'active_player': pid,
       //   'score_active': {'key': val},
-      //   'score_inactive': {'key': val}
+      //   'score_inactive': {'key': val},
+      //   'preview': {'key': val}
       // }
-      //  Update after a roll:
+      //  Update after a roll, with the scores of the open scorings of the active player:
       // { 
+      //   'version': int,
       //   'dice': [int, ],
-      //   'i_roll': int
+      //   'i_roll': int,
+      //   'preview': {'key': val}
       // }
-      if ('active_player' in update) {
-        if (update['active_player'] === sessionStorage.getItem('playerId')) {
-          setIsActive(true);
+      //  Update after a fill, only the changed scoring:
+      // {
+      //   'version': int,
+      //   'player': pid, 'key': str, 'value': int,
+      //   'upper_sec_total': int, 'bonus': int, 'total': int,
+      //   'i_roll': int,
+      //   'round': int,
+      //   'active_player': pid
+      // }
+      //  Several updates merged by the server carry the version they apply to in 'base'
+      const selfPid = sessionStorage.getItem('playerId');
+      if ('score_active' in update) {
+        version.current = update['version'];
+        if (update['active_player'] === selfPid) {
           setScoreSelf(update['score_active']);
           setScoreOppo(update['score_inactive']);
         }
         else {
-          setIsActive(false);
           setScoreSelf(update['score_inactive']);
           setScoreOppo(update['score_active']);
         }
       }
+      else if (update['version'] <= version.current) {
+        // outdated by the snapshot
+        return;
+      }
+      else if (('base' in update ? update['base'] : update['version'] - 1) !== version.current) {
+        // an update has been missed, ask for a full snapshot
+        if (version.current !== -1) {
+          props.socket.emit('game_initialize', {'game_id': props.gameId, 'player_id': selfPid});
+        }
+        return;
+      }
+      else {
+        version.current = update['version'];
+      }
+      if ('key' in update) {
+        if (update['player'] === selfPid) {
+          setScoreSelf(score => ({...score, [update['key']]: update['value']}));
+        }
+        else {
+          setScoreOppo(score => ({...score, [update['key']]: update['value']}));
+        }
+      }
+      if ('active_player' in update) {
+        setIsActive(update['active_player'] === selfPid);
+      }
       if ('i_roll' in update) {
         setIRoll(update['i_roll']);
+        // no preview after a fill or before the first roll
+        setCalculatorHelper(update['preview'] || {});
       }
       if ('round' in update) {
         setRound(update['round']);
@@ -710,6 +733,16 @@ function Game(props) {
       </table>
       <button disabled={!isActive || (iRoll > 2)} onClick={roll}>Roll</button>
       <button disabled={!isActive || (iRoll === 0)} onClick={() => setShowAvailableKeys(true)}>Select scoring to Fill</button>
+      <button disabled={!isActive || (iRoll === 0) || (iRoll > 2)} onClick={getAdvice}>Hint</button>
+      {(Object.keys(advice).length > 0) && (
+        <div className="advice">
+          {Object.keys(advice).map(key => (
+            <div key={key} onClick={() => followAdvice(key)}>
+              {key}: keep {[0, 1, 2, 3, 4].filter(i => !advice[key]['index'].includes(i)).map(i => dice[i]).join(' ') || 'nothing'}, expected {advice[key]['score']}
+            </div>
+          ))}
+        </div>
+      )}
       {showAvailableKeys && (
         <div className="available-keys">
           {(scoreSelf['1s'] === -1) && <button onClick={() => fill('1s')}>Ones</button>}
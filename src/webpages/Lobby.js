@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 
 function ActivePlayersList(props) {
@@ -22,17 +22,100 @@ function ActivePlayersList(props) {
         </ul>)
 }
 
+function RatingsList(props) {
+  // props.leaderboard: [{pid: xxx, username: xxx, rating: int, rank: int, games: int, wins: int}, ]
+  // props.rank: {pid: xxx, rating: int, rank: int or null, total: int}
+  return (
+    <div>
+      <h3>Leaderboard</h3>
+      {(props.rank !== null) && (
+        <div>
+          Your rating: {props.rank.rating}
+          {(props.rank.rank !== null) && (<span>, rank {props.rank.rank} of {props.rank.total}</span>)}
+        </div>
+      )}
+      <ol>
+        {props.leaderboard.map(
+          player => (
+            <li key={player.pid}>
+              #{player.rank} {player.username}: {player.rating} ({player.wins}/{player.games} won)
+            </li>
+          )
+        )}
+      </ol>
+    </div>
+  );
+}
+
+// number of available players in one page of the lobby snapshot
+const LOBBY_PAGE_SIZE = 100;
+// number of players shown in the leaderboard
+const LEADERBOARD_SIZE = 10;
+
 function Lobby(props) {
     const [availablePlayers, setAvailablePlayers] = useState({});
     const [invitationReceived, setInvitationReceived] = useState([]);
+    // whether the player waits in the matchmaking queue
+    const [inQueue, setInQueue] = useState(false);
+    const [botLevel, setBotLevel] = useState('optimal');
+    const [leaderboard, setLeaderboard] = useState([]);
+    const [rank, setRank] = useState(null);
     const navigate = useNavigate();
 
+    // presence version of the lobby snapshot, older changes are already in the snapshot
+    const lobbyVersion = useRef(-1);
+
     useEffect(
       () => {
-        props.socket.on('getPlayersOnlineResponse', playersList => {
-          setAvailablePlayers(playersList);
+        props.socket.on('lobbySnapshot', page => {
+          // page: {version: int, players: [{pid: xxx, username: xxx}, ], next_cursor: pid or null}
+          if (lobbyVersion.current === -1 || page['version'] < lobbyVersion.current) {
+            lobbyVersion.current = page['version'];
+          }
+          setAvailablePlayers(players => {
+            let newPlayers = {...players};
+            for (let player of page['players']) {
+              newPlayers[player.pid] = player;
+            }
+            return newPlayers;
+          });
+          if (page['next_cursor'] !== null) {
+            props.socket.emit('get_lobby_page', {'cursor': page['next_cursor'], 'limit': LOBBY_PAGE_SIZE});
+          }
+        });
+
+        props.socket.on('lobbyUpdate', changes => {
+          // changes: {version: int, joined: [{pid: xxx, username: xxx}, ], left: [pid, ], busy: [pid, ]}
+          if (changes['version'] <= lobbyVersion.current) {
+            return;
+          }
+          setAvailablePlayers(players => {
+            let newPlayers = {...players};
+            for (let player of changes['joined']) {
+              newPlayers[player.pid] = player;
+            }
+            for (let pid of changes['left'].concat(changes['busy'])) {
+              delete newPlayers[pid];
+            }
+            return newPlayers;
+          });
+        });
+
+        props.socket.emit('subscribe_lobby', {'limit': LOBBY_PAGE_SIZE});
+
+        props.socket.on('leaderboard', (message) => {
+          // message: {players: [{pid: xxx, username: xxx, rating: int, rank: int, games: int, wins: int}, ], total: int}
+          setLeaderboard(message['players']);
+        });
+
+        props.socket.on('rank', (message) => {
+          // message: {pid: xxx, rating: int, rank: int or null, total: int}
+          setRank(message);
         });
 
+        props.socket.emit('get_leaderboard', {'limit': LEADERBOARD_SIZE});
+        props.socket.emit('get_rank');
+
         props.socket.on('receiveInvitation', inviter => {
           // inviter: {pid: xxx, username: xxx}
           setInvitationReceived([...invitationReceived, inviter]);
@@ -47,9 +130,21 @@ function Lobby(props) {
         props.socket.on('playerNoLongerAvailable', invitee => {
           // invitee: pid 
           // invitee is no longer available
-          // refresh the available player lists
           console.log('The player ' + invitee + ' is no longer available');
-          getAllPlayers();
+        });
+
+        props.socket.on('botUnavailable', () => {
+          console.log('This level of the bot is not available on this server.');
+        });
+
+        props.socket.on('queueJoined', (message) => {
+          // message: {rating: int}
+          setInQueue(true);
+          console.log('Looking for an opponent, rating: ' + message['rating']);
+        });
+
+        props.socket.on('queueLeft', () => {
+          setInQueue(false);
         });
 
         props.socket.on('enterNewGame', (gameInfo) => {
@@ -75,18 +170,34 @@ function Lobby(props) {
         });
 
         return () => {
-          props.socket.off('getPlayersOnlineResponse');
+          props.socket.emit('unsubscribe_lobby');
+          props.socket.off('lobbySnapshot');
+          props.socket.off('lobbyUpdate');
+          props.socket.off('leaderboard');
+          props.socket.off('rank');
           props.socket.off('receiveInvitation');
           props.socket.off('invitationDeclined');
           props.socket.off('playerNoLongerAvailable');
+          props.socket.off('botUnavailable');
+          props.socket.off('queueJoined');
+          props.socket.off('queueLeft');
           props.socket.off('enterNewGame');
           props.socket.off('resumeGame');
         }
       }, []
     );
 
-    const getAllPlayers = () => {
-      props.socket.emit('get_players_online');
+    const playWithBot = () => {
+      // level: 'greedy', 'montecarlo' or 'optimal'
+      props.socket.emit('play_bot', {'level': botLevel});
+    }
+
+    const joinQueue = () => {
+      props.socket.emit('join_queue');
+    }
+
+    const leaveQueue = () => {
+      props.socket.emit('leave_queue');
     }
 
     const acceptInvitation = () => {
@@ -102,7 +213,20 @@ function Lobby(props) {
     return (
       <div className="App">
         <h1>Welcome to WebYahtzee, {props.selfName}!</h1>
-        <button onClick={getAllPlayers}>Get All Players</button>
+        <select value={botLevel} onChange={(e) => setBotLevel(e.target.value)}>
+          <option value="greedy">Easy</option>
+          <option value="montecarlo">Medium</option>
+          <option value="optimal">Hard</option>
+        </select>
+        <button onClick={playWithBot}>Play with the bot</button>
+        {inQueue ? (
+          <span>
+            Looking for an opponent...
+            <button onClick={leaveQueue}>cancel</button>
+          </span>
+        ) : (
+          <button onClick={joinQueue}>Play now</button>
+        )}
         {(invitationReceived.length > 0) && (
           <div>
             You are invited by {invitationReceived[0].username} to join a new game!
@@ -111,6 +235,7 @@ function Lobby(props) {
           </div>
         )}
         <ActivePlayersList activePlayers={availablePlayers} socket={props.socket}/>
+        <RatingsList leaderboard={leaderboard} rank={rank}/>
       </div>
     );
   }